@@ -0,0 +1,549 @@
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+import pandas as pd
+from price_catalog import PriceCatalog
+from recipe_repository import RecipeRepository
+
+
+# Benchmarks for the costing pipeline, run with: python benchmarks.py [name ...]
+# Each benchmark builds a synthetic price list and recipe book in a temporary directory,
+# so the real price_list.csv and recipes.json are never touched
+
+
+SHOPS = ['aldi', 'yasar halim', 'waitrose', 'yildiz']
+UNITS = ['kg', 'whole', 'bunch', 'can', 'l', 'pack']
+
+
+def make_synthetic_data(directory, recipe_count, ingredient_count=500, ingredients_per_recipe=8, seed=0):
+    # This function writes a synthetic price_list.csv and recipes.json and returns a catalog and repository for them
+
+    rng = random.Random(seed)
+    ingredients = [f"ingredient {i}" for i in range(ingredient_count)]
+    price_list = pd.DataFrame({
+        'ingredient': ingredients,
+        'price': [round(rng.uniform(0.1, 20), 2) for _ in ingredients],
+        'unit': [rng.choice(UNITS) for _ in ingredients],
+        'shop': [rng.choice(SHOPS) for _ in ingredients],
+        'last_update': '01/01',
+    })
+    price_list_path = os.path.join(directory, 'price_list.csv')
+    price_list.to_csv(price_list_path, index=False)
+
+    recipes = {}
+    for i in range(recipe_count):
+        recipes[f"recipe {i}"] = {
+            'ingredients': {ingredient: round(rng.uniform(0.05, 5), 2)
+                            for ingredient in rng.sample(ingredients, ingredients_per_recipe)},
+            'portions': {'buffet': rng.choice([10, 15, 20, 30, 40, 50]), 'dinner': rng.choice([5, 10, 15])},
+        }
+    recipes_path = os.path.join(directory, 'recipes.json')
+    with open(recipes_path, "w") as json_file:
+        json.dump(recipes, json_file)
+
+    return PriceCatalog(price_list_path), RecipeRepository(recipes_path)
+
+
+def time_call(function, *args, repeat=3, **kwargs):
+    # This function returns the best wall-clock time of a few calls
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark_shopping_list(sizes=(1000, 2000, 4000, 8000)):
+    # This benchmark shows calculate_shopping_list scaling linearly with the number of recipes on the menu
+    from event_calculator import calculate_shopping_list
+
+    print(f"{'recipes':>8} {'rows':>8} {'seconds':>10} {'us/row':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        catalog, repository = make_synthetic_data(directory, max(sizes))
+        catalog.refresh()
+        repository.ingredient_table    ## parse and index once, outside the timings
+
+        for size in sizes:
+            recipes_list = repository.names()[:size]
+            recipe_count = pd.DataFrame({'Recipe': recipes_list, 'Multiple': 1.5})
+            rows = len(calculate_shopping_list(recipes_list, recipe_count, catalog=catalog, repository=repository))
+            seconds = time_call(calculate_shopping_list, recipes_list, recipe_count,
+                                catalog=catalog, repository=repository)
+            print(f"{size:>8} {rows:>8} {seconds:>10.4f} {seconds / rows * 1e6:>8.2f}")
+
+
+def benchmark_format_shopping_list(sizes=(1000, 4000, 8000)):
+    # This benchmark compares format_shopping_list with simply re-reading the price list and recipes from disk
+    from event_calculator import calculate_shopping_list, format_shopping_list
+
+    print(f"{'recipes':>8} {'rows':>8} {'format s':>10} {'io s':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        catalog, repository = make_synthetic_data(directory, max(sizes), ingredient_count=5000)
+        catalog.refresh()
+
+        io_seconds = time_call(lambda: (PriceCatalog(catalog.path).refresh(), RecipeRepository(repository.path).refresh()))
+        for size in sizes:
+            recipes_list = repository.names()[:size]
+            recipe_count = pd.DataFrame({'Recipe': recipes_list, 'Multiple': 1.5})
+            shopping_list = calculate_shopping_list(recipes_list, recipe_count, catalog=catalog, repository=repository)
+            seconds = time_call(format_shopping_list, shopping_list, recipes_list, catalog=catalog)
+            print(f"{size:>8} {len(shopping_list):>8} {seconds:>10.4f} {io_seconds:>10.4f}")
+
+
+def benchmark_parallel_quotes(event_count=400, worker_counts=(1, 2, 4)):
+    # This benchmark quotes the same batch of events serially and across process pools of different sizes
+    from event_calculator import quote_events
+
+    rng = random.Random(1)
+    print(f"{'workers':>8} {'seconds':>10} {'events/s':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        catalog, repository = make_synthetic_data(directory, 2000)
+        events = [{'name': f"event {i}", 'guest_count': rng.randint(20, 300), 'event_type': 'buffet',
+                   'recipes_list': rng.sample(repository.names(), 12), 'multipliers': {}}
+                  for i in range(event_count)]
+
+        serial_totals = None
+        for workers in worker_counts:
+            start = time.perf_counter()
+            quotes = quote_events(events, catalog=catalog, repository=repository, workers=workers)
+            seconds = time.perf_counter() - start
+            totals = [quote['total_cost'] for quote in quotes]
+            serial_totals = serial_totals or totals
+            assert totals == serial_totals, "parallel quotes differ from the serial ones"
+            print(f"{workers:>8} {seconds:>10.3f} {event_count / seconds:>10.1f}")
+
+
+def serve_stand_in_shop(products):
+    # This function starts a local http server standing in for the Yasar Halim website, so scrapers can be run offline
+    # products maps each ingredient to the (product name, price) its page shows, returns the server and its url
+    # server.unavailable can map an ingredient to how many more times its page answers 503, to stand in for a flaky shop
+
+    class StandInShop(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'   ## keep-alive, like the real site
+        wbufsize = -1                   ## send headers and body in one packet
+
+        def setup(self):
+            super().setup()
+            self.server.connections += 1
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            header = '<form><input id="small-searchterms" name="q"></form>'
+            if url.path == '/search':
+                query = parse_qs(url.query).get('q', [''])[0]
+                links = ''.join(f'<h2 class="product-title"><a href="/{i}">{ingredient.title()}</a></h2>'
+                                for i, ingredient in enumerate(products) if query in ingredient)
+                body = f'<html><body>{header}<div class="product-grid">{links}</div></body></html>'
+            elif url.path.strip('/').isdigit() and int(url.path.strip('/')) < len(products):
+                ingredient = list(products)[int(url.path.strip('/'))]
+                with self.server.lock:
+                    unavailable = self.server.unavailable.get(ingredient, 0)
+                    self.server.unavailable[ingredient] = max(unavailable - 1, 0)
+                if unavailable:
+                    self.send_error(503)
+                    return
+                name, price = products[ingredient]
+                body = (f'<html><body>{header}<h1 class="product-name">{name}</h1>'
+                        f'<span class="product-price">£{price:.2f}</span></body></html>')
+            else:
+                self.send_error(404)
+                return
+            data = body.encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInShop)
+    server.daemon_threads = True
+    server.connections = 0
+    server.unavailable = {}
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+def benchmark_http_scrape(ingredient_count=200):
+    # This benchmark scrapes a stand-in shop over plain http, with connections pooled and with a new one per page
+    # (without the page cache, so every page is fetched, and the stand-in pages stay out of page_cache/)
+    import urllib3
+    from fetchers import HttpFetcher
+    from update_prices_csv import YasarHalimPageSession
+
+    rng = random.Random(2)
+    products = {f"ingredient {i}": (f"Ingredient {i} {rng.choice([250, 500, 750])}G", rng.uniform(0.5, 9))
+                for i in range(ingredient_count)}
+    server, url = serve_stand_in_shop(products)
+
+    print(f"{'fetcher':>10} {'ms/ingredient':>14} {'connections':>12}")
+    try:
+        for name, pool in (('pooled', None), ('unpooled', urllib3.PoolManager(maxsize=1, headers={'Connection': 'close'}))):
+            server.connections = 0
+            with YasarHalimPageSession(url, cache=None, fetcher=HttpFetcher(pool=pool)) as session:
+                start = time.perf_counter()
+                records = [session.scrape(ingredient) for ingredient in products]
+                seconds = time.perf_counter() - start
+            assert all(record.unit == 'kg' for record in records)
+            print(f"{name:>10} {seconds / ingredient_count * 1e3:>14.2f} {server.connections:>12}")
+    finally:
+        server.shutdown()
+
+
+def benchmark_scheduler(ingredient_count=200, worker_counts=(1, 2, 4)):
+    # This benchmark runs the scrape scheduler over a stand-in shop, with one ingredient the shop doesn't sell and one
+    # whose page answers 503 until the scheduler retries it, and reports the throughput with more workers per shop
+    # (without the page cache, and with a sink that keeps the prices instead of writing them to price_list.csv)
+    import logging
+    from fetchers import HttpFetcher
+    from scraper_scheduler import ScrapeScheduler, ShopPolicy
+    from update_prices_csv import PriceUpdateSink, YasarHalimPageSession
+
+    class MemorySink(PriceUpdateSink):
+        def __init__(self):
+            super().__init__()
+            self.written = {}
+
+        def flush(self):
+            with self._lock:
+                batch, self.pending = self.pending, {}
+                self._last_flush = time.monotonic()
+            self.written.update(batch)
+            self.updated += len(batch)
+
+    rng = random.Random(4)
+    products = {f"ingredient {i}": (f"Ingredient {i} {rng.choice([250, 500, 750])}G", rng.uniform(0.5, 9))
+                for i in range(ingredient_count)}
+    flaky, missing = "ingredient 7", "not sold here"
+    server, url = serve_stand_in_shop(products)
+
+    def session():
+        return YasarHalimPageSession(url, cache=None, fetcher=HttpFetcher())
+
+    print(f"{'workers':>8} {'updated':>8} {'failed':>7} {'retries':>8} {'per minute':>11}")
+    logging.disable(logging.ERROR)     ## the missing ingredient's error stays out of error_logs.txt
+    try:
+        for workers in worker_counts:
+            server.unavailable = {flaky: 2}     ## one 503 for the fetcher's own retry, one for the scheduler's
+            sink = MemorySink()
+            policy = ShopPolicy(workers=workers, retries=2, backoff=0.05)
+            scheduler = ScrapeScheduler(sessions={'yasar halim': session}, sink=sink, default_policy=policy)
+            report = scheduler.run({'yasar halim': [missing, *products]})['yasar halim']
+            assert (report['updated'], report['failed'], report['retries']) == (ingredient_count, 1, 1), report
+            assert sink.updated == ingredient_count and flaky in sink.written and missing not in sink.written
+            print(f"{workers:>8} {report['updated']:>8} {report['failed']:>7} {report['retries']:>8} "
+                  f"{report['per_minute']:>11.0f}")
+    finally:
+        logging.disable(logging.NOTSET)
+        server.shutdown()
+
+
+def load_unit_corpus(path='unit_corpus.json'):
+    # This function reads the corpus of shop strings with the (price, unit) each should normalise to
+    with open(path, "r") as corpus_file:
+        return pd.DataFrame(json.load(corpus_file))
+
+
+def benchmark_normalise(copies=2000):
+    # This benchmark checks both normalisers against the corpus, then times them over many copies of it
+    from price_normaliser import (normalise_product_name, normalise_product_names, normalise_unit_price,
+                                  normalise_unit_prices)
+
+    def one_by_one(shop, texts, shelf_prices):
+        results = []
+        for text, shelf_price in zip(texts, shelf_prices):
+            try:
+                if shop == 'aldi':
+                    results.append(normalise_unit_price(text))
+                else:
+                    results.append(normalise_product_name(text, shelf_price, shop))
+            except ValueError:
+                results.append((float('nan'), None))
+        return pd.DataFrame(results, columns=['price', 'unit'])
+
+    def in_bulk(shop, texts, shelf_prices):
+        if shop == 'aldi':
+            return normalise_unit_prices(texts)
+        return normalise_product_names(texts, shelf_prices, shop)
+
+    corpus = load_unit_corpus()
+    print(f"{'shop':>12} {'strings':>8} {'one by one/s':>14} {'bulk/s':>12}")
+    for shop, strings in corpus.groupby('shop', sort=False):
+        texts = strings['text'].tolist()
+        shelf_prices = strings['shelf_price'].tolist() if 'shelf_price' in strings else [None] * len(texts)
+        expected = strings[['price', 'unit']].reset_index(drop=True).astype({'price': float})
+        for normalise in (one_by_one, in_bulk):
+            pd.testing.assert_frame_equal(normalise(shop, texts, shelf_prices).astype({'unit': object}),
+                                          expected.astype({'unit': object}), check_exact=True)
+
+        texts, shelf_prices = texts * copies, shelf_prices * copies
+        one_by_one_seconds = time_call(one_by_one, shop, texts, shelf_prices, repeat=1)
+        bulk_seconds = time_call(in_bulk, shop, texts, shelf_prices, repeat=1)
+        print(f"{shop:>12} {len(texts):>8} {len(texts) / one_by_one_seconds:>14.0f} {len(texts) / bulk_seconds:>12.0f}")
+
+
+def benchmark_pack_optimiser(recipe_counts=(100, 1000), skus_per_ingredient=3):
+    # This benchmark formats shopping lists with every ingredient bought as the cheapest mix of SKUs,
+    # against the plain unit-price rounding, and reports how much the packs save
+    from event_calculator import calculate_shopping_list, calculate_total_cost, format_shopping_list
+    from pack_optimiser import SkuCatalog
+
+    rng = random.Random(3)
+    print(f"{'recipes':>8} {'ingredients':>12} {'unit price s':>13} {'packs s':>9} {'unit price £':>13} {'packs £':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        catalog, repository = make_synthetic_data(directory, max(recipe_counts))
+        table = catalog.table
+        skus = pd.DataFrame([
+            {'ingredient': ingredient, 'sku': f"{ingredient} #{i}", 'pack_size': size,
+             'price': round(row['price'] * size * rng.uniform(0.7, 1.2), 2), 'shop': row['shop']}
+            for ingredient, row in table.iterrows()
+            for i, size in enumerate(rng.sample([0.25, 0.5, 1, 2, 5] if row['unit'] in ('kg', 'l') else [1, 4, 6, 12],
+                                                skus_per_ingredient))
+        ])
+        skus_path = os.path.join(directory, 'skus.csv')
+        skus.to_csv(skus_path, index=False)
+        sku_catalog, no_skus = SkuCatalog(skus_path), SkuCatalog(os.path.join(directory, 'none.csv'))
+
+        for size in recipe_counts:
+            recipes_list = repository.names()[:size]
+            recipe_count = pd.DataFrame({'Recipe': recipes_list, 'Multiple': 7.5})
+            shopping_list = calculate_shopping_list(recipes_list, recipe_count, catalog=catalog, repository=repository)
+            totals = []
+            for skus_used in (no_skus, sku_catalog):
+                skus_used._solutions = {}     ## time a cold solve
+                start = time.perf_counter()
+                formatted = format_shopping_list(shopping_list, recipes_list, catalog=catalog, skus=skus_used)
+                totals.append((time.perf_counter() - start, calculate_total_cost(formatted)))
+            print(f"{size:>8} {len(formatted):>12} {totals[0][0]:>13.3f} {totals[1][0]:>9.3f} "
+                  f"{totals[0][1]:>13.2f} {totals[1][1]:>10.2f}")
+
+
+def benchmark_shop_planner(ingredient_count=40, shop_counts=(4, 8, 12, 20), visit_cost=10.0):
+    # This benchmark plans which shops to buy a synthetic shopping list at, each shop selling about half of the
+    # ingredients, and compares the plan with buying everything at its cheapest shop
+    from shop_planner import choose_shops
+
+    rng = np.random.default_rng(5)
+    print(f"{'shops':>6} {'seconds':>8} {'shops used':>11} {'plan £':>9} {'cheapest items £':>17}")
+    for shop_count in shop_counts:
+        costs = rng.uniform(1, 20, (ingredient_count, shop_count))
+        costs[rng.random(costs.shape) < 0.5] = np.inf
+        costs[:, 0] = np.where(np.isfinite(costs[:, 0]), costs[:, 0], 25)     ## one shop that has everything
+        visits = np.full(shop_count, visit_cost)
+
+        start = time.perf_counter()
+        assignment = choose_shops(costs, visits)
+        seconds = time.perf_counter() - start
+        used = np.unique(assignment)
+        plan = costs[np.arange(ingredient_count), assignment].sum() + visits[used].sum()
+        cheapest = costs.min(axis=1).sum() + visits[np.unique(costs.argmin(axis=1))].sum()
+        print(f"{shop_count:>6} {seconds:>8.3f} {len(used):>11} {plan:>9.2f} {cheapest:>17.2f}")
+
+
+def benchmark_recipe_costs(sizes=(1000, 4000, 16000)):
+    # This benchmark times costing the whole recipe book: building the cost matrix, re-pricing it after a price
+    # change, and ranking every dish by cost per portion, against costing each recipe one ingredient at a time
+    from recipe_costs import RecipeCosts
+
+    print(f"{'recipes':>8} {'build s':>9} {'reprice s':>10} {'rank s':>8} {'per recipe s':>13}")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            catalog, repository = make_synthetic_data(directory, size)
+            catalog.refresh()
+            repository.ingredient_table
+
+            costs = RecipeCosts(catalog, repository)
+            build = time_call(lambda: (costs.invalidate(), costs.costs()))
+            reprice = time_call(lambda: (setattr(costs, '_costs_key', None), costs.costs()))
+            rank = time_call(lambda: costs.cost_per_portion('buffet').sort_values())
+            one_by_one = time_call(lambda: [sum(catalog.get_price(ingredient) * quantity
+                                                for ingredient, quantity in repository.ingredients(recipe).items())
+                                            for recipe in repository.names()], repeat=1)
+            print(f"{size:>8} {build:>9.4f} {reprice:>10.4f} {rank:>8.4f} {one_by_one:>13.4f}")
+
+
+def benchmark_menu_planner(sizes=(200, 1000, 5000), dishes=(4, 8), top=5):
+    # This benchmark times the branch-and-bound menu search over growing recipe books, and the full plan that quotes
+    # its shortlist, for a budget twice the cheapest menu's estimate
+    from menu_planner import MenuPlanner
+    from recipe_costs import RecipeCosts
+
+    print(f"{'recipes':>8} {'dishes':>7} {'search s':>9} {'plan s':>8} {'cheapest £':>11}")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            catalog, repository = make_synthetic_data(directory, size)
+            planner = MenuPlanner(RecipeCosts(catalog, repository))
+            planner.costs.costs()
+            for dish_count in dishes:
+                budget = 2 * planner.search(100, 'buffet', float('inf'), dish_count, top=1)[0][0]
+                search = time_call(planner.search, 100, 'buffet', budget, dish_count, top=top)
+                plan = time_call(planner.plan, 100, 'buffet', budget, dish_count, top=top, repeat=1)
+                cheapest = planner.plan(100, 'buffet', budget, dish_count, top=1)[0]['total_cost']
+                print(f"{size:>8} {dish_count:>7} {search:>9.4f} {plan:>8.3f} {cheapest:>11.2f}")
+
+
+def benchmark_recipe_import(sizes=(1000, 5000, 20000)):
+    # This benchmark imports a synthetic recipe book from CSV and from JSON-lines into an existing recipes.json
+    from recipe_importer import RecipeImporter
+
+    print(f"{'recipes':>8} {'csv s':>8} {'jsonl s':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        os.makedirs(os.path.join(directory, 'source'))
+        for size in sizes:
+            _, source = make_synthetic_data(os.path.join(directory, 'source'), size, seed=1)
+            recipes = {f"new {name}": recipe for name, recipe in source.recipes.items()}
+            csv_path, jsonl_path = os.path.join(directory, 'new.csv'), os.path.join(directory, 'new.jsonl')
+            rows = [(name, ingredient, quantity, *(recipe['portions'].values() if i == 0 else ('', '')))
+                    for name, recipe in recipes.items()
+                    for i, (ingredient, quantity) in enumerate(recipe['ingredients'].items())]
+            pd.DataFrame(rows, columns=['recipe', 'ingredient', 'quantity', 'buffet', 'dinner']).to_csv(csv_path, index=False)
+            with open(jsonl_path, "w") as jsonl_file:
+                for name, recipe in recipes.items():
+                    jsonl_file.write(json.dumps({'name': name, **recipe}) + "\n")
+
+            timings = []
+            for path in (csv_path, jsonl_path):
+                catalog, repository = make_synthetic_data(directory, 100)
+                start = time.perf_counter()
+                report = RecipeImporter(catalog, repository).import_files([path])
+                timings.append(time.perf_counter() - start)
+                assert report.ok and len(repository.recipes) == 100 + size
+            print(f"{size:>8} {timings[0]:>8.3f} {timings[1]:>8.3f}")
+
+
+def benchmark_sorted_insert(ingredient_count=50000, recipe_count=20000, adds=20):
+    # This benchmark adds ingredients and recipes to big sorted files, against re-sorting the whole file
+    from storage import CsvPriceStore, JsonRecipeStore
+
+    rng = random.Random(2)
+    with tempfile.TemporaryDirectory() as directory:
+        catalog, repository = make_synthetic_data(directory, recipe_count, ingredient_count=ingredient_count)
+        price_store, recipe_store = CsvPriceStore(catalog), JsonRecipeStore(repository)
+        price_store.alphabetize()
+        recipe_store.alphabetize()
+
+        print(f"{'file':>12} {'add s':>8} {'full sort s':>12}")
+        for name, store, add in [
+            ('price list', price_store, lambda name: price_store.add_ingredient(
+                name, price=1.0, unit='kg', shop='aldi', last_update='01/01')),
+            ('recipes', recipe_store, lambda name: recipe_store.add_recipe(
+                name, {'ingredients': {'ingredient 1': 1.0}, 'portions': {'buffet': 10}})),
+        ]:
+            seconds = []
+            for _ in range(adds):
+                new_name = ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz ') for _ in range(12)).strip()
+                start = time.perf_counter()
+                add(new_name)
+                seconds.append(time.perf_counter() - start)
+            print(f"{name:>12} {np.median(seconds):>8.4f} {time_call(store.alphabetize, repeat=1):>12.4f}")
+
+
+def benchmark_price_validation(sizes=(1000, 10000, 50000)):
+    # This benchmark checks whole price lists against the schema, against one pydantic Ingredient per row
+    from price_schema import Ingredient, validate_price_table
+
+    print(f"{'rows':>8} {'per row s':>10} {'column-wise s':>14}")
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            catalog, _ = make_synthetic_data(directory, 10, ingredient_count=size)
+            price_list = pd.read_csv(catalog.path)
+
+        def per_row():
+            for row in price_list.itertuples(index=False):
+                try:
+                    Ingredient(name=row.ingredient, price=row.price, unit=row.unit, shop=row.shop,
+                               last_update=row.last_update)
+                except ValueError:
+                    pass
+
+        print(f"{size:>8} {time_call(per_row, repeat=1):>10.4f} "
+              f"{time_call(lambda: validate_price_table(price_list)):>14.4f}")
+
+
+def benchmark_price_history(ingredient_count=5000, years=3, lookups=200):
+    # This benchmark looks up prices as of a date in years of weekly scrapes, against filtering the whole history
+    from price_history import PriceHistory
+
+    weeks = years * 52
+    rng = np.random.default_rng(0)
+    ingredients = [f"ingredient {i}" for i in range(ingredient_count)]
+    with tempfile.TemporaryDirectory() as directory:
+        history = PriceHistory(os.path.join(directory, 'price_history.csv'))
+        rows = pd.DataFrame({'price': np.round(rng.uniform(0.1, 20, ingredient_count * weeks), 2), 'unit': 'kg',
+                             'shop': 'aldi'}, index=pd.Index(ingredients * weeks, name='ingredient'))
+        moments = np.repeat(pd.date_range('2022-01-03', periods=weeks, freq='7D'), ingredient_count)
+        history.record(rows, moments)
+        load_seconds = time_call(lambda: PriceHistory(history.path).refresh(), repeat=1)
+        history.refresh()
+
+        flat = rows.reset_index().assign(recorded=moments)
+        wanted = ingredients[::ingredient_count // lookups]
+
+        def filtered():
+            before = flat[flat['ingredient'].isin(wanted) & (flat['recorded'] <= '2023-06-01')]
+            return before.sort_values('recorded', kind='stable').groupby('ingredient').last()
+
+        print(f"{len(rows)} prices recorded, loaded in {load_seconds:.4f}s")
+        print(f"{'ingredients':>12} {'binary search s':>16} {'filter s':>10}")
+        print(f"{len(wanted):>12} {time_call(lambda: history.prices_as_of(wanted, '2023-06-01')):>16.4f} "
+              f"{time_call(filtered):>10.4f}")
+
+
+def benchmark_price_scenarios(dish_counts=(5, 50), draws=(1000, 10000)):
+    # This benchmark prices random scenarios of an event's shopping list in one matrix product, against re-quoting
+    # the event once per scenario (estimated from a few quotes)
+    from event_calculator import quote_event
+    from price_scenarios import PriceScenarios
+
+    print(f"{'dishes':>7} {'lines':>6} {'draws':>6} {'scenarios s':>12} {'re-quoting s':>13}")
+    with tempfile.TemporaryDirectory() as directory:
+        catalog, repository = make_synthetic_data(directory, max(dish_counts))
+        for dish_count in dish_counts:
+            recipes_list = list(repository.recipes)[:dish_count]
+            shopping_list, _ = quote_event(100, recipes_list, 'buffet', catalog=catalog, repository=repository)
+            quote_seconds = time_call(quote_event, 100, recipes_list, 'buffet', catalog=catalog, repository=repository)
+            scenarios = PriceScenarios(shopping_list)
+            for draw_count in draws:
+                def analyse():
+                    result = scenarios.monte_carlo(draw_count, seed=0)
+                    result.percentiles()
+                    result.top_contributors()
+
+                print(f"{dish_count:>7} {len(shopping_list):>6} {draw_count:>6} {time_call(analyse):>12.4f} "
+                      f"{quote_seconds * draw_count:>13.1f}")
+
+
+BENCHMARKS = {
+    'shopping_list': benchmark_shopping_list,
+    'format_shopping_list': benchmark_format_shopping_list,
+    'parallel_quotes': benchmark_parallel_quotes,
+    'http_scrape': benchmark_http_scrape,
+    'scheduler': benchmark_scheduler,
+    'normalise': benchmark_normalise,
+    'pack_optimiser': benchmark_pack_optimiser,
+    'shop_planner': benchmark_shop_planner,
+    'recipe_costs': benchmark_recipe_costs,
+    'menu_planner': benchmark_menu_planner,
+    'recipe_import': benchmark_recipe_import,
+    'sorted_insert': benchmark_sorted_insert,
+    'price_validation': benchmark_price_validation,
+    'price_history': benchmark_price_history,
+    'price_scenarios': benchmark_price_scenarios,
+}
+
+
+if __name__ == '__main__':
+    for name in sys.argv[1:] or BENCHMARKS:
+        print(f"\n{name}")
+        BENCHMARKS[name]()
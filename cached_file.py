@@ -0,0 +1,54 @@
+import os
+
+
+# Several classes keep one of our data files parsed in memory (the price list, the recipes, skus.csv,
+# shop_prices.csv) and have to notice when something else writes to it; CachedFile is the part they share
+
+
+# stands in for the stamp of a file that hasn't been read yet (or has been invalidated), it equals no real stamp
+NOT_READ = object()
+
+
+class CachedFile:
+    # A base class for anything read from a file and kept until the file changes
+    # The file's modification time and size are checked on every refresh(), and _load(stamp) is called again if they
+    # have changed; subclasses implement _load, which reads self.path into their own attributes (stamp is None if the
+    # file doesn't exist, for the classes where missing_ok makes that mean "empty")
+    # version is bumped on every load, so caches built on top can tell the file changed
+
+    missing_ok = False  ## whether a missing file reads as empty rather than raising FileNotFoundError
+
+    def __init__(self, path):
+        self.path = path
+        self.version = 0
+        self._stamp = NOT_READ
+
+    def _file_stamp(self):
+        # mtime alone can miss two writes within the same tick, so the size is checked as well
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            if not self.missing_ok:
+                raise
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def refresh(self):
+        # This function re-reads the file if it has changed since it was last read, or was invalidated
+        stamp = self._file_stamp()
+        if stamp != self._stamp:
+            self._load(stamp)
+            self._stamp = stamp
+            self.version += 1
+
+    def _load(self, stamp):
+        raise NotImplementedError
+
+    def invalidate(self):
+        # This function forces the next access to re-read the file, called after we write to it
+        self._stamp = NOT_READ
+
+    def _record_write(self):
+        # a write to the file that was also made to what is held in memory, so the file doesn't need reading again
+        self._stamp = self._file_stamp()
+        self.version += 1
@@ -1,18 +1,17 @@
-import pandas as pd
+import argparse
 import json
-import math
-from file_manager import get_unit, get_price, get_shop
-from pydantic import BaseModel, validator
-from datetime import date
-
-
-# Pydantic model to check if ingredients data is correct
-class Ingredient(BaseModel):
-    name: str
-    price: int
-    unit: str
-    shop: str
-    last_update: date
+import os
+import re
+import multiprocessing
+import pandas as pd
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from price_catalog import PriceCatalog, price_catalog
+from recipe_repository import RecipeRepository, recipe_repository
+from pack_optimiser import optimise_packs, sku_catalog
+from price_history import price_history
+from shop_planner import shop_planner
+from units import unit_registry
 
 
 def get_event_details():
@@ -24,30 +23,35 @@ def get_event_details():
     return guest_count, recipes_list, event_type
 
 
-def estimate_recipe_quantities(recipes_list, event_type, guest_count):
+def estimate_recipe_quantities(recipes_list, event_type, guest_count, repository=recipe_repository, verbose=True):
     # This function estimates the quantity of each recipe in the json file that is needed for the given guest count
 
-    recipe_count_columns = ["Recipe", "Multiple"]
-    recipe_count = pd.DataFrame(columns=recipe_count_columns)
-
-    for recipe in recipes_list:
-        with open('recipes.json', "r") as json_file:
-            recipes = json.load(json_file)
-
-            portion_size = float(recipes[recipe]['portions'][event_type])
-            recipe_multiplier = round(guest_count * 2 / portion_size) / 2
-
-            new_row = pd.DataFrame([[recipe, recipe_multiplier]], columns=recipe_count_columns)
-            recipe_count = pd.concat([recipe_count, new_row], ignore_index=True)
-
-    print("\nEstimated recipe quantities:\n")
-    print(recipe_count)
+    # look up every portion size at once from the repository's portions table
+    portions = repository.portions
+    missing = [recipe for recipe in recipes_list if recipe not in portions.index]
+    if missing:
+        raise KeyError(missing[0])
+    if event_type not in portions.columns:
+        raise KeyError(event_type)
+    portion_sizes = portions.loc[recipes_list, event_type].to_numpy()
+    if np.isnan(portion_sizes).any():
+        raise KeyError(event_type)
+
+    # multiplier is rounded to the nearest half batch (np.round rounds halves to even, like round())
+    recipe_multipliers = np.round(guest_count * 2 / portion_sizes) / 2
+    recipe_count = pd.DataFrame({"Recipe": recipes_list, "Multiple": recipe_multipliers})
+
+    if verbose:
+        print("\nEstimated recipe quantities:\n")
+        print(recipe_count)
     return recipe_count
 
 
-def get_user_changes(recipe_count):
+def get_user_changes(recipe_count, quote=None):
     # This function allows the user to change any of the estimated recipe multipliers to fit with the event
     # This way we can exercise our better judgment for how much we think a party will require
+    # With an IncrementalQuote the changes are made to it and the new total shown, and the user can keep trying
+    # changes until they enter 'no'
 
     while True:
         user_changes = input(
@@ -56,84 +60,238 @@ def get_user_changes(recipe_count):
             break
         else:
             try:
-                changes = user_changes.split(", ")
-                for change in changes:
+                changes = {}
+                for change in user_changes.split(", "):
                     recipe_to_change, new_multiple = change.split(": ")
-                    recipe_count.loc[recipe_count['Recipe'] == recipe_to_change, 'Multiple'] = float(new_multiple)
-                break
+                    changes[recipe_to_change] = float(new_multiple)
+                if quote is None:
+                    recipe_count = apply_multiplier_changes(recipe_count, changes)
+                    break
+                quote.set_multiples(changes)
+                recipe_count = quote.recipe_count
+                print(f"{recipe_count}\n\nTotal cost: {quote.total_cost()}\n\nAny more changes?")
             except ValueError:
                 print(f"Invalid input. Please use correct format: 'recipe: new_quantity', ...")
+            except KeyError as error:
+                print(f"{error.args[0]} is not on the menu")
 
     print(recipe_count)
     return recipe_count
 
 
-def format_shopping_list(shopping_list, recipes_list):
-    # This function formats the shopping list
-
-    # Here we group any like ingredients and sum their quantities
-    shopping_list = shopping_list.groupby('ingredient').agg(
-        {'quantity': 'sum', 'unit': 'first', 'shop': 'first', 'recipe': lambda x: x.tolist()}).reset_index()
+def apply_multiplier_changes(recipe_count, changes):
+    # This function overrides the estimated multiplier of some recipes, changes is a {recipe: new_multiple} dict
+    for recipe_to_change, new_multiple in changes.items():
+        recipe_count.loc[recipe_count['Recipe'] == recipe_to_change, 'Multiple'] = float(new_multiple)
+    return recipe_count
 
-    # here we check if an ingredient is used in all recipes, and print "all recipes" if so
-    # this just prints a nicer visual format
-    for index, row in shopping_list.iterrows():
-        if len(row['recipe']) == len(recipes_list):
-            shopping_list.loc[index, 'recipe'] = '[all recipes]'
 
+def round_half_even(values, decimals):
+    # This function rounds a whole array exactly like python's round(value, decimals) does for a single float
+    # np.round scales by 10**decimals first, and the scaling error can push a value sitting on a .5 boundary
+    # the wrong way (round(1.15, 1) is 1.1 but np.round gives 1.2), so the exact error of the scaling is
+    # recovered (Dekker's split) and used to settle those ties
+
+    values = np.asarray(values, dtype=float)
+    scale = 10.0 ** decimals
+    scaled = values * scale
+
+    split = 134217729.0 * values    ## 2**27 + 1
+    high = split - (split - values)
+    low = values - high
+    error = high * scale - scaled + low * scale
+
+    floor = np.floor(scaled)
+    tie = scaled - floor == 0.5
+    rounded = np.rint(scaled)
+    rounded = np.where(tie & (error > 0), floor + 1, rounded)
+    rounded = np.where(tie & (error < 0), floor, rounded)
+    return rounded / scale
+
+
+def group_ingredients(shopping_list):
+    # This function groups like ingredients, summing their quantities and listing the recipes that use them
+    # Quantities are added one row at a time in list order, like python's sum(), so the totals (and therefore the
+    # rounding below) don't shift by a float ulp the way pandas' compensated groupby sum can
+
+    # stable sort by ingredient, so each group is a contiguous run that keeps the original row order
+    codes, ingredients = pd.factorize(shopping_list['ingredient'], sort=True)
+    order = np.argsort(codes, kind='stable')
+    group_sizes = np.bincount(codes, minlength=len(ingredients))
+    starts = np.cumsum(group_sizes) - group_sizes
+
+    quantities = shopping_list['quantity'].to_numpy(dtype=float)[order]
+    totals = quantities[starts].copy()
+    # add the n-th row of every group that has one, largest groups first so the active groups are a prefix
+    by_size = np.argsort(-group_sizes, kind='stable')
+    sorted_sizes = group_sizes[by_size]
+    for offset in range(1, sorted_sizes.max(initial=0)):
+        active = by_size[:np.searchsorted(-sorted_sizes, -offset, side='left')]
+        totals[active] += quantities[starts[active] + offset]
+
+    first_rows = shopping_list.iloc[order[starts]]
+    recipes = shopping_list['recipe'].to_numpy(dtype=object)[order]
+    recipe_lists = [group.tolist() for group in np.split(recipes, starts[1:])] if len(starts) else []
+    return pd.DataFrame({
+        'ingredient': ingredients,
+        'quantity': totals,
+        'unit': first_rows['unit'].to_numpy(),
+        'shop': first_rows['shop'].to_numpy(),
+        'recipe': recipe_lists,
+        'recipe_count': group_sizes,
+    })
+
+
+def round_quantities(quantities, units, increments=None):
     # here we check if the quantity of an ingredient is divisible, if not, we round up to the nearest integer
     # this is because we cannot buy, for example, half a bottle of oil
-    for index, row in shopping_list.iterrows():
-        if row['unit'] == "kg":
-            shopping_list.loc[index, 'quantity'] = round(row['quantity'], 1)
-        else:
-            shopping_list.loc[index, 'quantity'] = math.ceil(row['quantity'])
+    # increments (from the price list's optional increment column) are the amounts a product is really sold in,
+    # e.g. 0.5 for a 500g bag priced per kg, and round up to a whole number of them instead, NaN keeps the rule above
+    quantities = np.asarray(quantities, dtype=float)
+    is_kg = np.asarray(units) == "kg"
+    rounded = np.where(is_kg, round_half_even(quantities, 1), np.ceil(quantities))
+    if increments is None:
+        return rounded
+
+    increments = np.asarray(increments, dtype=float)
+    sold_in = increments > 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ## the division is settled to 9 places first, so 0.7 kg in 0.1 kg steps is 7 steps rather than 7.000000000000001
+        steps = np.ceil(round_half_even(quantities / increments, 9))
+    return np.where(sold_in, round_half_even(steps * increments, 6), rounded)
+
+
+def finish_shopping_list(shopping_list, rounded_quantities, unit_prices, menu_size, skus=None, shops=None,
+                         pack_sizes=None):
+    # This function takes the grouped shopping list (see group_ingredients) with its rounded quantities and
+    # unit prices, and lays it out the way it is printed
+    # Ingredients with SKUs (see pack_optimiser.py) are bought as the cheapest combination of packs instead, which
+    # adds a 'packs' column saying which, and with other shops' prices (see shop_planner.py) each ingredient's shop
+    # is chosen to keep the shopping plus the trips cheapest (pack_sizes being the price list's pack_size of each row,
+    # for SKUs sized in another kind of unit)
+
+    raw_quantities = shopping_list['quantity'].to_numpy(dtype=float, copy=True)
+    shopping_list = price_shopping_list(shopping_list, rounded_quantities, unit_prices, menu_size)
+
+    if shops:
+        bought = shops.plan(shopping_list, raw_quantities, rounded_quantities, unit_prices, skus, pack_sizes)
+    elif skus:
+        bought = optimise_packs(shopping_list.assign(quantity=raw_quantities), skus, pack_sizes)
+    else:
+        bought = None
+    return arrange_shopping_list(shopping_list, bought)
+
+
+def price_shopping_list(shopping_list, rounded_quantities, unit_prices, menu_size):
+    # This function fills in the grouped shopping list's recipes, quantities and prices as bought from the price list
+
+    # here we check if an ingredient is used in all recipes, and print "all recipes" if so
+    # this just prints a nicer visual format
+    in_all_recipes = (shopping_list['recipe_count'] == menu_size).to_numpy()
+    recipes = shopping_list['recipe'].to_numpy(dtype=object, copy=True)
+    recipes[in_all_recipes] = '[all recipes]'
+    shopping_list['recipe'] = recipes
+
+    # whole units are kept as ints so they print without a decimal place
+    as_int = (shopping_list['unit'] != "kg").to_numpy() & (rounded_quantities == np.floor(rounded_quantities))
+    quantity_column = np.empty(len(rounded_quantities), dtype=object)
+    quantity_column[~as_int] = rounded_quantities[~as_int]
+    quantity_column[as_int] = rounded_quantities[as_int].astype(np.int64)
+    shopping_list['quantity'] = quantity_column
 
     # here we create a prices column, and calculate the cost of each ingredient needed for the event
-    prices = []
-    for index, row in shopping_list.iterrows():
-        ingredient = row['ingredient']
-        quantity = row['quantity']
-        unit_price = get_price(ingredient)
-        prices.append(round(quantity * unit_price, 2))
+    shopping_list['price'] = np.round(rounded_quantities * unit_prices, 2)
+    return shopping_list
 
-    shopping_list['price'] = prices
 
-    # here we adjust the order of the columns to be more logical and sort the row by which shop we need to buy them
+def arrange_shopping_list(shopping_list, bought=None):
+    # This function puts in what is bought as packs or at another shop (a table of quantity, price, shop and packs
+    # indexed by position, see optimise_packs and ShopPlanner.plan), and orders the columns and rows for printing
+
     column_order = ['shop', 'ingredient', 'quantity', 'unit', 'price', 'recipe']
+    if bought is not None and len(bought):
+        for column in ['quantity', 'price', 'shop', 'packs']:
+            values = shopping_list[column].to_numpy(dtype=object, copy=True) if column in shopping_list \
+                else np.full(len(shopping_list), '', dtype=object)
+            values[bought.index.to_numpy(dtype=np.int64)] = bought[column].to_numpy(dtype=object)
+            shopping_list[column] = values
+        shopping_list['price'] = shopping_list['price'].astype(float)
+        if bought['packs'].notna().any():
+            shopping_list['packs'] = shopping_list['packs'].fillna('')
+            column_order.insert(5, 'packs')
+
+    # here we adjust the order of the columns to be more logical and sort the row by which shop we need to buy them
     shopping_list = shopping_list[column_order]
     shopping_list = shopping_list.sort_values(by='shop', ignore_index=True)
 
     return shopping_list
 
 
-def calculate_shopping_list(recipes_list, recipe_count):
+def format_shopping_list(shopping_list, recipes_list, catalog=price_catalog, skus=sku_catalog, shops=shop_planner,
+                         as_of=None):
+    # This function formats the shopping list
+    # With as_of (a date) it is priced at the prices of that day from the price history; the history only holds the
+    # price list, so packs and other shops' prices (which are today's) are left out
+
+    if as_of is not None:
+        catalog, skus, shops = price_history.catalog_as_of(catalog, as_of), None, None
+
+    # Here we group any like ingredients and sum their quantities
+    shopping_list = group_ingredients(shopping_list)
+
+    increments = catalog.lookup_optional(shopping_list['ingredient'], 'increment', default=np.nan)
+    rounded_quantities = round_quantities(shopping_list['quantity'], shopping_list['unit'], increments)
+    unit_prices = catalog.lookup(shopping_list['ingredient'], ['price'])['price'].to_numpy(dtype=float)
+    pack_sizes = catalog.lookup_optional(shopping_list['ingredient'], 'pack_size')
+
+    return finish_shopping_list(shopping_list, rounded_quantities, unit_prices, len(recipes_list), skus, shops,
+                                pack_sizes)
+
+
+def convert_to_price_units(rows, catalog=price_catalog):
+    # This function returns the quantity column of recipe rows (with recipe_unit and the price list's unit) converted
+    # into the price list's unit, rows with a bare number are left exactly as they are
+    recipe_units = rows['recipe_unit'].to_numpy(dtype=object)
+    quantities = rows['quantity'].to_numpy(dtype=float, copy=True)
+    given = pd.notna(recipe_units)
+    if given.any():
+        pack_sizes = catalog.lookup_optional(rows['ingredient'][given], 'pack_size')
+        quantities[given] *= unit_registry.factors(recipe_units[given], rows['unit'].to_numpy(dtype=object)[given],
+                                                   pack_sizes, ingredients=rows['ingredient'].to_numpy()[given])
+    return quantities
+
+
+def calculate_shopping_list(recipes_list, recipe_count, catalog=price_catalog, repository=recipe_repository,
+                            as_of=None):
     # This function creates a shopping list for the list of recipes given for an event
+    # The whole recipe x ingredient table is built in one pass: the menu's rows are taken from the repository's
+    # long ingredient table, scaled by each recipe's multiple, and joined with the unit and shop from the catalog
+    # (as they were on the as_of date, if given, see price_history.py)
+
+    if as_of is not None:
+        catalog = price_history.catalog_as_of(catalog, as_of)
 
     shopping_list_columns = ['ingredient', 'quantity', 'unit', 'shop', 'recipe']
-    shopping_list = pd.DataFrame(columns=shopping_list_columns)
-
-    for recipe in recipes_list:
-        with open('recipes.json', "r") as json_file:
-            recipes = json.load(json_file)
-            recipe_ingredients = recipes[recipe]['ingredients']
-            recipe_multiple = recipe_count.loc[recipe_count['Recipe'] == recipe, 'Multiple'].values[0]
-
-            for ingredient, recipe_quantity in recipe_ingredients.items():
-                event_quantity = recipe_quantity * recipe_multiple
-                unit = get_unit(ingredient)
-                shop = get_shop(ingredient)
-
-                new_row = pd.DataFrame({
-                    'ingredient': [ingredient],
-                    'quantity': [event_quantity],
-                    'unit': [unit],
-                    'shop': [shop],
-                    'recipe': [recipe]
-                }, columns=shopping_list_columns)
-                shopping_list = pd.concat([shopping_list, new_row], ignore_index=True)
 
-    return shopping_list
+    recipes = repository.recipes
+    missing = [recipe for recipe in recipes_list if recipe not in recipes]
+    if missing:
+        raise KeyError(missing[0])
+
+    # one row per (menu recipe, ingredient), keeping menu order and the ingredient order of each recipe
+    shopping_list = repository.menu_rows(recipes_list)
+
+    units_and_shops = catalog.lookup(shopping_list['ingredient'], ['unit', 'shop'])
+    shopping_list['unit'] = units_and_shops['unit'].to_numpy()
+    shopping_list['shop'] = units_and_shops['shop'].to_numpy()
+
+    # quantities a recipe gave in its own unit are converted to the price list's unit
+    shopping_list['quantity'] = convert_to_price_units(shopping_list, catalog)
+
+    multiples = recipe_count.drop_duplicates('Recipe').set_index('Recipe')['Multiple'].astype(float)
+    shopping_list['quantity'] = shopping_list['quantity'] * shopping_list['recipe'].map(multiples)
+
+    return shopping_list[shopping_list_columns]
 
 
 def calculate_total_cost(shopping_list):
@@ -142,25 +300,173 @@ def calculate_total_cost(shopping_list):
     return total_cost
 
 
-def main():
-    guest_count, recipes_list, event_type = get_event_details()
-    recipe_count = estimate_recipe_quantities(recipes_list, event_type, guest_count)
-    recipe_count = get_user_changes(recipe_count)
+def quote_event(guest_count, recipes_list, event_type, multipliers=None,
+                catalog=price_catalog, repository=recipe_repository, as_of=None):
+    # This function quotes a single event without any prompts, returning its shopping list and total cost
+    # multipliers is an optional {recipe: multiple} dict that overrides the estimated recipe quantities, and as_of
+    # an optional date to quote at that day's prices
+
+    recipe_count = estimate_recipe_quantities(recipes_list, event_type, guest_count, repository=repository,
+                                              verbose=False)
+    if multipliers:
+        recipe_count = apply_multiplier_changes(recipe_count, multipliers)
+
+    shopping_list = calculate_shopping_list(recipes_list, recipe_count, catalog=catalog, repository=repository,
+                                            as_of=as_of)
+    shopping_list = format_shopping_list(shopping_list, recipes_list, catalog=catalog, as_of=as_of)
+    return shopping_list, calculate_total_cost(shopping_list)
 
-    shopping_list = calculate_shopping_list(recipes_list, recipe_count)
-    shopping_list = format_shopping_list(shopping_list, recipes_list)
 
+def load_events(path):
+    # This function reads a file of events to quote, either a json list or json-lines (one event per line)
+    # Each event needs 'guest_count', 'dishes' (a list or a comma separated string) and 'event_type',
+    # and can have a 'name', a 'date' (yyyy-mm-dd), a 'multipliers' {recipe: multiple} dict and an 'as_of' date
+    # (yyyy-mm-dd) to quote it at the prices of that day
+
+    with open(path, "r") as events_file:
+        if path.endswith('.jsonl'):
+            raw_events = [json.loads(line) for line in events_file if line.strip()]
+        else:
+            raw_events = json.load(events_file)
+
+    events = []
+    for index, raw_event in enumerate(raw_events):
+        dishes = raw_event['dishes']
+        if isinstance(dishes, str):
+            dishes = dishes.split(',')
+        events.append({
+            'name': raw_event.get('name', f"event {index + 1}"),
+            'guest_count': int(raw_event['guest_count']),
+            'recipes_list': [dish.strip().lower() for dish in dishes],
+            'event_type': raw_event['event_type'].strip().lower(),
+            'date': raw_event.get('date'),
+            'as_of': raw_event.get('as_of'),
+            'multipliers': {recipe.strip().lower(): float(multiple)
+                            for recipe, multiple in raw_event.get('multipliers', {}).items()},
+        })
+    return events
+
+
+def quote_events(events, catalog=price_catalog, repository=recipe_repository, workers=None):
+    # This function quotes many events in one go, all sharing the same loaded price catalog and recipes
+    # It returns one {'name', 'shopping_list', 'total_cost'} dict per event, in the same order as the events
+    # With workers > 1 the events are spread over a process pool, see quote_events_in_parallel
+
+    # load and index both files once up front, every quote after this is served from memory
+    catalog.refresh()
+    repository.recipe_rows
+    repository.portions
+
+    if workers and workers > 1 and len(events) > 1:
+        return quote_events_in_parallel(events, catalog, repository, workers)
+
+    quotes = []
+    for event in events:
+        quotes.append(quote_single_event(event, catalog, repository))
+    return quotes
+
+
+def quote_single_event(event, catalog, repository):
+    shopping_list, total_cost = quote_event(event['guest_count'], event['recipes_list'], event['event_type'],
+                                            event.get('multipliers'), catalog=catalog, repository=repository,
+                                            as_of=event.get('as_of'))
+    return {'name': event['name'], 'shopping_list': shopping_list, 'total_cost': total_cost}
+
+
+# catalog and repository used by the pool workers, set in the parent before forking so children inherit them
+_worker_data = {}
+
+
+def _init_worker(price_list_path=None, recipes_path=None):
+    # without fork (e.g. on windows) each worker loads its own copy of the files, once, when it starts
+    if price_list_path is not None:
+        _worker_data['catalog'] = PriceCatalog(price_list_path)
+        _worker_data['repository'] = RecipeRepository(recipes_path)
+
+
+def _quote_in_worker(event):
+    return quote_single_event(event, _worker_data['catalog'], _worker_data['repository'])
+
+
+def quote_events_in_parallel(events, catalog, repository, workers):
+    # This function spreads independent events across a pool of processes
+    # Where fork is available the already-loaded catalog and recipe tables are inherited by the workers
+    # (copy-on-write), so nothing but the event itself is pickled per task; otherwise each worker loads
+    # the files once in its initializer
+
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+        _worker_data['catalog'] = catalog
+        _worker_data['repository'] = repository
+        initargs = ()
+    else:
+        context = multiprocessing.get_context('spawn')
+        initargs = (catalog.path, repository.path)
+
+    chunk_size = max(1, len(events) // (workers * 4))
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=_init_worker, initargs=initargs) as executor:
+            return list(executor.map(_quote_in_worker, events, chunksize=chunk_size))
+    finally:
+        _worker_data.clear()
+
+
+def print_shopping_list(shopping_list, total_cost):
     # here we make sure that the df is not compressed when printed on the screen
     pd.set_option('display.max_columns', None)
     pd.set_option('display.max_rows', None)
     print(shopping_list.to_string(max_colwidth=100))
-
-    total_cost = calculate_total_cost(shopping_list)
     print(f'\nTotal cost: {total_cost}')
 
 
+def main(as_of=None):
+    # the quote is kept as an IncrementalQuote, so each change the user tries only re-prices what it touches
+    from incremental_quote import IncrementalQuote      ## imported here, as incremental_quote builds on this module
+
+    guest_count, recipes_list, event_type = get_event_details()
+    recipe_count = estimate_recipe_quantities(recipes_list, event_type, guest_count)
+    quote = IncrementalQuote(recipes_list, recipe_count, as_of=as_of)
+    get_user_changes(recipe_count, quote)
+
+    print_shopping_list(quote.shopping_list, quote.total_cost())
+
+
+def main_batch(events_path, output_dir=None, workers=None, as_of=None):
+    # This function quotes every event in a file, printing each shopping list (or saving them as csv files)
+    # as_of quotes every event without an 'as_of' of its own at that day's prices
+
+    events = load_events(events_path)
+    for event in events:
+        event['as_of'] = event['as_of'] or as_of
+    quotes = quote_events(events, workers=workers)
+
+    for quote in quotes:
+        print(f"\n{quote['name']}\n")
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+            file_name = re.sub(r'[^\w-]+', '_', quote['name']).strip('_') + '.csv'
+            quote['shopping_list'].to_csv(os.path.join(output_dir, file_name), index=False)
+            print(f"Total cost: {quote['total_cost']}")
+        else:
+            print_shopping_list(quote['shopping_list'], quote['total_cost'])
+
+    print(f"\nQuoted {len(quotes)} events, total: {round(sum(quote['total_cost'] for quote in quotes), 2)}")
+    return quotes
+
+
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description="Calculate shopping lists and costs for catering events")
+    parser.add_argument('--events', help="json or json-lines file of events to quote without any prompts")
+    parser.add_argument('--output-dir', help="save each event's shopping list as a csv file in this directory")
+    parser.add_argument('--workers', type=int, help="quote the events across this many processes")
+    parser.add_argument('--as-of', help="quote at the prices of this date (yyyy-mm-dd), from the price history")
+    args = parser.parse_args()
+
+    if args.events:
+        main_batch(args.events, args.output_dir, args.workers, args.as_of)
+    else:
+        main(args.as_of)
 
 # hummus, schug, moroccan carrots, matbucha
 
@@ -0,0 +1,59 @@
+import re
+import threading
+import urllib3
+
+
+# A fetcher turns a url into the page's html, the shop sessions in update_prices_csv parse that html themselves
+# HttpFetcher asks for the page directly over a pooled connection, which is all a server-rendered shop needs, and is
+# far quicker and lighter than a browser. A fetcher has an open / close / get(url, params) interface, so another (e.g.
+# a stand-in for tests) can be handed to a session; pages that need javascript go to the shop's browser session instead
+
+
+# sent with every plain http request, as some shops turn away clients that don't look like a browser
+HTTP_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+                  'Chrome/120.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml',
+    'Accept-Language': 'en-GB,en;q=0.9',
+}
+
+_http_pool = None
+_http_pool_lock = threading.Lock()
+
+
+def http_pool():
+    # This function returns the connection pool shared by every HttpFetcher in the process
+    # urllib3 pools are thread safe, so the scheduler's worker threads all reuse the same kept-alive connections
+    global _http_pool
+    with _http_pool_lock:
+        if _http_pool is None:
+            _http_pool = urllib3.PoolManager(num_pools=10, maxsize=8, headers=HTTP_HEADERS)
+    return _http_pool
+
+
+class FetchError(Exception):
+    # the shop answered, but not with a page we can use (e.g. a 404 or 503)
+    pass
+
+
+class HttpFetcher:
+
+    def __init__(self, timeout=10, retries=1, pool=None):
+        self.timeout = urllib3.Timeout(connect=timeout, read=timeout)
+        self.retries = urllib3.Retry(total=retries, backoff_factor=0.5, status_forcelist=(502, 503, 504))
+        self.pool = pool
+
+    def open(self):
+        self.pool = self.pool or http_pool()
+
+    def close(self):
+        pass    ## the connections stay in the shared pool for the next fetcher
+
+    def get(self, url, params=None):
+        # This function returns the html of the page at url, raising FetchError if the shop doesn't return one
+        response = self.pool.request('GET', url, fields=params, timeout=self.timeout, retries=self.retries)
+        if response.status >= 400:
+            raise FetchError(f"{url} returned {response.status}")
+        charset = re.search(r'charset=([\w-]+)', response.headers.get('Content-Type', ''))
+        return response.data.decode(charset.group(1) if charset else 'utf-8', errors='replace')
+
@@ -0,0 +1,59 @@
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:     ## windows
+    fcntl = None
+    import msvcrt
+
+
+# multiprocessing.Lock() objects are only shared with processes that inherit them, and not at all between separate
+# programs (e.g. a scraper run and the calculator), so writes to our data files are guarded by an OS-level lock
+# on a '<file>.lock' file next to them instead, and land through a temp file + rename so readers never see half a file
+
+
+@contextmanager
+def file_lock(path):
+    # This function holds an exclusive cross-process lock for the given data file until the block exits
+
+    with open(path + '.lock', 'a+') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:     ## LK_LOCK gives up after ~10 seconds, keep waiting
+                    time.sleep(0.1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def atomic_write(path, mode='w'):
+    # This function opens a temp file in the same directory, and renames it over the target once the block succeeds
+    # os.replace is atomic, so anyone reading the file sees either the old or the new version, never a partial one
+
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, temp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.', suffix='.tmp')
+    if os.path.exists(path):
+        os.chmod(temp_path, os.stat(path).st_mode & 0o777)     ## mkstemp files are private, keep the original's mode
+    try:
+        with os.fdopen(handle, mode, newline='' if 'b' not in mode else None) as temp_file:
+            yield temp_file
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
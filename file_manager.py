@@ -1,130 +1,122 @@
-import csv
-import json
-import multiprocessing.synchronize
-import re
-import pandas as pd
-from datetime import datetime
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import NoSuchElementException, TimeoutException, ElementNotInteractableException
-import multiprocessing
+import sys
+from datetime import datetime, timedelta
 import logging
+from price_catalog import price_catalog
+from price_history import price_history
+from refresh_planner import ingredient_ages
+from recipe_costs import recipe_costs
+from recipe_importer import RecipeImporter
+from recipe_repository import recipe_repository
+from storage import open_price_store, open_recipe_store
 
 
 # TODO: organise these functions into classes ??
 
 
 logging.basicConfig(filename='error_logs.txt', level=logging.INFO)
-csv_lock = multiprocessing.Lock()
+
+# the columns the price history keeps, and the changes that add to it
+HISTORY_FIELDS = ['price', 'unit', 'shop']
+PRICED_COLUMNS = {'price', 'unit', 'shop', 'last_update'}
+
+# the price list and recipes backends (csv/json files by default, see storage.py)
+price_store = open_price_store(price_catalog)
+recipe_store = open_recipe_store(recipe_repository)
 
 
         # INGREDIENTS LIST
 
 def view_ingredient(ingredient):
-    # This function prints all related information about an ingredient from the csv file
-
-    df = pd.read_csv('price_list.csv')
-    ingredients_list = df['ingredient'].values
+    # This function prints all related information about an ingredient from the price list
 
-    if ingredient in ingredients_list:
-        print(df.loc[df['ingredient'] == ingredient])
+    if ingredient in price_store:
+        print(price_store.get_ingredient(ingredient))
     else:
         print('Ingredient not found in database.')
 
 
 def add_ingredient(ingredient):
-    # This function adds an ingredient to the price_list CSV file
+    # This function adds an ingredient to the price list
 
     # Get row info
     price = round(float(input("Price: ")), 2)
     unit = input("Unit: ").strip().lower()
-    divisible = input("Divisible ('True' or 'False'): ").title()
-    divisible = divisible == 'True'
     shop = input("Shop: ").strip().lower()
+    today_date = datetime.now().date().strftime("%d/%m")
 
-    # create row with info, append to df and write back to csv file
-    row = [ingredient, price, unit, divisible, shop]
-    df = pd.read_csv('price_list.csv')
-    row_df = pd.DataFrame([row], columns=df.columns)    ## need [] around 'row' as DataFrame() expects iterable
-    df = pd.concat([df, row_df], ignore_index=True)     ## ignoring the index reassigns a new index for the new dataframe, otherwise it will keep its old index
-    df.to_csv('price_list.csv', index=False)       ## index=False makes sure we do not write the index back to the CSV file
-
-    # sort the file after adding
+    # add the row, the store inserts it in alphabetical order
+    price_store.add_ingredient(ingredient, price=price, unit=unit, shop=shop, last_update=today_date)
+    recipe_costs.invalidate()
+    price_history.record(price_catalog.lookup([ingredient], HISTORY_FIELDS))
     print(f"{ingredient} added!")
-    alphabetize_price_list()
 
 
-def modify_unit(ingredient, unit):
-    # This function changes the unit value of an ingredient in the csv file
+def update_ingredients(updates):
+    # This function writes a batch of changes, {ingredient: {column: value}}, back to the price list in one write
+    # Every price written (or confirmed, by resetting its last_update) is also added to the price history
+    price_store.update_ingredients(updates)
+    recipe_costs.invalidate()
+    priced = [ingredient for ingredient, fields in updates.items() if set(fields) & PRICED_COLUMNS]
+    price_history.record(price_catalog.lookup(priced, HISTORY_FIELDS), price_dates(updates, priced))
 
-    with csv_lock:
-        df = pd.read_csv('price_list.csv', index_col='ingredient')
-        df.at[ingredient, 'unit'] = unit
-        df.to_csv('price_list.csv')
 
+def price_dates(updates, ingredients, now=None):
+    # This function returns when each ingredient's new price dates from, for the price history
+    # That is the day of the last_update written with it (e.g. a price scraped from a page cached yesterday), or now
+    # where no last_update was written (a plain price or unit edit) or it is today's
+    now = now or datetime.now()
+    last_updates = [updates[ingredient].get('last_update') for ingredient in ingredients]
+    ages = ingredient_ages(last_updates, now.date())
+    today = datetime.combine(now.date(), datetime.min.time())
+    return [now if not 0 < age < float('inf') else today - timedelta(days=age) for age in ages]
 
-def modify_price(ingredient, price):
-    # This function allows changes the price of an ingredient in the csv file
 
-    with csv_lock:
-        df = pd.read_csv('price_list.csv', index_col='ingredient')
-        df.at[ingredient, 'price'] = price
-        df.to_csv('price_list.csv')
+def update_ingredient(ingredient, **fields):
+    # This function changes any number of columns of one ingredient in a single write, e.g. price=1.2, unit='kg'
+    update_ingredients({ingredient: fields})
 
 
-def reset_last_update(ingredient):
-    # This function resets the 'last_update' column to today's date
+def modify_unit(ingredient, unit):
+    # This function changes the unit value of an ingredient in the price list
+    update_ingredient(ingredient, unit=unit)
 
-    with csv_lock:
-        today_date = datetime.now().date().strftime("%d/%m")
-        df = pd.read_csv('price_list.csv', index_col='ingredient')
-        df.at[ingredient, 'last_update'] = today_date
-        df.to_csv('price_list.csv')
 
+def modify_price(ingredient, price):
+    # This function allows changes the price of an ingredient in the price list
+    update_ingredient(ingredient, price=price)
 
-def alphabetize_price_list():
-    # This function sorts the csv file into alphabetical order
 
-    with open('price_list.csv', "r") as csv_file:
-        csv_reader = csv.DictReader(csv_file)
-        sorted_price_list = sorted(csv_reader, key=lambda x: x['ingredient'])
+def reset_last_update(ingredient):
+    # This function resets the 'last_update' column to today's date
+    today_date = datetime.now().date().strftime("%d/%m")
+    update_ingredient(ingredient, last_update=today_date)
+
 
-    with open('price_list.csv', "w") as csv_file:
-        fieldnames = sorted_price_list[0].keys()
-        csv_writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
-        csv_writer.writeheader()
-        csv_writer.writerows(sorted_price_list)
+def alphabetize_price_list():
+    # This function sorts the price list into alphabetical order
+    price_store.alphabetize()
 
 
 def get_unit(ingredient):
-    # This function returns the unit measure of an ingredient from the csv_file
-    csv_file = pd.read_csv('price_list.csv', index_col='ingredient')
-    return csv_file.loc[ingredient, 'unit']
+    # This function returns the unit measure of an ingredient from the price list
+    return price_store.get(ingredient, 'unit')
 
 
 def get_price(ingredient):
-    # This function returns the price of an ingredient from the csv_file
-    csv_file = pd.read_csv('price_list.csv', index_col='ingredient')
-    return csv_file.loc[ingredient, 'price']
+    # This function returns the price of an ingredient from the price list
+    return price_store.get(ingredient, 'price')
 
 
 def get_shop(ingredient):
-    # This function returns the shop where we buy a specific ingredient from the csv_file
-    csv_file = pd.read_csv('price_list.csv', index_col='ingredient')
-    return csv_file.loc[ingredient, 'shop']
+    # This function returns the shop where we buy a specific ingredient from the price list
+    return price_store.get(ingredient, 'shop')
 
 
 
         # RECIPES LIST
 
 def view_recipe():
-    with open("recipes.json", "r") as json_file:
-        recipes = json.load(json_file)
+    recipes = recipe_repository.recipes
 
     recipe_name = input("Name of Recipe: ").strip().lower()
     if recipe_name in recipes:
@@ -136,12 +128,7 @@ def view_recipe():
 def alphabetize_recipes_list():
     # This function alphabetizes the recipes list in the JSON file
 
-    with open("recipes.json", "r") as json_file:
-        recipes = json.load(json_file)
-        sorted_recipes = {recipe: recipes[recipe] for recipe in sorted(recipes)}  ## iterates over sorted recipe names and adds them as keys in a new dict, with their old values
-
-    with open("recipes.json", "w") as json_file:
-        json.dump(sorted_recipes, json_file, indent=4)
+    recipe_store.alphabetize()
     print("Recipes alphabetized!")
 
 
@@ -149,8 +136,7 @@ def add_recipe():
     # This function adds a recipe to the 'recipes' json file
 
     # get name of the recipe and list of ingredients with quantities, stored as a nested dict
-    with open("recipes.json", "r") as json_file:
-        recipes = json.load(json_file)
+    recipes = recipe_repository.recipes
 
     recipe_name = input("Name of Recipe: ").lower()
     if recipe_name in recipes:
@@ -178,14 +164,9 @@ def add_recipe():
             portion = int(input("Portion: ").strip())
             portions_dict[event_type] = portion
 
-        # nest dicts and load to json file
-        recipe = {recipe_name: {'ingredients': ingredients_dict, 'portions': portions_dict}}
-        recipes.update(recipe)
-        with open("recipes.json", "w") as json_file:
-            json.dump(recipes, json_file, indent=4)
-
-        # sort list so new recipe is in alphabetical order
-        alphabetize_recipes_list()
+        # nest dicts and save to the recipes store, which puts the new recipe in its alphabetical place
+        recipe_store.add_recipe(recipe_name, {'ingredients': ingredients_dict, 'portions': portions_dict})
+        recipe_costs.invalidate()
         print(f"{recipe_name} added to database!")
         return recipe_name
 
@@ -198,20 +179,13 @@ def add_recipe():
 def match_recipe_with_csv(recipe):
     # This function makes sure that any ingredient in a recipe is included in the price_list csv
 
-    with open("recipes.json", "r") as json_file:
-        recipes = json.load(json_file)
-
     # creates an ingredients' list from the recipe file
-    recipe_ingredients = []
-    for ingredient, quantity in recipes[recipe]['ingredients'].items():
-        recipe_ingredients.append(ingredient)
+    recipe_ingredients = list(recipe_repository.ingredients(recipe))
 
-    # check to see if each ingredient is in the csv_file, if it's not then add it to a missing_ingredients list
-    df = pd.read_csv('price_list.csv')
+    # check to see if each ingredient is in the price catalog, if it's not then add it to a missing_ingredients list
     missing_ingredients = []
-    ingredients_list = df['ingredient'].values
     for ingredient in recipe_ingredients:
-        if ingredient not in ingredients_list:
+        if ingredient not in price_catalog:
             missing_ingredients.append(ingredient)
 
     # if there are any missing ingredients, print what's missing and prompt the user to add them to the file
@@ -224,8 +198,7 @@ def match_recipe_with_csv(recipe):
             if choice == 'A':
                 for ingredient in missing_ingredients:
                     print(ingredient)
-                    add_ingredient(ingredient)
-                alphabetize_price_list()
+                    add_ingredient(ingredient)     ## each goes straight into its alphabetical place
                 break
             elif choice == 'B':
                 break
@@ -234,28 +207,36 @@ def match_recipe_with_csv(recipe):
 
 
 def match_entire_database():
-    # the following function checks if every ingredient in every recipe exists in the json file
-    with open("recipes.json", "r") as json_file:
-        recipes = json.load(json_file)
-        for recipe, recipe_details in recipes.items():
-            match_recipe_with_csv(recipe)
+    # the following function checks if every ingredient in every recipe exists in the price list
+    # every recipe is checked at once against the in-memory catalog, and only the ones missing something are prompted
+    table = recipe_repository.ingredient_table
+    missing = ~table['ingredient'].isin(price_catalog.ingredients())
+    for recipe in table.loc[missing, 'recipe'].unique():
+        match_recipe_with_csv(recipe)
 
 
-def calculate_recipe_cost(recipe_to_calculate):
-    with open("recipes.json", "r") as json_file:
-        recipes = json.load(json_file)
-        for recipe in recipes:
-            if recipe == recipe_to_calculate:
-                ingredients = recipes[recipe]['ingredients']
+def import_recipes(paths, replace=False, partial=False):
+    # This function imports recipes in bulk from CSV or JSON-lines files (see recipe_importer.py), printing a report
+    # of every problem found, and returns the report
+    report = RecipeImporter(price_catalog, recipe_repository, recipe_store).import_files(paths, replace, partial)
+    if report.written:
+        recipe_costs.invalidate()
+    print(report.summary())
+    return report
 
-                total_cost = 0
-                for ingredient, quantity in ingredients.items():
-                    total_cost += get_price(ingredient) * quantity
 
-                return round(total_cost, 2)
+def calculate_recipe_cost(recipe_to_calculate):
+    # This function returns the cost of one batch of a recipe
+    # (every recipe's cost is worked out at once and kept until the prices or recipes change, see recipe_costs.py)
+    if recipe_to_calculate not in recipe_repository:
+        return None
+    return round(recipe_costs.cost(recipe_to_calculate), 2)
 
 
 if __name__ == '__main__':
-    while True:
-        add_recipe()
+    if len(sys.argv) > 1:
+        import_recipes(sys.argv[1:])
+    else:
+        while True:
+            add_recipe()
 
@@ -0,0 +1,162 @@
+import numpy as np
+import pandas as pd
+from event_calculator import (arrange_shopping_list, calculate_shopping_list, calculate_total_cost,
+                              convert_to_price_units, group_ingredients, price_shopping_list, round_quantities)
+from pack_optimiser import bought_table, optimise_packs, sku_catalog
+from price_catalog import price_catalog
+from price_history import price_history
+from recipe_repository import recipe_repository
+from shop_planner import shop_planner
+
+
+class IncrementalQuote:
+    # This class keeps an event's shopping list in pieces so what-if changes don't rebuild it from scratch
+    # It holds every recipe's contribution to each ingredient and the per-ingredient totals, so changing a recipe's
+    # multiple only touches that recipe's ingredients, and changing a unit price only touches one ingredient
+    #
+    # A touched ingredient's total is re-added from its contributions in menu order rather than nudged by a delta,
+    # this keeps it bit-for-bit equal to a full rebuild (a delta can drift by a float ulp and flip a rounding up)
+    #
+    # Reading the shopping list is incremental too: every ingredient's line, its packs and its offers from each shop
+    # are kept between reads, and only the ingredients touched since the last read are priced again (the shop
+    # planner's choice of shops covers the whole list, so that alone is made again). If skus.csv or shop_prices.csv
+    # change, everything is priced again. With as_of (a date) it quotes at that day's prices, like
+    # format_shopping_list
+
+    def __init__(self, recipes_list, recipe_count, catalog=price_catalog, repository=recipe_repository,
+                 skus=sku_catalog, shops=shop_planner, as_of=None):
+        if as_of is not None:
+            catalog, skus, shops = price_history.catalog_as_of(catalog, as_of), None, None
+        self.recipes_list = list(recipes_list)
+        self.skus = skus
+        self.shops = shops
+        multiples = recipe_count.drop_duplicates('Recipe').set_index('Recipe')['Multiple']
+        self._multiples = multiples.astype(float).to_dict()
+
+        # one row per (menu recipe, ingredient), exactly as calculate_shopping_list builds it
+        rows = calculate_shopping_list(self.recipes_list, recipe_count, catalog=catalog, repository=repository)
+        # one batch of each row, in the price list's units
+        batch_rows = repository.menu_rows(self.recipes_list)
+        batch_rows['unit'] = rows['unit'].to_numpy()
+        self._batch_quantities = convert_to_price_units(batch_rows, catalog)
+        self._row_quantities = rows['quantity'].to_numpy(dtype=float, copy=True)
+
+        # per-ingredient totals, kept in the sorted order group_ingredients produces
+        self._grouped = group_ingredients(rows)
+        self._ingredient_index = {ingredient: i for i, ingredient in enumerate(self._grouped['ingredient'])}
+        self._row_ingredients = rows['ingredient'].map(self._ingredient_index).to_numpy()
+        ingredient_rows = pd.Series(self._row_ingredients).groupby(self._row_ingredients).indices
+        self._ingredient_rows = [ingredient_rows[i] for i in range(len(self._grouped))]
+        self._recipe_rows = rows.groupby('recipe', sort=False).indices
+
+        self._units = self._grouped['unit'].to_numpy()
+        self._increments = catalog.lookup_optional(self._grouped['ingredient'], 'increment', default=np.nan)
+        self._increments = self._increments.astype(float)
+        self._totals = self._grouped['quantity'].to_numpy(dtype=float, copy=True)
+        self._rounded = round_quantities(self._totals, self._units, self._increments)
+        unit_prices = catalog.lookup(self._grouped['ingredient'], ['price'])['price']
+        self._unit_prices = unit_prices.to_numpy(dtype=float, copy=True)
+        self._pack_sizes = catalog.lookup_optional(self._grouped['ingredient'], 'pack_size')
+
+        self._lines = None      ## every ingredient's line as bought from the price list, in ingredient order
+        self._packs = {}        ## {line: (quantity, price, shop, packs)} for the lines bought as packs
+        self._offers = None     ## the shop planner's (shops, costs, choices) for every line
+        self._sources = None    ## the SKU and shop price versions the above were worked out from
+        self._changed = set()   ## lines touched since the shopping list was last read
+        self._shopping_list = None
+
+    def _update_ingredient(self, i):
+        # sum the ingredient's contributions in row order (cumsum adds strictly left to right)
+        total = np.cumsum(self._row_quantities[self._ingredient_rows[i]])[-1]
+        self._totals[i] = total
+        self._rounded[i] = round_quantities([total], [self._units[i]], [self._increments[i]])[0]
+        self._changed.add(i)
+
+    def set_multiple(self, recipe, multiple):
+        # This function changes how many batches of a recipe are made, in time proportional to its ingredient count
+
+        rows = self._recipe_rows[recipe]
+        self._multiples[recipe] = float(multiple)
+        self._row_quantities[rows] = self._batch_quantities[rows] * float(multiple)
+        for i in np.unique(self._row_ingredients[rows]):
+            self._update_ingredient(i)
+
+    def set_multiples(self, changes):
+        # This function applies a {recipe: new_multiple} dict of changes, raising KeyError (before changing
+        # anything) if a recipe isn't on the menu
+        for recipe in changes:
+            if recipe not in self._recipe_rows:
+                raise KeyError(recipe)
+        for recipe, multiple in changes.items():
+            self.set_multiple(recipe, multiple)
+
+    def set_unit_price(self, ingredient, price):
+        # This function changes the unit price of one ingredient for this quote only (the price list is untouched)
+        # It is the price at the ingredient's price list shop, so a line bought as packs or at another shop keeps its
+        # price unless the shop planner now finds the price list's shop cheaper (without a planner, packs are always
+        # bought when they can cover the quantity)
+        i = self._ingredient_index[ingredient]
+        self._unit_prices[i] = float(price)
+        self._changed.add(i)
+
+    @property
+    def recipe_count(self):
+        # the current multiples, in the same shape estimate_recipe_quantities returns
+        return pd.DataFrame({"Recipe": list(self._multiples), "Multiple": list(self._multiples.values())})
+
+    @property
+    def shopping_list(self):
+        # the formatted shopping list, identical to format_shopping_list on a full rebuild
+        sources = (bool(self.skus) and self.skus.version, bool(self.shops) and self.shops.version)
+        if sources != self._sources:
+            self._lines, self._packs, self._offers = None, {}, None
+            self._changed = set(range(len(self._grouped)))
+            self._sources = sources
+        if self._changed or self._shopping_list is None:
+            lines = np.array(sorted(self._changed), dtype=np.int64)
+            self._changed = set()
+            self._shopping_list = arrange_shopping_list(self._lines_for(lines).copy(), self._bought(lines))
+        return self._shopping_list
+
+    def _lines_for(self, lines):
+        # price the given lines from the price list, and return every line
+        grouped = self._grouped.iloc[lines].copy()
+        grouped['quantity'] = self._totals[lines]
+        priced = price_shopping_list(grouped, self._rounded[lines], self._unit_prices[lines], len(self.recipes_list))
+        if self._lines is None:
+            self._lines = priced.reset_index(drop=True)
+        else:
+            for column in ('quantity', 'price'):
+                values = self._lines[column].to_numpy(copy=True)
+                values[lines] = priced[column].to_numpy()
+                self._lines[column] = values
+        return self._lines
+
+    def _bought(self, lines):
+        # work out the packs or shop offers of the given lines again, and return what every line is bought as
+        uses_skus, uses_shops = self._sources
+        if uses_shops:
+            changed = self._lines.iloc[lines]
+            if self._offers is None:
+                self._offers = self.shops.offers(changed, self._totals[lines], self._rounded[lines], self.skus,
+                                                 self._pack_sizes[lines])
+            else:
+                shops, costs, choices = self._offers
+                _, line_costs, line_choices = self.shops.offers(changed, self._totals[lines], self._rounded[lines],
+                                                                self.skus, self._pack_sizes[lines], shops)
+                costs[lines] = line_costs
+                for line, choice in zip(lines, line_choices):
+                    choices[line] = choice
+            return self.shops.choose(self._lines['shop'], *self._offers)
+        if uses_skus:
+            changed = self._lines.iloc[lines].assign(quantity=self._totals[lines])
+            packs = optimise_packs(changed, self.skus, self._pack_sizes[lines])
+            for line in lines:
+                self._packs.pop(line, None)
+            for position, bought in zip(packs.index, packs.itertuples(index=False)):
+                self._packs[int(lines[position])] = tuple(bought)
+            return bought_table([(line, *bought) for line, bought in sorted(self._packs.items())])
+        return None
+
+    def total_cost(self):
+        return calculate_total_cost(self.shopping_list)
@@ -0,0 +1,122 @@
+import argparse
+import heapq
+import numpy as np
+from event_calculator import print_shopping_list, quote_event
+from recipe_costs import recipe_costs
+
+
+class MenuPlanner:
+    # This class suggests menus for an event from the whole recipe book, instead of typing the dishes in and only
+    # seeing the cost afterwards
+    # Every dish's cost for the event (its estimated multiple times the cost of one batch, see recipe_costs.py) is
+    # worked out at once, then a branch-and-bound search finds the cheapest dish combinations: dishes are tried
+    # cheapest first, and a branch is dropped as soon as the cheapest way to finish it goes over the budget or can't
+    # beat the menus already found. The shortlist is then quoted in full (rounding, packs, shops), and any
+    # menu that goes over the budget once quoted properly is dropped
+
+    def __init__(self, costs=recipe_costs):
+        self.costs = costs
+        self.repository = costs.repository
+        self.catalog = costs.catalog
+
+    def dish_costs(self, guest_count, event_type):
+        # This function returns the estimated cost of every dish that can be served at the event, as a Series
+        # (the multiples are rounded to the nearest half batch, exactly as estimate_recipe_quantities does)
+        portions = self.repository.portions
+        if event_type not in portions.columns:
+            raise KeyError(event_type)
+        batch_costs = self.costs.costs()
+        portion_sizes = portions[event_type].reindex(batch_costs.index).to_numpy(dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            multiples = np.round(guest_count * 2 / portion_sizes) / 2
+        dish_costs = batch_costs * multiples
+        return dish_costs[dish_costs.notna()]
+
+    def search(self, guest_count, event_type, budget, dishes, must_include=(), exclude=(), top=5):
+        # This function returns the `top` cheapest menus of `dishes` dishes within the budget, by estimated cost,
+        # as [(estimated cost, [dishes])], cheapest first
+
+        dish_costs = self.dish_costs(guest_count, event_type)
+        must_include = list(dict.fromkeys(must_include))
+        unknown = [dish for dish in must_include if dish not in dish_costs.index]
+        if unknown:
+            raise KeyError(unknown[0])
+        if len(must_include) > dishes:
+            raise ValueError(f"{len(must_include)} dishes must be included but the menu only has {dishes}")
+
+        base_cost = float(dish_costs[must_include].sum())
+        candidates = dish_costs.drop(must_include + [dish for dish in exclude if dish in dish_costs.index])
+        candidates = candidates.sort_values(kind='stable')
+        names = candidates.index.to_list()
+        costs = candidates.to_numpy(dtype=float)
+        needed = dishes - len(must_include)
+        if needed > len(costs) or base_cost > budget:
+            return []
+
+        # with the dishes cheapest first, the cheapest way to finish a menu from any position is the next few dishes,
+        # which the prefix sums give in O(1)
+        prefix = np.concatenate([[0.0], np.cumsum(costs)])
+        kept = []   ## heap of (-cost, order found, cost, dishes), the dearest kept menu on top
+
+        def branch(start, chosen, cost):
+            left = needed - len(chosen)
+            if left == 0:
+                menu = (-cost, -len(kept), cost, chosen)
+                if len(kept) < top:
+                    heapq.heappush(kept, menu)
+                elif menu[0] > kept[0][0]:
+                    heapq.heapreplace(kept, menu)
+                return
+
+            for position in range(start, len(costs) - left + 1):
+                bound = cost + prefix[position + left] - prefix[position]
+                # dishes only get dearer from here on, so nothing further along can do better
+                if bound > budget or (len(kept) == top and bound >= kept[0][2]):
+                    break
+                branch(position + 1, chosen + [names[position]], cost + costs[position])
+
+        branch(0, [], base_cost)
+        return [(cost, must_include + chosen) for _, _, cost, chosen in sorted(kept, reverse=True)]
+
+    def plan(self, guest_count, event_type, budget, dishes, must_include=(), exclude=(), top=5, shortlist=None):
+        # This function returns the `top` cheapest menus within the budget, each quoted in full, as
+        # {'recipes_list', 'estimate', 'shopping_list', 'total_cost'} dicts, cheapest first
+        # The search shortlists more menus than asked for (estimates leave out rounding up to what can be bought),
+        # and they are ranked again on their quoted totals
+
+        shortlist = shortlist or max(4 * top, 20)
+        menus = []
+        for estimate, recipes_list in self.search(guest_count, event_type, budget, dishes, must_include, exclude,
+                                                  shortlist):
+            shopping_list, total_cost = quote_event(guest_count, recipes_list, event_type,
+                                                    catalog=self.catalog, repository=self.repository)
+            if total_cost <= budget:
+                menus.append({'recipes_list': recipes_list, 'estimate': round(estimate, 2),
+                              'shopping_list': shopping_list, 'total_cost': total_cost})
+        menus.sort(key=lambda menu: menu['total_cost'])
+        return menus[:top]
+
+
+# shared planner, pricing with the shared recipe costs
+menu_planner = MenuPlanner()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Suggest menus for an event that fit within a budget")
+    parser.add_argument('guest_count', type=int)
+    parser.add_argument('event_type')
+    parser.add_argument('budget', type=float)
+    parser.add_argument('--dishes', type=int, default=4, help="how many dishes on the menu")
+    parser.add_argument('--include', default='', help="comma separated dishes that must be on the menu")
+    parser.add_argument('--exclude', default='', help="comma separated dishes to leave out")
+    parser.add_argument('--top', type=int, default=3, help="how many menus to suggest")
+    args = parser.parse_args()
+
+    split = lambda dishes: [dish.strip().lower() for dish in dishes.split(',') if dish.strip()]
+    menus = menu_planner.plan(args.guest_count, args.event_type.lower(), args.budget, args.dishes,
+                              split(args.include), split(args.exclude), args.top)
+    if not menus:
+        print("No menu fits within the budget")
+    for number, menu in enumerate(menus, 1):
+        print(f"\nMenu {number}: {', '.join(menu['recipes_list'])}\n")
+        print_shopping_list(menu['shopping_list'], menu['total_cost'])
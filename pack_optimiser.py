@@ -0,0 +1,206 @@
+import logging
+import math
+import os
+from functools import reduce
+import numpy as np
+import pandas as pd
+from cached_file import CachedFile
+from units import parse_quantity, unit_registry
+
+
+SKUS_PATH = os.environ.get('EVENT_CALCULATOR_SKUS', 'skus.csv')
+
+# sizes are worked in thousandths of the price list's unit (grams for kg, ml for l), enough for any real pack
+RESOLUTION = 1000
+
+# how many solutions cheapest() remembers before it forgets the oldest
+SOLUTIONS_LIMIT = 4096
+
+
+class SkuCatalog(CachedFile):
+    # This class holds the products (SKUs) each ingredient can be bought as, read from skus.csv:
+    #
+    #     ingredient,sku,pack_size,price,shop[,available]
+    #     tahini,Al Kanater Tahini 1kg,1 kg,7.47,yasar halim
+    #     tahini,Tahini 454g,454g,3.99,waitrose,4
+    #
+    # pack_size is a bare number in the price list's unit for the ingredient, or an amount with its own unit, and
+    # price is the price of one pack; available optionally caps how many packs can be bought
+    # Ingredients without SKUs keep being bought by the price list's unit price. The file is re-read when it changes,
+    # like the PriceCatalog, and a missing file simply means there are no SKUs
+
+    missing_ok = True
+
+    def __init__(self, path=SKUS_PATH):
+        super().__init__(path)
+        self._table = None
+        self._solutions = {}
+        self._by_ingredient = {}
+
+    def refresh(self):
+        # This function reloads the file if it has changed since it was last read, and returns the table
+        super().refresh()
+        return self._table
+
+    def _load(self, stamp):
+        columns = ['ingredient', 'sku', 'pack_size', 'price', 'shop', 'available']
+        self._table = pd.read_csv(self.path).reindex(columns=columns) if stamp is not None \
+            else pd.DataFrame(columns=columns)
+        self._by_ingredient = dict(tuple(self._table.groupby('ingredient', sort=False)))
+        self._solutions = {}
+
+    @property
+    def table(self):
+        return self.refresh()
+
+    def __bool__(self):
+        return len(self.table) > 0
+
+    def __contains__(self, ingredient):
+        self.refresh()
+        return ingredient in self._by_ingredient
+
+    def skus(self, ingredient):
+        self.refresh()
+        return self._by_ingredient[ingredient]
+
+    def cheapest(self, ingredient, quantity, unit, shop=None, pack_size=None):
+        # This function returns the cheapest combination of an ingredient's SKUs covering quantity (in unit, the price
+        # list's unit for it) as (cost, amount bought, shops, {sku: packs}), or None if it has no SKUs
+        # (with shop, only that shop's SKUs are used, see shop_planner.py; pack_size is the price list's pack_size for
+        # the ingredient, needed when SKUs are sized by weight and the price list counts items, or the other way)
+        # It raises ValueError if the SKUs can't cover the quantity or be converted into unit
+        # Solutions are remembered per (ingredient, quantity), as quotes ask for the same totals again and again,
+        # up to SOLUTIONS_LIMIT of them
+
+        key = (ingredient, float(quantity), unit, shop, pack_size)
+        if ingredient not in self:
+            return None
+        if key not in self._solutions:
+            skus = self.skus(ingredient)
+            if shop is not None:
+                skus = skus[skus['shop'] == shop]
+                if skus.empty:
+                    return None
+            sizes = np.array([pack_amount(size, unit, pack_size) for size in skus['pack_size'].astype(str)])
+            available = skus['available'].to_numpy(dtype=float)
+            counts, cost = cheapest_packs(quantity, sizes, skus['price'].to_numpy(dtype=float), available)
+            bought = counts > 0
+            if len(self._solutions) >= SOLUTIONS_LIMIT:
+                self._solutions.pop(next(iter(self._solutions)))
+            self._solutions[key] = (
+                cost,
+                float(np.round(counts @ sizes, 6)),
+                sorted(set(skus['shop'].to_numpy()[bought])),
+                dict(zip(skus['sku'].to_numpy()[bought], counts[bought].tolist())),
+            )
+        return self._solutions[key]
+
+    def shops(self, ingredient):
+        # This function returns the shops that sell an ingredient as SKUs
+        return sorted(set(self.skus(ingredient)['shop'])) if ingredient in self else []
+
+
+def pack_amount(size, unit, pack_size=None):
+    # This function returns how much of unit one pack holds, size being a bare number (already in unit) or an amount
+    # with its own unit (pack_size being the price list's pack_size, for converting between counted and weighed units)
+    amount, size_unit = parse_quantity(size)
+    return amount * unit_registry.factor(size_unit, unit, pack_size) if size_unit is not None else amount
+
+
+def cheapest_packs(quantity, sizes, prices, available=None):
+    # This function solves the covering knapsack for one ingredient: how many of each pack to buy so the packs hold at
+    # least quantity, for the least money. It returns (counts per pack, total cost)
+    #
+    # Sizes are scaled to whole numbers and divided by their gcd, so the table is only as long as the quantity
+    # measured in the largest step every pack size is a multiple of. Each pack's count is split into 1, 2, 4, ...
+    # bundles (binary splitting), which turns the bounded knapsack into a 0/1 one, and every bundle updates the whole
+    # table in one vectorized step: best[c] = min(best[c], best[c - bundle size] + bundle price)
+
+    sizes = np.asarray(sizes, dtype=float)
+    prices = np.asarray(prices, dtype=float)
+    available = np.full(len(sizes), np.nan) if available is None else np.asarray(available, dtype=float)
+
+    steps = np.maximum(np.rint(sizes * RESOLUTION).astype(np.int64), 1)
+    grain = reduce(math.gcd, steps.tolist())
+    steps = steps // grain
+    needed = math.ceil(round(quantity * RESOLUTION / grain, 9))
+    if needed <= 0:
+        return np.zeros(len(sizes), dtype=np.int64), 0.0
+
+    # no point going past the quantity by more than the largest pack
+    capacity = needed + int(steps.max()) - 1
+    best = np.full(capacity + 1, np.inf)
+    best[0] = 0.0
+
+    bundles = []     ## (pack, how many packs in the bundle)
+    for pack, (step, limit) in enumerate(zip(steps, available)):
+        most = capacity // step if np.isnan(limit) else min(int(limit), capacity // step)
+        count = 1
+        while most > 0:
+            bundles.append((pack, min(count, most)))
+            most -= min(count, most)
+            count *= 2
+
+    taken = np.zeros((len(bundles), capacity + 1), dtype=bool)
+    for i, (pack, count) in enumerate(bundles):
+        weight, price = int(steps[pack]) * count, prices[pack] * count
+        if weight > capacity:
+            continue
+        candidate = best[:capacity + 1 - weight] + price
+        improved = candidate < best[weight:]
+        best[weight:][improved] = candidate[improved]
+        taken[i, weight:] = improved
+
+    reached = needed + int(np.argmin(best[needed:]))
+    if not np.isfinite(best[reached]):
+        raise ValueError("the available packs can't cover the quantity needed")
+
+    # walk back through the bundles to see which were used
+    counts = np.zeros(len(sizes), dtype=np.int64)
+    c = reached
+    for i in range(len(bundles) - 1, -1, -1):
+        if taken[i, c]:
+            pack, count = bundles[i]
+            counts[pack] += count
+            c -= int(steps[pack]) * count
+    return counts, float(counts @ prices)
+
+
+def optimise_packs(shopping_list, skus, pack_sizes=None):
+    # This function picks the cheapest packs for every ingredient of a grouped shopping list that has SKUs
+    # (quantity being the unrounded total, pack_sizes the price list's pack_size of each row) and returns a table of
+    # the ones it priced: quantity bought, price, shop and the packs, indexed by position in the shopping list
+    # An ingredient whose SKUs can't cover its quantity is left out, so it stays at the price list's unit price
+
+    pack_sizes = [None] * len(shopping_list) if pack_sizes is None else pack_sizes
+    rows = []
+    for position, (ingredient, quantity, unit, pack_size) in enumerate(zip(
+            shopping_list['ingredient'], shopping_list['quantity'], shopping_list['unit'], pack_sizes)):
+        try:
+            solution = skus.cheapest(ingredient, quantity, unit, pack_size=pack_size)
+        except ValueError as error:
+            logging.warning(f"{ingredient}: {error}, priced by the price list instead")
+            continue
+        if solution is not None:
+            rows.append((position, *pack_row(solution, unit)))
+    return bought_table(rows)
+
+
+def bought_table(rows):
+    # This function lays out (position, quantity, price, shop, packs) rows as the table optimise_packs returns
+    columns = ['position', 'quantity', 'price', 'shop', 'packs']
+    return pd.DataFrame({column: pd.Series(values, dtype=object) for column, values in zip(columns, zip(*rows))}
+                        if rows else None, columns=columns).set_index('position')
+
+
+def pack_row(solution, unit):
+    # This function lays out a cheapest() solution as the shopping list shows it: (quantity, price, shop, packs)
+    cost, bought, shops, packs = solution
+    if unit != "kg" and bought == int(bought):
+        bought = int(bought)    ## whole units print without a decimal place, as in finish_shopping_list
+    return bought, round(cost, 2), ", ".join(shops), ", ".join(f"{count} x {sku}" for sku, count in packs.items())
+
+
+# shared SKU list used by format_shopping_list
+sku_catalog = SkuCatalog()
@@ -0,0 +1,168 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import Counter
+from file_lock import atomic_write, file_lock
+
+
+class PageCache:
+    # This class keeps the product pages the scrapers fetch on disk, so they can be parsed again without a browser
+    # Pages are stored content-addressed (blobs/<sha256>.html.gz, identical pages share one blob), and index.json maps
+    # each (shop, ingredient) to its latest page, with when it was fetched and last used
+    #
+    # get() only returns pages younger than ttl seconds, so a re-run soon after a scrape skips the shop's website,
+    # while entries() returns every page regardless of age, for replaying the parsers over them
+    # Once there are more than max_pages pages or max_bytes of blobs, the least recently used are evicted
+    # Several scraper runs can share the cache: the index is only changed under its file_lock, after merging in what
+    # the other runs have saved, so one run neither loses the other's pages nor evicts a blob the other still uses
+
+    def __init__(self, directory='page_cache', ttl=24 * 60 * 60, max_pages=5000, max_bytes=500 * 2 ** 20):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(directory, 'index.json')
+        self._index = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(shop, ingredient):
+        return f"{shop}/{ingredient}"
+
+    def _blob_path(self, digest):
+        return os.path.join(self.directory, 'blobs', digest + '.html.gz')
+
+    def _read_index(self):
+        try:
+            with open(self.index_path, 'r') as index_file:
+                return json.load(index_file)
+        except FileNotFoundError:
+            return {}
+
+    def _load(self):
+        if self._index is None:
+            self._index = self._read_index()
+        return self._index
+
+    def _merge_saved(self):
+        # another scraper run may have added or evicted pages since the index was read, so before it is changed and
+        # saved (holding the index's file_lock) it is brought up to date with the saved one: the saved entries are
+        # kept, with the later last_used of any page this run has used since, and pages evicted there are dropped
+        saved = self._read_index()
+        for key, entry in (self._index or {}).items():
+            if key in saved and saved[key]['digest'] == entry['digest']:
+                saved[key]['last_used'] = max(saved[key]['last_used'], entry['last_used'])
+        self._index = saved
+        return saved
+
+    def _save(self):
+        # (the caller holds the index's file_lock)
+        with atomic_write(self.index_path) as index_file:
+            json.dump(self._index, index_file, indent=1)
+
+    def get(self, shop, ingredient, max_age=None):
+        # This function returns the cached html of an ingredient's page, or None if there isn't one young enough
+        page = self.get_page(shop, ingredient, max_age)
+        return page[0] if page is not None else None
+
+    def get_page(self, shop, ingredient, max_age=None):
+        # This function returns (html, when it was fetched) for an ingredient's cached page, or None if there isn't
+        # one younger than max_age seconds (the ttl by default)
+
+        max_age = self.ttl if max_age is None else max_age
+        with self._lock:
+            entry = self._load().get(self.key(shop, ingredient))
+            if entry is None or time.time() - entry['fetched_at'] > max_age:
+                return None
+            entry['last_used'] = time.time()    ## saved along with the next put
+        html = self.read(entry)
+        return (html, entry['fetched_at']) if html is not None else None
+
+    def read(self, entry):
+        # This function returns the html of an index entry, or None if its blob has gone missing
+        try:
+            with gzip.open(self._blob_path(entry['digest']), 'rt', encoding='utf-8') as blob:
+                return blob.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, shop, ingredient, html, url=None):
+        # This function stores a freshly fetched page as the ingredient's latest
+
+        data = html.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        blob_path = self._blob_path(digest)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+
+        # the blob is written under the lock too, so another put's eviction can't remove it before it is indexed
+        with self._lock, file_lock(self.index_path):
+            if not os.path.exists(blob_path):
+                with atomic_write(blob_path, 'wb') as blob:
+                    blob.write(gzip.compress(data))
+            now = time.time()
+            old = self._merge_saved().get(self.key(shop, ingredient))
+            self._index[self.key(shop, ingredient)] = {
+                'shop': shop,
+                'ingredient': ingredient,
+                'url': url,
+                'digest': digest,
+                'size': os.path.getsize(blob_path),
+                'fetched_at': now,
+                'last_used': now,
+            }
+            if old is not None and old['digest'] != digest:
+                self._remove_blob_if_unused(old['digest'])
+            self._evict()
+            self._save()
+
+    def entries(self, shops=None):
+        # This function returns the index entries of every cached page (optionally only for some shops)
+        with self._lock:
+            return [dict(entry) for entry in self._load().values() if shops is None or entry['shop'] in shops]
+
+    def _evict(self):
+        # drop the least recently used pages until the cache is back within max_pages and max_bytes
+        index = self._index
+        blob_sizes = {entry['digest']: entry['size'] for entry in index.values()}
+        references = Counter(entry['digest'] for entry in index.values())
+        total_bytes = sum(blob_sizes.values())
+        if len(index) <= self.max_pages and total_bytes <= self.max_bytes:
+            return
+
+        for key in sorted(index, key=lambda key: index[key]['last_used']):
+            if len(index) <= self.max_pages and total_bytes <= self.max_bytes:
+                break
+            digest = index.pop(key)['digest']
+            references[digest] -= 1
+            if references[digest] == 0:     ## no other page shares the blob
+                total_bytes -= blob_sizes[digest]
+                self._remove_blob(digest)
+
+    def _remove_blob(self, digest):
+        try:
+            os.remove(self._blob_path(digest))
+        except FileNotFoundError:
+            pass
+
+    def _remove_blob_if_unused(self, digest):
+        if not any(entry['digest'] == digest for entry in self._index.values()):
+            self._remove_blob(digest)
+
+    def clear(self):
+        # This function empties the cache
+        with self._lock:
+            if not os.path.isdir(self.directory):
+                self._index = {}
+                return
+            with file_lock(self.index_path):
+                for entry in self._merge_saved().values():
+                    self._remove_blob(entry['digest'])
+                self._index = {}
+                self._save()
+
+
+# shared cache the scrapers store their product pages in
+page_cache = PageCache()
@@ -0,0 +1,100 @@
+import logging
+import numpy as np
+import pandas as pd
+from cached_file import CachedFile
+from price_schema import ValidationReport, validate_price_table
+from storage import PRICE_LIST_PATH, read_price_table
+
+
+class PriceCatalog(CachedFile):
+    # This class keeps the price list in memory, indexed by ingredient, so lookups don't re-read the file
+    # (the path can be the csv file or a SQLite database, see storage.py)
+    # The file's modification time is checked on every access, and the table is reloaded if it has changed,
+    # this way edits made by the scrapers (or by hand) show up without restarting the program
+    # Every load is checked against the price list's schema (see price_schema.py), the bad rows are logged and the
+    # report is kept in validation
+
+    def __init__(self, path=PRICE_LIST_PATH):
+        super().__init__(path)
+        self._table = None
+        self._validation = None
+
+    def refresh(self):
+        # This function reloads the csv file if it has changed since it was last read (see cached_file.py), and
+        # returns the table
+        super().refresh()
+        return self._table
+
+    def _load(self, stamp):
+        self._table = read_price_table(self.path)
+        self._validate()
+
+    def _validate(self):
+        self._validation = validate_price_table(self._table)
+        if not self._validation.ok:
+            logging.warning(f"Price list {self.path}: {self._validation.summary()}")
+
+    def record_insert(self, position, ingredient, fields):
+        # This function adds a row the price store has just inserted into the file at position to the in-memory
+        # table too, so one new row doesn't make the next lookup re-read the whole file
+        table = self._table
+        row = pd.DataFrame([fields], index=pd.Index([ingredient], name=table.index.name)).reindex(columns=table.columns)
+        self._table = pd.concat([table.iloc[:position], row, table.iloc[position:]])
+        self._record_write()
+
+        # only the new row needs checking, the rest was checked when the table was loaded
+        new_errors = validate_price_table(self._table.iloc[[position]]).errors.assign(row=position)
+        if ingredient in table.index:
+            new_errors.loc[len(new_errors)] = [position, ingredient, 'ingredient', ingredient, "is listed more than once"]
+        errors = self._validation.errors
+        errors = errors.assign(row=errors['row'] + (errors['row'] >= position))
+        if not new_errors.empty:
+            logging.warning(f"Price list {self.path}: {ValidationReport(new_errors, 1).summary()}")
+            errors = pd.concat([errors, new_errors]).sort_values('row', kind='stable', ignore_index=True)
+        self._validation = ValidationReport(errors, len(self._table))
+
+    @property
+    def table(self):
+        return self.refresh()
+
+    @property
+    def validation(self):
+        # the ValidationReport of the table as it is now
+        self.refresh()
+        return self._validation
+
+    def __contains__(self, ingredient):
+        return ingredient in self.table.index
+
+    def ingredients(self):
+        # This function returns every ingredient in the catalog
+        return self.table.index.values
+
+    def get(self, ingredient, column):
+        # This function returns a single value for an ingredient, raising KeyError if it is not in the catalog
+        return self.table.at[ingredient, column]
+
+    def get_unit(self, ingredient):
+        return self.get(ingredient, 'unit')
+
+    def get_price(self, ingredient):
+        return self.get(ingredient, 'price')
+
+    def get_shop(self, ingredient):
+        return self.get(ingredient, 'shop')
+
+    def lookup(self, ingredients, columns):
+        # This function returns the given columns for a whole list of ingredients at once (in the same order)
+        return self.table.loc[list(ingredients), list(columns)]
+
+    def lookup_optional(self, ingredients, column, default=None):
+        # This function returns a column the price list may not have (e.g. pack_size) for a list of ingredients,
+        # as an array, with default wherever the column or the value is missing
+        if column not in self.table.columns:
+            return np.full(len(ingredients), default, dtype=object)
+        values = self.table.loc[list(ingredients), column].to_numpy(dtype=object)
+        return np.where(pd.isna(values), default, values)
+
+
+# shared catalog used by file_manager and event_calculator
+price_catalog = PriceCatalog()
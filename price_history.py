@@ -0,0 +1,274 @@
+import argparse
+import io
+import os
+from datetime import date, datetime, time
+import numpy as np
+import pandas as pd
+from file_lock import file_lock
+from price_catalog import PriceCatalog, price_catalog
+from refresh_planner import ingredient_ages
+
+
+PRICE_HISTORY_PATH = os.environ.get('EVENT_CALCULATOR_PRICE_HISTORY', 'price_history.csv')
+
+HISTORY_COLUMNS = ['ingredient', 'price', 'unit', 'shop', 'recorded']
+
+# a history key is (ingredient code << KEY_SHIFT) + seconds since 1970, so sorting the keys sorts by ingredient, then
+# by time, and every ingredient's series is one contiguous run of the arrays
+KEY_SHIFT = 35
+
+
+def to_seconds(when):
+    # This function turns a date, datetime or iso string into seconds since 1970
+    # a date (or a yyyy-mm-dd string) means the end of that day, so everything recorded on the day counts
+    if isinstance(when, str):
+        when = date.fromisoformat(when) if len(when) == 10 else datetime.fromisoformat(when)
+    if not isinstance(when, datetime):
+        when = datetime.combine(when, time.max)
+    return int(np.datetime64(when.replace(microsecond=0), 's').astype(np.int64))
+
+
+class PriceHistory:
+    # This class keeps every price the price list has held, so an old event can be re-quoted at the prices of the day
+    # The history is an append-only csv file, one line per recorded price:
+    #
+    #     ingredient,price,unit,shop,recorded
+    #     tahini,7.47,kg,yasar halim,2024-03-05T10:12:44
+    #
+    # In memory it is held as sorted arrays (key, price, unit, shop), every ingredient's series a contiguous slice of
+    # them, so "price as of a date" is a binary search, and for a whole shopping list one np.searchsorted
+    # As lines are only ever appended, a refresh parses just the lines added since the last one and merges them in
+
+    def __init__(self, path=PRICE_HISTORY_PATH):
+        self.path = path
+        self.version = 0
+        self._as_of_catalogs = {}
+        self._clear()
+
+    def _clear(self):
+        self._names = pd.Index([], dtype=object)    ## ingredient of each code
+        self._keys = np.zeros(0, dtype=np.int64)
+        self._prices = np.zeros(0, dtype=float)
+        self._units = np.zeros(0, dtype=object)
+        self._shops = np.zeros(0, dtype=object)
+        self._read = (None, 0)      ## (inode, bytes) of the file already merged in
+
+    def refresh(self):
+        # This function merges in any lines appended to the file since it was last read
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return self
+        inode, read = self._read
+        if stat.st_ino != inode or stat.st_size < read:
+            self._clear()       ## the file was replaced, start again
+            self.version += 1
+            read = 0
+        if stat.st_size == read:
+            return self
+
+        with open(self.path, 'rb') as history_file:
+            history_file.seek(read)
+            data = history_file.read(stat.st_size - read)
+        data = data[:data.rfind(b'\n') + 1]     ## a line still being written is left for next time
+        self._merge(data if read else data[data.find(b'\n') + 1:])     ## skipping the header
+        self._read = (stat.st_ino, read + len(data))
+        return self
+
+    def _merge(self, data):
+        if not data:
+            return
+        rows = pd.read_csv(io.BytesIO(data), names=HISTORY_COLUMNS, header=None,
+                           dtype={'ingredient': object, 'unit': object, 'shop': object})
+        seconds = pd.to_datetime(rows['recorded'], format='ISO8601').to_numpy().astype('datetime64[s]').astype(np.int64)
+
+        new_names = pd.Index(rows['ingredient'].unique()).difference(self._names, sort=False)
+        self._names = self._names.append(new_names)
+        keys = (self._names.get_indexer(rows['ingredient']).astype(np.int64) << KEY_SHIFT) + seconds
+
+        # the new lines are sorted and slotted in after any equal keys, so a later line wins a tie
+        order = np.argsort(keys, kind='stable')
+        positions = np.searchsorted(self._keys, keys[order], side='right')
+        self._keys = np.insert(self._keys, positions, keys[order])
+        self._prices = np.insert(self._prices, positions, rows['price'].to_numpy(dtype=float)[order])
+        self._units = np.insert(self._units, positions, rows['unit'].to_numpy(dtype=object)[order])
+        self._shops = np.insert(self._shops, positions, rows['shop'].to_numpy(dtype=object)[order])
+        self.version += 1
+
+    def __len__(self):
+        return len(self.refresh()._keys)
+
+    def record(self, rows, when=None):
+        # This function appends prices to the history, rows being a table of price, unit and shop indexed by
+        # ingredient (as the catalog holds them), recorded now or at when (one time, or one per row)
+        if len(rows) == 0:
+            return
+        when = datetime.now() if when is None else when
+        if not pd.api.types.is_list_like(when):
+            when = [when] * len(rows)
+        recorded = np.datetime_as_string(pd.to_datetime(pd.Series(when)).to_numpy().astype('datetime64[s]'))
+        lines = pd.DataFrame({'ingredient': rows.index, 'price': rows['price'].to_numpy(),
+                              'unit': rows['unit'].to_numpy(), 'shop': rows['shop'].to_numpy(), 'recorded': recorded})
+
+        with file_lock(self.path):
+            new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            with open(self.path, 'a', newline='') as history_file:
+                lines.to_csv(history_file, header=new_file, index=False)
+                history_file.flush()
+                os.fsync(history_file.fileno())
+
+    def _positions(self, ingredients, seconds):
+        # the row of each ingredient's latest price at or before seconds, -1 where it has none
+        codes = self._names.get_indexer(pd.Index(ingredients, dtype=object)).astype(np.int64)
+        positions = np.searchsorted(self._keys, (codes << KEY_SHIFT) + seconds, side='right') - 1
+        found = (codes >= 0) & (positions >= 0)
+        found[found] &= (self._keys[positions[found]] >> KEY_SHIFT) == codes[found]
+        return np.where(found, positions, -1)
+
+    def _take(self, values, positions, missing):
+        # values at positions, missing where a position is -1
+        if not len(values):
+            return np.full(len(positions), missing, dtype=values.dtype)
+        return np.where(positions >= 0, values[positions], missing)
+
+    def prices_as_of(self, ingredients, when):
+        # This function returns the price, unit and shop every ingredient had at when, and when it was recorded,
+        # as a table indexed by ingredient (NaN where the history has nothing for it that early)
+        self.refresh()
+        positions = self._positions(ingredients, to_seconds(when))
+        seconds = self._take(self._keys & ((1 << KEY_SHIFT) - 1), positions, 0)
+        return pd.DataFrame({
+            'price': self._take(self._prices, positions, np.nan),
+            'unit': self._take(self._units, positions, None),
+            'shop': self._take(self._shops, positions, None),
+            'recorded': pd.Series(seconds.astype('datetime64[s]')).where(positions >= 0).to_numpy(),
+        }, index=pd.Index(ingredients, name='ingredient'))
+
+    def series(self, ingredient):
+        # This function returns every price recorded for an ingredient, oldest first
+        self.refresh()
+        code = self._names.get_indexer([ingredient])[0]
+        if code < 0:
+            raise KeyError(ingredient)
+        start, end = np.searchsorted(self._keys, [code << KEY_SHIFT, (code + 1) << KEY_SHIFT])
+        return pd.DataFrame({
+            'recorded': (self._keys[start:end] & ((1 << KEY_SHIFT) - 1)).astype('datetime64[s]'),
+            'price': self._prices[start:end],
+            'unit': self._units[start:end],
+            'shop': self._shops[start:end],
+        })
+
+    def trend(self, ingredients, dates):
+        # This function returns the price of every ingredient at every date, as an ingredients x dates table
+        self.refresh()
+        ingredients = list(ingredients)
+        trend = {}
+        for when in dates:
+            trend[when] = self._take(self._prices, self._positions(ingredients, to_seconds(when)), np.nan)
+        return pd.DataFrame(trend, index=pd.Index(ingredients, name='ingredient'))
+
+    def table_as_of(self, table, when):
+        # This function returns a price table (as the catalog holds it) with the price, unit and shop every
+        # ingredient had at when; ingredients the history knows nothing about that early are left out
+        prices = self.prices_as_of(table.index, when)
+        known = prices['price'].notna().to_numpy()
+        table = table[known].copy()
+        for column in ('price', 'unit', 'shop'):
+            table[column] = prices[column].to_numpy()[known]
+        return table
+
+    def catalog_as_of(self, catalog, when):
+        # This function returns a catalog that looks up the prices of when, for quoting with
+        key = (catalog.path, to_seconds(when))
+        if key not in self._as_of_catalogs:
+            if len(self._as_of_catalogs) >= 8:
+                self._as_of_catalogs.pop(next(iter(self._as_of_catalogs)))
+            self._as_of_catalogs[key] = PriceCatalogAsOf(catalog, self, when)
+        return self._as_of_catalogs[key]
+
+    def seed(self, catalog=price_catalog, today=None):
+        # This function records the price list's current prices for every ingredient with no history yet, dated by
+        # its last_update (the latest such day on or before today), so the history has somewhere to start from
+        self.refresh()
+        table = catalog.table
+        table = table[self._names.get_indexer(table.index) < 0]
+        today = pd.Timestamp(today or datetime.now().date())
+        ages = ingredient_ages(table['last_update'].to_numpy(), today)
+        days = np.where(np.isfinite(ages), ages, 0)
+        self.record(table, list(today - pd.to_timedelta(days, unit='D')))
+        return len(table)
+
+
+class PriceCatalogAsOf(PriceCatalog):
+    # A read-only catalog holding the price list as it was at a moment: every column as the price list has it now,
+    # except price, unit and shop, which come from the price history
+    # It follows both the price list and the history, rebuilding (and re-validating) its table if either changes
+    # Looking up an ingredient the history has no price for by then raises a ValueError naming it
+
+    def __init__(self, catalog, history, when):
+        super().__init__(catalog.path)
+        self.catalog = catalog
+        self.history = history
+        self.when = when
+        self._key = None
+
+    def refresh(self):
+        table = self.catalog.table
+        self.history.refresh()
+        key = (self.catalog.version, self.history.version)
+        if self._table is None or self._key != key:
+            self._table = self.history.table_as_of(table, self.when)
+            self._key = key
+            self.version += 1
+            self._validate()
+        return self._table
+
+    def invalidate(self):
+        # This function forces the next lookup to re-read the price list and rebuild the table
+        self.catalog.invalidate()
+        self._table = None
+
+    def _check_priced(self, ingredients):
+        # ingredients in the price list but not in the history by self.when can't be priced, so they are named
+        # (ingredients not in the price list at all raise KeyError as usual)
+        missing = pd.Index(list(ingredients)).difference(self.table.index)
+        unpriced = missing.intersection(self.catalog.table.index)
+        if len(unpriced):
+            raise ValueError(f"the price history has no price on or before {self.when} for: {', '.join(unpriced)}")
+
+    def get(self, ingredient, column):
+        self._check_priced([ingredient])
+        return super().get(ingredient, column)
+
+    def lookup(self, ingredients, columns):
+        self._check_priced(ingredients)
+        return super().lookup(ingredients, columns)
+
+    def lookup_optional(self, ingredients, column, default=None):
+        self._check_priced(ingredients)
+        return super().lookup_optional(ingredients, column, default)
+
+
+# shared history, recorded to by file_manager and used for quotes as of a date
+price_history = PriceHistory()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Look back at the price history")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('seed', help="start the history off from the price list's current prices")
+    show = commands.add_parser('show', help="every price recorded for an ingredient")
+    show.add_argument('ingredient')
+    trend = commands.add_parser('trend', help="the price of ingredients at each of a list of dates")
+    trend.add_argument('dates', nargs='+', help="yyyy-mm-dd")
+    trend.add_argument('--ingredients', help="comma separated, every ingredient by default")
+    args = parser.parse_args()
+
+    if args.command == 'seed':
+        print(f"{price_history.seed()} ingredients added to the price history")
+    elif args.command == 'show':
+        print(price_history.series(args.ingredient.lower()).to_string(index=False))
+    else:
+        ingredients = [ingredient.strip().lower() for ingredient in args.ingredients.split(',')] \
+            if args.ingredients else price_catalog.ingredients()
+        print(price_history.trend(ingredients, args.dates).to_string())
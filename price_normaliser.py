@@ -0,0 +1,173 @@
+import re
+import numpy as np
+import pandas as pd
+
+
+# Turns the price strings and product names the shops show into a (price, unit) pair in our canonical units:
+# kg and l for anything sold by weight or volume, otherwise whole / single / bunch / pack
+# The scrapers only fetch pages, all of the reading happens here, with every pattern compiled once. Each rule has a
+# one-string version for the scrapers and a vectorized version that normalises a whole catalog's strings in one pass
+
+
+# '£1.29', '1.29', '£1,299.00' or '79p'
+PRICE = re.compile(r'£?\s*(?P<pounds>\d[\d,]*(?:\.\d+)?)(?P<pence>p\b)?', re.IGNORECASE)
+
+# aldi's unit price: '£0.89 each', '£1.29 per kg', '£0.15 per 100g', '£0.20 per 100ml', '£2.00 per 75cl'
+UNIT_PRICE = re.compile(r'(?P<price>£?\s*\d[\d,]*(?:\.\d+)?p?)\s*(?:(?P<each>each)\b|per\s*(?P<amount>\d+(?:\.\d+)?)?'
+                        r'\s*(?P<unit>kg|g|ml|cl|ltr|litres?|l)\b)', re.IGNORECASE)
+
+# a pack size in a product name: 'Tahini 1 Kg', 'Cumin 100G', 'Rice 1.5kg', 'Olive Oil 500ml', 'Milk 2 Ltr'
+PACK_SIZE = re.compile(r'(?<![\d.])(?P<amount>\d+(?:\.\d+)?)\s?(?P<unit>kgs?|grams?|gr|g|ml|cl|ltr|litres?|l)\b',
+                       re.IGNORECASE)
+
+# words in a product name that say how it is sold, checked in this order before any pack size
+# (case sensitive on purpose, so 'Peach' isn't read as 'Each')
+SOLD_BY = [
+    (re.compile(r'\bEach\b'), "whole"),
+    (re.compile(r'\bSingle\b'), "single"),
+    (re.compile(r'\bBunch\b'), "bunch"),
+    (re.compile(r'\bPack\b'), "pack"),
+]
+
+# how much of the base unit (kg or l) one of each pack-size unit is
+PACK_UNITS = {
+    'kg': ('kg', 1), 'kgs': ('kg', 1), 'g': ('kg', 1000), 'gr': ('kg', 1000), 'gram': ('kg', 1000),
+    'grams': ('kg', 1000), 'l': ('l', 1), 'ltr': ('l', 1), 'litre': ('l', 1), 'litres': ('l', 1),
+    'ml': ('l', 1000), 'cl': ('l', 100),
+}
+
+# how each shop words its product names
+#   sold_by: whether the SOLD_BY words are looked for
+#   small_pack: packs under this many g / ml are priced as a pack rather than per kg / l
+#   default: the unit when the name gives no clue
+NAME_RULES = {
+    "yasar halim": {'sold_by': True, 'small_pack': 100, 'default': "unknown"},
+    "waitrose": {'sold_by': False, 'small_pack': 0, 'default': "whole"},
+}
+
+
+def parse_price(text):
+    # This function reads a price in pounds out of a price string, raising ValueError if there isn't one
+    match = PRICE.search(text)
+    if match is None:
+        raise ValueError(f"no price in {text!r}")
+    price = float(match.group('pounds').replace(',', ''))
+    return price / 100 if match.group('pence') else price
+
+
+def normalise_unit_price(text):
+    # This function turns a unit price string (as aldi shows them) into (price per canonical unit, unit)
+
+    match = UNIT_PRICE.search(text)
+    if match is None:
+        raise ValueError(f"unaccounted for unit in {text!r}")
+    price = parse_price(match.group('price'))
+    if match.group('each'):
+        return price, "whole"
+
+    unit, per_base_unit = PACK_UNITS[match.group('unit').lower()]
+    amount = float(match.group('amount') or 1)
+    if per_base_unit != 1 or amount != 1:
+        price = price * (per_base_unit / amount)    ## e.g. per 100g is * 10 for per kg
+    return price, unit
+
+
+def normalise_product_name(name, price, shop):
+    # This function turns a product's name and shelf price into (price per canonical unit, unit)
+
+    rules = NAME_RULES[shop]
+    if rules['sold_by']:
+        for pattern, unit in SOLD_BY:
+            if pattern.search(name):
+                return price, unit
+
+    match = PACK_SIZE.search(name)
+    if match is None:
+        return price, rules['default']
+
+    unit, per_base_unit = PACK_UNITS[match.group('unit').lower()]
+    amount = float(match.group('amount'))
+    if per_base_unit == 1:
+        return price / amount, unit
+    if amount < rules['small_pack']:
+        return price, "pack"
+    return price * per_base_unit / amount, unit
+
+
+def _search_all(pattern, texts, groups):
+    # This function runs a pattern over a list of strings, each distinct string only once (a catalog repeats the
+    # same few unit prices and pack sizes over and over), and returns {group: object array of what it matched}
+    codes, uniques = pd.factorize(pd.Series(texts, dtype=object).fillna('').astype(str))
+    matches = [pattern.search(text) for text in uniques]
+    found = {group: np.array([match.group(group) if match else None for match in matches] + [None], dtype=object)
+             for group in groups}
+    return {group: values[codes] for group, values in found.items()}     ## code -1 (missing) picks the None
+
+
+def _matched(values):
+    # which of the values from _search_all were found
+    return np.array([value is not None for value in values], dtype=bool)
+
+
+def _pack_size_columns(units, amounts, default_amount=np.nan):
+    # (base unit, amount per base unit, amount) arrays for the unit and amount groups of a PACK_SIZE / UNIT_PRICE match
+    known = _matched(units)
+    base_units = np.array([PACK_UNITS[unit.lower()][0] if unit else None for unit in units], dtype=object)
+    per_base_unit = np.array([PACK_UNITS[unit.lower()][1] if unit else np.nan for unit in units], dtype=float)
+    amounts = np.array([float(amount) if amount else default_amount for amount in amounts], dtype=float)
+    return known, base_units, per_base_unit, amounts
+
+
+def normalise_prices(texts):
+    # This function is parse_price over a whole list of strings, returning a float array (NaN where there is no price)
+
+    found = _search_all(PRICE, texts, ['pounds', 'pence'])
+    pounds = np.array([float(value.replace(',', '')) if value else np.nan for value in found['pounds']])
+    return np.where(_matched(found['pence']), pounds / 100, pounds)
+
+
+def normalise_unit_prices(texts):
+    # This function is normalise_unit_price over a whole list of strings
+    # It returns a DataFrame of price and unit, with NaN / None where a string couldn't be read
+
+    found = _search_all(UNIT_PRICE, texts, ['price', 'each', 'amount', 'unit'])
+    prices = normalise_prices(found['price'])
+    known, base_units, per_base_unit, amounts = _pack_size_columns(found['unit'], found['amount'], default_amount=1)
+
+    each = _matched(found['each'])
+    scaled = known & ((per_base_unit != 1) | (amounts != 1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        prices = np.where(scaled & ~each, prices * (per_base_unit / amounts), prices)
+    units = np.where(each, "whole", base_units)
+
+    readable = (each | known) & ~np.isnan(prices)
+    return pd.DataFrame({'price': np.where(readable, prices, np.nan), 'unit': np.where(readable, units, None)})
+
+
+def normalise_product_names(names, prices, shop):
+    # This function is normalise_product_name over a whole list of names and their shelf prices
+    # It returns a DataFrame of price and unit, in the same order
+
+    rules = NAME_RULES[shop]
+    prices = np.asarray(prices, dtype=float)
+    found = _search_all(PACK_SIZE, names, ['amount', 'unit'])
+    has_size, base_units, per_base_unit, amounts = _pack_size_columns(found['unit'], found['amount'])
+
+    # sized names: per kg / l, or a small pack
+    is_base = per_base_unit == 1
+    small = ~is_base & (amounts < rules['small_pack'])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sized_prices = np.where(is_base, prices / amounts, np.where(small, prices, prices * per_base_unit / amounts))
+    sized_units = np.where(small, "pack", base_units)
+
+    unit = np.where(has_size, sized_units, rules['default']).astype(object)
+    price = np.where(has_size, sized_prices, prices)
+
+    # the sold-by words win over any pack size (the first word found wins, so apply them last to first)
+    if rules['sold_by']:
+        for pattern, sold_by_unit in reversed(SOLD_BY):
+            sold_by = _matched(_search_all(pattern, names, [0])[0])
+            unit = np.where(sold_by, sold_by_unit, unit)
+            price = np.where(sold_by, prices, price)
+
+    return pd.DataFrame({'price': price, 'unit': unit})
@@ -0,0 +1,163 @@
+import argparse
+import numpy as np
+import pandas as pd
+from event_calculator import print_shopping_list, quote_event
+
+
+class PriceScenarios:
+    # This class answers what-if questions about an event's cost without re-running the pipeline for each one
+    # It takes a priced shopping list (as format_shopping_list lays it out) and treats a scenario as a relative change
+    # to the price of every line (0.1 is 10% dearer). Scenarios are rows of a matrix, so the event totals of thousands
+    # of them are one matrix product with the line prices
+    # Changes can be given per ingredient, per shop, or drawn at random (monte_carlo); the quantities bought stay
+    # those of the shopping list, and the totals aren't rounded to the penny per line, so they can differ from a full
+    # re-quote by a few pence
+
+    def __init__(self, shopping_list):
+        self.shopping_list = shopping_list
+        self.prices = shopping_list['price'].to_numpy(dtype=float)
+        self.base_total = float(self.prices.sum())
+        self.ingredient_codes, self.ingredients = pd.factorize(shopping_list['ingredient'])
+        self.shop_codes, self.shops = pd.factorize(shopping_list['shop'])
+
+    def _changes_matrix(self, changes, labels):
+        # changes as a scenarios x labels array, and the scenario names
+        # changes can be a {label: change} dict (one scenario), a DataFrame of scenarios x labels, or an array
+        if isinstance(changes, dict):
+            changes = pd.DataFrame([changes])
+        if isinstance(changes, pd.DataFrame):
+            unknown = changes.columns.difference(labels)
+            if len(unknown):
+                raise KeyError(unknown[0])
+            return changes.reindex(columns=labels).fillna(0.0).to_numpy(dtype=float), changes.index
+        changes = np.atleast_2d(np.asarray(changes, dtype=float))
+        if changes.shape[1] != len(labels):
+            raise ValueError(f"expected a change for each of the {len(labels)} columns, got {changes.shape[1]}")
+        return changes, pd.RangeIndex(len(changes))
+
+    def by_ingredient(self, changes):
+        # This function prices scenarios given as changes to each ingredient's price
+        matrix, names = self._changes_matrix(changes, self.ingredients)
+        return self.run(matrix[:, self.ingredient_codes], names)
+
+    def by_shop(self, changes):
+        # This function prices scenarios given as changes to every price at a shop, e.g. {'aldi': 0.1}
+        matrix, names = self._changes_matrix(changes, self.shops)
+        return self.run(matrix[:, self.shop_codes], names)
+
+    def monte_carlo(self, draws=10000, volatility=0.1, shop_volatility=0.0, seed=None):
+        # This function prices draws random scenarios: every ingredient's price moves by its own lognormal factor
+        # (volatility is its standard deviation, one for all or a {ingredient: volatility} dict), and every shop's
+        # prices by a shared one (shop_volatility), so dearer shops move their lines together
+        # The factors average 1, so the mean of the totals is the shopping list's total
+
+        rng = np.random.default_rng(seed)
+        if isinstance(volatility, dict):
+            volatility = pd.Series(volatility).reindex(self.ingredients).fillna(0.0).to_numpy(dtype=float)
+        volatility = np.broadcast_to(np.asarray(volatility, dtype=float), len(self.ingredients))
+        factors = np.exp(rng.standard_normal((draws, len(self.ingredients))) * volatility - volatility ** 2 / 2)
+        factors = factors[:, self.ingredient_codes]
+        if shop_volatility:
+            shop_factors = np.exp(rng.standard_normal((draws, len(self.shops))) * shop_volatility
+                                  - shop_volatility ** 2 / 2)
+            factors *= shop_factors[:, self.shop_codes]
+        return self.run(factors - 1.0)
+
+    def run(self, line_changes, names=None):
+        # This function prices a scenarios x lines matrix of changes, the one matrix product everything comes down to
+        line_changes = np.atleast_2d(np.asarray(line_changes, dtype=float))
+        totals = self.base_total + line_changes @ self.prices
+        names = pd.RangeIndex(len(totals)) if names is None else names
+        return ScenarioResult(self, line_changes, pd.Series(totals, index=names, name='total_cost'))
+
+
+class ScenarioResult:
+    # This class holds the totals of a set of scenarios, with the reports on them
+
+    def __init__(self, scenarios, line_changes, totals):
+        self.scenarios = scenarios
+        self.line_changes = line_changes
+        self.totals = totals
+
+    def percentiles(self, bands=(5, 50, 95)):
+        # This function returns the event total at each percentile of the scenarios
+        return pd.Series(np.percentile(self.totals.to_numpy(), bands), index=[f"p{band}" for band in bands],
+                         name='total_cost').round(2)
+
+    def ingredient_costs(self):
+        # This function returns what each ingredient costs in every scenario, as a scenarios x ingredients array
+        # (the lines of each ingredient summed, lines sorted by ingredient so each one's lines are a single run)
+        scenarios = self.scenarios
+        line_costs = scenarios.prices * (1.0 + self.line_changes)
+        if not line_costs.shape[1]:
+            return line_costs
+        order = np.argsort(scenarios.ingredient_codes, kind='stable')
+        starts = np.flatnonzero(np.diff(scenarios.ingredient_codes[order], prepend=-1))
+        return np.add.reduceat(line_costs[:, order], starts, axis=1)
+
+    def top_contributors(self, top=10):
+        # This function returns the ingredients that drive the event's cost, most first: each one's cost in the
+        # shopping list, its mean and 95th percentile over the scenarios, its share of the total, and its share of
+        # the spread of the total (its covariance with the total over the total's variance; the shares add up to 1)
+
+        scenarios = self.scenarios
+        costs = self.ingredient_costs()
+        totals = self.totals.to_numpy()
+        centred = totals - totals.mean()
+        variance = centred @ centred
+        spread = (costs - costs.mean(axis=0)).T @ centred / variance if variance > 0 \
+            else np.zeros(len(scenarios.ingredients))
+        base_costs = np.bincount(scenarios.ingredient_codes, weights=scenarios.prices,
+                                 minlength=len(scenarios.ingredients))
+        contributors = pd.DataFrame({
+            'cost': base_costs,
+            'mean_cost': costs.mean(axis=0),
+            'p95_cost': np.percentile(costs, 95, axis=0),
+            'share_of_total': base_costs / scenarios.base_total if scenarios.base_total else 0.0,
+            'share_of_spread': spread,
+        }, index=pd.Index(scenarios.ingredients, name='ingredient'))
+        order = 'share_of_spread' if variance > 0 else 'cost'
+        return contributors.sort_values(order, ascending=False, kind='stable').head(top).round(
+            {'cost': 2, 'mean_cost': 2, 'p95_cost': 2, 'share_of_total': 3, 'share_of_spread': 3})
+
+    def summary(self, top=5):
+        # This function returns the report as text for printing
+        bands = self.percentiles()
+        lines = [f"{len(self.totals)} scenarios, shopping list total {round(self.scenarios.base_total, 2)}",
+                 "  " + ", ".join(f"{band}: {value}" for band, value in bands.items()),
+                 "Top contributors:", self.top_contributors(top).to_string()]
+        return "\n".join(lines)
+
+
+def parse_changes(pairs):
+    # 'aldi=0.1' -> {'aldi': 0.1}, for the command line
+    return {name.strip().lower(): float(change) for name, change in (pair.rsplit('=', 1) for pair in pairs)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="What-if costs of an event across price scenarios")
+    parser.add_argument('guest_count', type=int)
+    parser.add_argument('event_type')
+    parser.add_argument('dishes', help="comma separated dishes on the menu")
+    parser.add_argument('--draws', type=int, default=10000, help="how many random scenarios")
+    parser.add_argument('--volatility', type=float, default=0.1, help="how much each ingredient's price varies")
+    parser.add_argument('--shop-volatility', type=float, default=0.0, help="how much each shop's prices vary together")
+    parser.add_argument('--shop', nargs='*', default=[], help="what if a shop changes its prices, e.g. aldi=0.1")
+    parser.add_argument('--ingredient', nargs='*', default=[], help="what if an ingredient changes price, e.g. tahini=0.25")
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    recipes_list = [dish.strip().lower() for dish in args.dishes.split(',') if dish.strip()]
+    shopping_list, total_cost = quote_event(args.guest_count, recipes_list, args.event_type.lower())
+    print_shopping_list(shopping_list, total_cost)
+
+    scenarios = PriceScenarios(shopping_list)
+    if args.shop or args.ingredient:
+        line_changes = np.zeros((1, len(shopping_list)))
+        if args.shop:
+            line_changes = scenarios.by_shop(parse_changes(args.shop)).line_changes
+        if args.ingredient:
+            ingredient_changes = scenarios.by_ingredient(parse_changes(args.ingredient)).line_changes
+            line_changes = (1 + line_changes) * (1 + ingredient_changes) - 1
+        print(f"\nWhat if: {round(scenarios.run(line_changes).totals.iloc[0], 2)}")
+    print("\n" + scenarios.monte_carlo(args.draws, args.volatility, args.shop_volatility, args.seed).summary())
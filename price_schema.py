@@ -0,0 +1,142 @@
+from datetime import date
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel, field_validator
+from units import UNITS
+
+
+# The price list's schema, in one place: the pydantic model the scrapers validate each record with, and a column-wise
+# validator that checks a whole price table at once against the same rules:
+#   price        a positive number
+#   unit         a unit we can price in (UNITS from units.py, or a counted unit)
+#   shop         one of KNOWN_SHOPS
+#   last_update  a real dd/mm date
+# The table validator never stops at the first bad row, it returns every problem in a ValidationReport
+
+
+# counted units, priced per item rather than per kg or l
+COUNTED_UNITS = ['whole', 'single', 'bunch', 'pack', 'can', 'jar', 'tube', 'bulb']
+# "unknown" (what price_normaliser gives a product name with no unit in it) is left out on purpose, a price that
+# isn't tied to a unit can't be costed, so the scrapers reject such a page rather than write it to the price list
+PRICE_UNITS = frozenset(UNITS) | frozenset(COUNTED_UNITS)
+
+KNOWN_SHOPS = frozenset(['aldi', 'amazon', 'waitrose', 'yasar halim', 'yildiz'])
+
+MONTH_DAYS = [0, 31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]     ## by month, 29/02 allowed as the year isn't kept
+
+
+# Pydantic model to check if ingredients data is correct
+class Ingredient(BaseModel):
+    name: str
+    price: float
+    unit: str
+    shop: str
+    last_update: date
+
+    @field_validator('price')
+    def validate_price(cls, price):
+        if not price > 0:
+            raise ValueError("Price must be positive")
+        return round(price, 2)
+
+    @field_validator('unit')
+    def validate_unit(cls, unit):
+        if unit not in PRICE_UNITS:
+            raise ValueError(f"Unknown unit {unit!r}")
+        return unit
+
+    @field_validator('shop')
+    def validate_shop(cls, shop):
+        if shop not in KNOWN_SHOPS:
+            raise ValueError(f"Unknown shop {shop!r}")
+        return shop
+
+
+def is_dd_mm(text):
+    # This function checks a single last_update value is a real date written as dd/mm
+    if not isinstance(text, str) or len(text) != 5 or text[2] != '/' \
+            or not (text[:2].isdigit() and text[3:].isdigit()):
+        return False
+    day, month = int(text[:2]), int(text[3:])
+    return 1 <= month <= 12 and 1 <= day <= MONTH_DAYS[month]
+
+
+class ValidationReport:
+    # This class holds what validate_price_table found, one row of errors per problem:
+    # row (position in the table, the csv file's line is row + 2), ingredient, column, value and problem
+
+    def __init__(self, errors, row_count):
+        self.errors = errors
+        self.row_count = row_count
+
+    @property
+    def ok(self):
+        return self.errors.empty
+
+    def __len__(self):
+        return len(self.errors)
+
+    def bad_ingredients(self):
+        # This function returns every ingredient with at least one problem, in table order
+        return list(dict.fromkeys(self.errors['ingredient']))
+
+    def summary(self):
+        # This function returns the report as text for printing
+        if self.ok:
+            return f"All {self.row_count} rows are valid!"
+        lines = [f"{self.errors['row'].nunique()} of {self.row_count} rows are not valid:"]
+        lines += [f"  line {row + 2} {ingredient}: {column}{'' if pd.isna(value) else f' {value!r}'} {problem}"
+                  for row, ingredient, column, value, problem in self.errors.itertuples(index=False)]
+        return "\n".join(lines)
+
+
+def validate_price_table(table, units=PRICE_UNITS, shops=KNOWN_SHOPS):
+    # This function checks every row of a price table at once and returns a ValidationReport
+    # table can be indexed by ingredient (as the PriceCatalog holds it) or have an ingredient column (as read_csv
+    # gives it); a missing column counts as missing in every row
+
+    row_count = len(table)
+    if 'ingredient' in table.columns:
+        ingredients = table['ingredient']
+    else:
+        ingredients = pd.Series(table.index, index=table.index)
+    column = lambda name: table[name] if name in table.columns else pd.Series(np.nan, index=table.index, dtype=object)
+    checks = []     ## (column, values, mask of bad rows, problem)
+
+    missing = ingredients.isna().to_numpy()
+    checks.append(('ingredient', ingredients, missing | (ingredients == '').to_numpy(), "is missing"))
+    checks.append(('ingredient', ingredients, ~missing & ingredients.duplicated().to_numpy(),
+                   "is listed more than once"))
+
+    prices = column('price')
+    numbers = pd.to_numeric(prices, errors='coerce').to_numpy(dtype=float)
+    missing = prices.isna().to_numpy()
+    checks.append(('price', prices, missing, "is missing"))
+    checks.append(('price', prices, ~missing & ~np.isfinite(numbers), "is not a number"))
+    with np.errstate(invalid='ignore'):
+        checks.append(('price', prices, np.isfinite(numbers) & ~(numbers > 0), "is not positive"))
+
+    for name, known, problem in (('unit', units, "is not a known unit"), ('shop', shops, "is not a known shop")):
+        values = column(name)
+        missing = values.isna().to_numpy()
+        checks.append((name, values, missing, "is missing"))
+        checks.append((name, values, ~missing & ~values.isin(list(known)).to_numpy(), problem))
+
+    # a price list only holds a few hundred different dates, so each is checked once and mapped back to the rows
+    dates = column('last_update')
+    codes, distinct = pd.factorize(dates)
+    valid = np.array([is_dd_mm(text) for text in distinct] + [False], dtype=bool)    ## code -1 is a missing date
+    checks.append(('last_update', dates, codes == -1, "is missing"))
+    checks.append(('last_update', dates, (codes != -1) & ~valid[codes], "is not a dd/mm date"))
+
+    frames = []
+    for name, values, mask, problem in checks:
+        rows = np.flatnonzero(mask)
+        if len(rows):
+            frames.append(pd.DataFrame({'row': rows, 'ingredient': ingredients.to_numpy(dtype=object)[rows],
+                                        'column': name, 'value': values.to_numpy(dtype=object)[rows],
+                                        'problem': problem}))
+    columns = ['row', 'ingredient', 'column', 'value', 'problem']
+    errors = (pd.concat(frames, ignore_index=True).sort_values('row', kind='stable', ignore_index=True)
+              if frames else pd.DataFrame(columns=columns))
+    return ValidationReport(errors, row_count)
@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+from price_catalog import price_catalog
+from recipe_repository import recipe_repository
+from units import unit_registry
+
+
+class RecipeCosts:
+    # This class keeps the cost of one batch of every recipe ready, for calculate_recipe_cost and for pricing menus
+    # The recipe book is held as a recipe x ingredient matrix of quantities in the price list's units (sparse, as the
+    # repository's ingredient table already is: one row per (recipe, ingredient)), so costing every recipe is one
+    # matrix-vector product with the price vector
+    #
+    # The matrix is rebuilt when the recipes change, or when the price list changes an ingredient's unit or pack size
+    # (the conversions depend on them); a price change only re-does the product. Changes are caught through the
+    # repository's and catalog's version counters, and invalidate() drops everything when we know we've written
+    # Recipes that can't be costed (an ingredient missing from the price list, a unit that won't convert) cost NaN,
+    # and problems() says why
+
+    def __init__(self, catalog=price_catalog, repository=recipe_repository):
+        self.catalog = catalog
+        self.repository = repository
+        self.invalidate()
+
+    def invalidate(self):
+        # This function forces the next lookup to rebuild the matrix and the costs
+        self._matrix_key = None
+        self._costs_key = None
+        self._costs = None
+
+    def _build_matrix(self, prices_table):
+        # (recipe of each row, catalog row of each row's ingredient, quantity in the price list's unit) plus the
+        # units and pack sizes the conversions were worked out with
+        recipes = pd.Index(self.repository.names())
+        rows = self.repository.ingredient_table
+        recipe_codes = recipes.get_indexer(rows['recipe'])
+        catalog_rows = prices_table.index.get_indexer(rows['ingredient'])
+        known = catalog_rows >= 0
+
+        units = np.where(known, prices_table['unit'].to_numpy(dtype=object)[catalog_rows], None)
+        pack_sizes = (np.where(known, prices_table['pack_size'].to_numpy(dtype=object)[catalog_rows], None)
+                      if 'pack_size' in prices_table.columns else np.full(len(rows), None, dtype=object))
+        pack_sizes = np.where(pd.isna(pack_sizes), None, pack_sizes)
+
+        problems = {}
+        for recipe, ingredient in zip(rows['recipe'].to_numpy()[~known], rows['ingredient'].to_numpy()[~known]):
+            problems.setdefault(recipe, KeyError(ingredient))
+
+        # quantities the recipe gave in its own unit, converted once per distinct (unit, price list unit, pack size)
+        quantities = rows['quantity'].to_numpy(dtype=float, copy=True)
+        recipe_units = rows['recipe_unit'].to_numpy(dtype=object)
+        factors = {}
+        for row in np.flatnonzero(pd.notna(recipe_units) & known):
+            combination = (recipe_units[row], units[row], pack_sizes[row])
+            if combination not in factors:
+                try:
+                    factors[combination] = unit_registry.factor(*combination)
+                except ValueError as error:
+                    factors[combination] = error
+            if isinstance(factors[combination], ValueError):
+                quantities[row] = np.nan
+                recipe = rows['recipe'].iat[row]
+                problems.setdefault(recipe, ValueError(f"{rows['ingredient'].iat[row]}: {factors[combination]}"))
+            else:
+                quantities[row] *= factors[combination]
+
+        self._recipes = recipes
+        self._recipe_codes = recipe_codes
+        self._catalog_rows = catalog_rows
+        self._quantities = quantities
+        self._units = (units, pack_sizes)
+        self._problems = problems
+
+    def _conversions_changed(self, prices_table):
+        # whether the price list changed the unit or pack size of an ingredient the recipes use
+        catalog_rows = prices_table.index.get_indexer(self.repository.ingredient_table['ingredient'])
+        if not np.array_equal(catalog_rows >= 0, self._catalog_rows >= 0):
+            return True
+        known = catalog_rows >= 0
+        units = prices_table['unit'].to_numpy(dtype=object)[catalog_rows[known]]
+        if not np.array_equal(units, self._units[0][known]):
+            return True
+        if 'pack_size' in prices_table.columns:
+            pack_sizes = prices_table['pack_size'].to_numpy(dtype=object)[catalog_rows[known]]
+            pack_sizes = np.where(pd.isna(pack_sizes), None, pack_sizes)
+            if not np.array_equal(pack_sizes, self._units[1][known]):
+                return True
+        self._catalog_rows = catalog_rows     ## the same ingredients may sit on other rows of the new price list
+        return False
+
+    def refresh(self):
+        # This function brings the matrix and the costs up to date, and returns the costs
+        prices_table = self.catalog.table
+        self.repository.refresh()      ## so its version is current
+        key = (self.repository.version, self.catalog.version)
+        if self._costs_key == key:
+            return self._costs
+
+        if self._matrix_key is None or self._matrix_key[0] != key[0] or self._conversions_changed(prices_table):
+            self._build_matrix(prices_table)
+        self._matrix_key = key
+
+        # the product itself: bincount adds each recipe's terms in order, like a python loop over its ingredients
+        prices = prices_table['price'].to_numpy(dtype=float)
+        row_prices = np.where(self._catalog_rows >= 0, prices[self._catalog_rows], np.nan)
+        costs = np.bincount(self._recipe_codes, weights=self._quantities * row_prices, minlength=len(self._recipes))
+        self._costs = pd.Series(costs, index=self._recipes, name='cost')
+        self._costs_key = key
+        return self._costs
+
+    def costs(self):
+        # This function returns the cost of one batch of every recipe, as a Series indexed by recipe
+        return self.refresh()
+
+    def problems(self):
+        # This function returns {recipe: the error that stops it being costed}
+        self.refresh()
+        return dict(self._problems)
+
+    def cost(self, recipe):
+        # This function returns the cost of one batch of a recipe (unrounded), raising KeyError if the recipe or one
+        # of its ingredients is unknown, and ValueError if a quantity can't be converted to the price list's unit
+        costs = self.refresh()
+        if recipe in self._problems:
+            raise self._problems[recipe]
+        return costs[recipe]
+
+    def cost_per_portion(self, event_type):
+        # This function returns what one guest's portion of every recipe costs for an event type
+        # (NaN for recipes not served that way, or that can't be costed)
+        portions = self.repository.portions
+        if event_type not in portions.columns:
+            raise KeyError(event_type)
+        return (self.costs() / portions[event_type].reindex(self._recipes)).rename('cost_per_portion')
+
+
+# shared recipe costs used by file_manager and the menu planner
+recipe_costs = RecipeCosts()
@@ -0,0 +1,210 @@
+import argparse
+import csv
+import json
+from price_catalog import price_catalog
+from recipe_repository import recipe_repository
+from storage import open_recipe_store
+from units import parse_quantity, unit_registry
+
+
+# Bulk import of recipes, instead of typing them in one at a time with add_recipe
+#
+# Recipes are streamed from CSV files, one row per (recipe, ingredient), rows of a recipe kept together:
+#
+#     recipe,ingredient,quantity,unit,buffet,dinner
+#     hummus,dried chickpeas,1,,20,
+#     hummus,tahini,400,g,,
+#
+# (unit is optional, and every other column is an event type, its portion size given on any row of the recipe)
+# or from JSON-lines files, one recipe per line:
+#
+#     {"name": "hummus", "ingredients": {"dried chickpeas": 1, "tahini": "400 g"}, "portions": {"buffet": 20}}
+#
+# Every recipe is checked against the in-memory price list as it is read, and the whole import is reported at once
+# (every missing ingredient with the recipes that need it, and every other problem with its file and line), then the
+# recipes are merged into the store with a single sorted write
+
+
+class ImportReport:
+    # This class collects what an import found
+
+    def __init__(self):
+        self.recipes = {}               ## recipes that passed every check, {name: recipe}
+        self.missing_ingredients = {}   ## {ingredient not in the price list: [recipes that use it]}
+        self.problems = []              ## (file, line, recipe, message)
+        self.existing = []              ## recipes skipped because they already exist
+        self.written = False
+
+    @property
+    def ok(self):
+        return not self.missing_ingredients and not self.problems
+
+    def add_problem(self, path, line, recipe, message):
+        self.problems.append((path, line, recipe, message))
+
+    def summary(self):
+        # This function returns the report as text for printing
+        lines = [f"{len(self.recipes)} recipes {'imported' if self.written else 'valid, nothing written'}"]
+        if self.existing:
+            lines.append(f"{len(self.existing)} already exist and were skipped (replace them with --replace): "
+                         + ", ".join(self.existing))
+        if self.missing_ingredients:
+            lines.append("Missing from the price list:")
+            lines += [f"  {ingredient} (used by {', '.join(recipes)})"
+                      for ingredient, recipes in sorted(self.missing_ingredients.items())]
+        if self.problems:
+            lines.append("Problems:")
+            lines += [f"  {path}:{line} {recipe}: {message}" for path, line, recipe, message in self.problems]
+        return "\n".join(lines)
+
+
+def read_csv_recipes(path, report):
+    # This function streams (line, name, [(ingredient, quantity)], {event_type: portion}) out of a CSV file,
+    # one recipe at a time, holding only the rows of the recipe being read
+
+    with open(path, "r", newline='') as csv_file:
+        reader = csv.DictReader(csv_file)
+        event_types = [column for column in reader.fieldnames or [] if column not in ('recipe', 'ingredient',
+                                                                                       'quantity', 'unit')]
+        current = None
+        for line, row in enumerate(reader, 2):
+            name = (row.get('recipe') or '').strip().lower()
+            if current is None or name != current[1]:
+                if current is not None:
+                    yield current
+                current = (line, name, [], {})
+
+            ingredient = (row.get('ingredient') or '').strip().lower()
+            if ingredient:
+                quantity = (row.get('quantity') or '').strip()
+                unit = (row.get('unit') or '').strip()
+                current[2].append((ingredient, f"{quantity} {unit}" if unit else quantity))
+            for event_type in event_types:
+                portion = (row.get(event_type) or '').strip()
+                if portion:
+                    if current[3].get(event_type.strip().lower(), portion) != portion:
+                        report.add_problem(path, line, name, f"two different {event_type} portion sizes")
+                    current[3][event_type.strip().lower()] = portion
+        if current is not None:
+            yield current
+
+
+def read_jsonl_recipes(path, report):
+    # This function streams (line, name, [(ingredient, quantity)], {event_type: portion}) out of a JSON-lines file
+    with open(path, "r") as jsonl_file:
+        for line, text in enumerate(jsonl_file, 1):
+            if not text.strip():
+                continue
+            try:
+                recipe = json.loads(text)
+                yield (line, str(recipe['name']).strip().lower(),
+                       [(ingredient.strip().lower(), quantity) for ingredient, quantity in recipe['ingredients'].items()],
+                       {event_type.strip().lower(): portion for event_type, portion in recipe['portions'].items()})
+            except (ValueError, KeyError, AttributeError, TypeError) as error:
+                report.add_problem(path, line, '', f"can't read the recipe ({error!r})")
+
+
+def read_recipe_file(path, report):
+    if path.endswith('.csv'):
+        return read_csv_recipes(path, report)
+    return read_jsonl_recipes(path, report)
+
+
+def _number(value):
+    # a quantity or portion size as it is stored in recipes.json, ints kept as ints
+    number = float(value)
+    return int(number) if isinstance(value, int) or (isinstance(value, str) and number.is_integer()) else number
+
+
+class RecipeImporter:
+    # This class checks and imports recipe files against a price list and a recipe store
+
+    def __init__(self, catalog=price_catalog, repository=recipe_repository, store=None):
+        self.catalog = catalog
+        self.repository = repository
+        self.store = store or open_recipe_store(repository)
+
+    def validate(self, paths, replace=False):
+        # This function reads every file and returns an ImportReport, writing nothing
+
+        table = self.catalog.table
+        units = table['unit'].to_dict()
+        pack_sizes = table['pack_size'].dropna().to_dict() if 'pack_size' in table.columns else {}
+        existing = set(self.repository.recipes)
+        report = ImportReport()
+        seen = set()
+
+        for path in paths:
+            for line, name, ingredients, portions in read_recipe_file(path, report):
+                problems = []
+                if not name:
+                    problems.append("no recipe name")
+                elif name in seen:
+                    problems.append("listed more than once (keep a recipe's rows together)")
+                    report.recipes.pop(name, None)
+                seen.add(name)
+                if name in existing and not replace:
+                    report.existing.append(name)
+                    continue
+
+                recipe = {'ingredients': {}, 'portions': {}}
+                missing = False
+                if not ingredients:
+                    problems.append("no ingredients")
+                for ingredient, quantity in ingredients:
+                    if ingredient in recipe['ingredients']:
+                        problems.append(f"{ingredient} is listed twice")
+                        continue
+                    try:
+                        amount, unit = parse_quantity(quantity)
+                        if not amount > 0:
+                            raise ValueError("the quantity isn't positive")
+                        if ingredient not in units:
+                            report.missing_ingredients.setdefault(ingredient, []).append(name)
+                            missing = True
+                        elif unit is not None:
+                            unit_registry.factor(unit, units[ingredient], pack_sizes.get(ingredient))
+                    except ValueError as error:
+                        problems.append(f"{ingredient}: {error}")
+                        continue
+                    recipe['ingredients'][ingredient] = quantity if unit is not None else _number(quantity)
+
+                if not portions:
+                    problems.append("no portion sizes")
+                for event_type, portion in portions.items():
+                    try:
+                        if not float(portion) > 0:
+                            raise ValueError
+                        recipe['portions'][event_type] = _number(portion)
+                    except (ValueError, TypeError):
+                        problems.append(f"the {event_type} portion size {portion!r} isn't a positive number")
+
+                for problem in problems:
+                    report.add_problem(path, line, name, problem)
+                if not problems and not missing:
+                    report.recipes[name] = recipe
+        return report
+
+    def import_files(self, paths, replace=False, partial=False):
+        # This function validates the files and merges the recipes into the store in one write
+        # Nothing is written if anything is wrong, unless partial, which writes the recipes that passed
+        report = self.validate(paths, replace)
+        if report.recipes and (report.ok or partial):
+            self.store.merge_recipes(report.recipes)
+            report.written = True
+        return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Import recipes in bulk from CSV or JSON-lines files")
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--replace', action='store_true', help="overwrite recipes that already exist")
+    parser.add_argument('--partial', action='store_true', help="import the valid recipes even if others have problems")
+    parser.add_argument('--check', action='store_true', help="only check the files, don't import anything")
+    args = parser.parse_args()
+
+    importer = RecipeImporter()
+    if args.check:
+        print(importer.validate(args.files, args.replace).summary())
+    else:
+        print(importer.import_files(args.files, args.replace, args.partial).summary())
@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+from cached_file import CachedFile
+from storage import RECIPES_PATH, read_recipes
+from units import parse_quantity
+
+
+class RecipeRepository(CachedFile):
+    # This class parses the recipes json file (or database, see storage.py) once and keeps it in memory for every
+    # costing function
+    # Alongside the raw recipes it pre-builds each recipe's ingredient vector and a table of portion sizes,
+    # the cache is dropped when the file is re-written (add_recipe, alphabetize_recipes_list) or its mtime changes
+
+    def __init__(self, path=RECIPES_PATH):
+        super().__init__(path)
+        self._recipes = None
+        self._ingredient_vectors = None
+        self._ingredient_table = None
+        self._recipe_rows = None
+        self._portions = None
+        self._recipe_index = None
+
+    def refresh(self):
+        # This function re-parses the json file if it has changed (or been invalidated) and returns the recipes dict
+        super().refresh()
+        return self._recipes
+
+    def _load(self, stamp):
+        self._recipes = read_recipes(self.path)
+        self._drop_tables()
+
+    def _drop_tables(self):
+        # the tables built from the recipes are rebuilt on their next use
+        self._ingredient_vectors = None
+        self._ingredient_table = None
+        self._recipe_rows = None
+        self._portions = None
+        self._recipe_index = None
+
+    def record_insert(self, position, recipe_name, recipe):
+        # This function adds a recipe the recipe store has just inserted into the file at position to the parsed
+        # recipes too, so one new recipe doesn't make the next access re-parse the whole file
+        items = list(self._recipes.items())
+        self._recipes = dict(items[:position] + [(recipe_name, recipe)] + items[position:])
+        self._drop_tables()
+        self._record_write()
+
+    @property
+    def recipes(self):
+        return self.refresh()
+
+    def __contains__(self, recipe):
+        return recipe in self.recipes
+
+    def __getitem__(self, recipe):
+        return self.recipes[recipe]
+
+    def names(self):
+        return list(self.recipes)
+
+    @property
+    def recipe_index(self):
+        # the recipe names as an Index, in file order (sorted, it can be binary searched)
+        recipes = self.recipes
+        if self._recipe_index is None:
+            self._recipe_index = pd.Index(list(recipes), dtype=object)
+        return self._recipe_index
+
+    def ingredients(self, recipe):
+        # This function returns the {ingredient: quantity} dict of a recipe
+        return self.recipes[recipe]['ingredients']
+
+    def portion_size(self, recipe, event_type):
+        # This function returns how many guests one batch of a recipe serves for an event type
+        return float(self.recipes[recipe]['portions'][event_type])
+
+    @property
+    def ingredient_vectors(self):
+        # per-recipe ingredient vectors: {recipe: Series of quantities indexed by ingredient}, in the recipe's own units
+        recipes = self.recipes
+        if self._ingredient_vectors is None:
+            self._ingredient_vectors = {
+                recipe: pd.Series({ingredient: parse_quantity(quantity)[0]
+                                   for ingredient, quantity in details['ingredients'].items()}, dtype=float, name=recipe)
+                for recipe, details in recipes.items()
+            }
+        return self._ingredient_vectors
+
+    @property
+    def ingredient_table(self):
+        # long-format table with one row per (recipe, ingredient), in the order they appear in the file
+        # recipe_unit is the unit the recipe gave its quantity in, or None for a bare number (the price list's unit)
+        recipes = self.recipes
+        if self._ingredient_table is None:
+            rows = [(recipe, ingredient, *parse_quantity(quantity))
+                    for recipe, details in recipes.items()
+                    for ingredient, quantity in details['ingredients'].items()]
+            self._ingredient_table = pd.DataFrame(rows, columns=['recipe', 'ingredient', 'quantity', 'recipe_unit'])
+            self._ingredient_table['recipe_unit'] = self._ingredient_table['recipe_unit'].astype(object)
+        return self._ingredient_table
+
+    @property
+    def recipe_rows(self):
+        # {recipe: (start, stop)} positions of each recipe's rows in the ingredient table, which are contiguous
+        table = self.ingredient_table
+        if self._recipe_rows is None:
+            counts = table.groupby('recipe', sort=False).size()
+            stops = counts.cumsum()
+            self._recipe_rows = dict(zip(counts.index, zip((stops - counts).tolist(), stops.tolist())))
+        return self._recipe_rows
+
+    def menu_rows(self, recipes_list):
+        # This function returns the ingredient table rows for a menu, in menu order (repeats included)
+        recipe_rows = self.recipe_rows
+        positions = [np.arange(*recipe_rows[recipe]) for recipe in recipes_list if recipe in recipe_rows]
+        positions = np.concatenate(positions) if positions else np.array([], dtype=int)
+        return self.ingredient_table.iloc[positions].reset_index(drop=True)
+
+    @property
+    def portions(self):
+        # table of portion sizes, one row per recipe and one column per event type (NaN if not served that way)
+        recipes = self.recipes
+        if self._portions is None:
+            self._portions = pd.DataFrame.from_dict(
+                {recipe: details['portions'] for recipe, details in recipes.items()}, orient='index', dtype=float)
+        return self._portions
+
+
+# shared repository used by file_manager and event_calculator
+recipe_repository = RecipeRepository()
@@ -0,0 +1,84 @@
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from price_catalog import price_catalog
+from recipe_repository import recipe_repository
+
+
+# how many days a shop's prices are trusted before they are scraped again
+# (the shops change their prices at different rates, anything not listed uses DEFAULT_MAX_AGE_DAYS)
+MAX_AGE_DAYS = {
+    "aldi": 7,
+    "yasar halim": 7,
+    "waitrose": 14,
+}
+DEFAULT_MAX_AGE_DAYS = 7
+
+
+def ingredient_ages(last_updates, today=None):
+    # This function returns how many days ago each 'dd/mm' last_update was, as a float array
+    # The price list doesn't store the year, so each date is taken as its latest occurrence on or before today;
+    # dates that can't be read (blank, 29/02 in another year, typos) come back as inf, i.e. always stale
+
+    today = pd.Timestamp(today or datetime.now().date())
+    last_updates = pd.Series(last_updates, dtype=object).astype(str).str.strip()
+
+    this_year = pd.to_datetime(last_updates + f"/{today.year}", format="%d/%m/%Y", errors="coerce")
+    last_year = pd.to_datetime(last_updates + f"/{today.year - 1}", format="%d/%m/%Y", errors="coerce")
+    dates = this_year.where(this_year <= today, last_year)
+
+    ages = (today - dates).dt.days.to_numpy(dtype=float, na_value=np.nan)
+    return np.where(np.isnan(ages), np.inf, ages)
+
+
+class RefreshPlanner:
+    # This class works out which prices actually need scraping, instead of re-scraping whole shops
+    # An ingredient is stale once its last_update is older than its shop's max age, and stale ingredients needed by
+    # upcoming events are scraped first (soonest event first), then the rest from the oldest price down
+    # Every ingredient appears once in a plan, however many events or recipes use it
+
+    def __init__(self, max_age_days=None, default_max_age_days=DEFAULT_MAX_AGE_DAYS,
+                 catalog=price_catalog, repository=recipe_repository):
+        self.max_age_days = dict(MAX_AGE_DAYS, **(max_age_days or {}))
+        self.default_max_age_days = default_max_age_days
+        self.catalog = catalog
+        self.repository = repository
+
+    def event_ingredients(self, events):
+        # This function returns {ingredient: rank of the first event that needs it}, events sorted by their 'date'
+        # (events without one keep their place after the dated ones), each event being a load_events dict
+
+        order = sorted(range(len(events)), key=lambda i: (events[i].get('date') is None, events[i].get('date') or ''))
+        ranks = {}
+        for rank, i in enumerate(order):
+            for recipe in events[i]['recipes_list']:
+                if recipe in self.repository:
+                    for ingredient in self.repository.ingredients(recipe):
+                        ranks.setdefault(ingredient, rank)
+        return ranks
+
+    def stale(self, shops=None, today=None):
+        # This function returns the price list rows that are past their shop's max age, with an 'age' column (days)
+        # A max age of 0 means nothing is trusted, so even a price updated today is stale
+
+        table = self.catalog.table
+        if shops is not None:
+            table = table[table['shop'].isin(list(shops))]
+        ages = ingredient_ages(table['last_update'], today)
+        max_ages = table['shop'].map(self.max_age_days).fillna(self.default_max_age_days).to_numpy(dtype=float)
+        stale = (ages > max_ages) | (max_ages <= 0)
+        return table[stale].assign(age=ages[stale])
+
+    def plan(self, events=None, shops=None, today=None):
+        # This function returns {shop: [stale ingredients]} in the order they should be scraped
+
+        stale = self.stale(shops, today)
+        stale = stale[~stale.index.duplicated()]    ## an ingredient listed twice is still scraped once
+        ranks = self.event_ingredients(events or [])
+        stale = stale.assign(event_rank=stale.index.map(lambda ingredient: ranks.get(ingredient, np.inf)))
+        stale = stale.sort_values(['event_rank', 'age'], ascending=[True, False], kind='stable')
+
+        plan = {}
+        for ingredient, shop in zip(stale.index, stale['shop']):
+            plan.setdefault(shop, []).append(ingredient)
+        return plan
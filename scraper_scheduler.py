@@ -0,0 +1,178 @@
+import logging
+import queue
+import random
+import threading
+import time
+from selenium.common.exceptions import NoSuchElementException
+from update_prices_csv import SHOP_SESSIONS, PriceUpdateSink, log_scrape_error
+
+
+class ShopPolicy:
+    # How hard we are allowed to hit one shop's website
+    # workers: browser sessions working through the shop's ingredients at the same time
+    # max_concurrency: cap on requests in flight at once (defaults to one per worker)
+    # rate_limit: most scrapes started per second across all of the shop's workers (None for no limit)
+    # retries / backoff: a failed ingredient is retried this many times, waiting backoff * 2**attempt seconds
+
+    def __init__(self, workers=2, max_concurrency=None, rate_limit=None, retries=2, backoff=2.0):
+        self.workers = workers
+        self.max_concurrency = max_concurrency or workers
+        self.rate_limit = rate_limit
+        self.retries = retries
+        self.backoff = backoff
+
+
+class RateLimiter:
+    # spaces out the start of each scrape so a shop sees at most `rate` of them per second
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self._next_start = 0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.interval
+        time.sleep(start - now)
+
+
+class ShopRun:
+    # the queue, limits and running totals for one shop while the scheduler works through it
+
+    def __init__(self, shop, ingredients, policy, session_factory):
+        self.shop = shop
+        self.policy = policy
+        self.session_factory = session_factory
+        self.queue = queue.Queue()
+        for ingredient in dict.fromkeys(ingredients):     ## de-duplicated, order kept
+            self.queue.put(ingredient)
+        self.concurrency = threading.Semaphore(policy.max_concurrency)
+        self.rate_limiter = RateLimiter(policy.rate_limit)
+        self.lock = threading.Lock()
+        self.total = self.queue.qsize()
+        self.workers_left = 0
+        self.updated = 0
+        self.failed = 0
+        self.retried = 0
+        self.started = None
+        self.finished = None
+
+    def report(self):
+        seconds = (self.finished or time.monotonic()) - (self.started or time.monotonic())
+        return {
+            'ingredients': self.total,
+            'updated': self.updated,
+            'failed': self.failed,
+            'retries': self.retried,
+            'seconds': round(seconds, 2),
+            'per_minute': round(self.updated / seconds * 60, 1) if seconds > 0 else 0.0,
+        }
+
+
+class ScrapeScheduler:
+    # This class refreshes prices with a pool of browser sessions per shop
+    # Each shop gets policy.workers threads, each driving its own browser session, pulling ingredients off the shop's
+    # queue; every shop runs at the same time, within its own concurrency cap and rate limit
+    # Failures are retried with exponential backoff (in a fresh session, as the page may be in a bad state), and
+    # everything scraped goes through one PriceUpdateSink, so the csv is written in batches
+    #
+    # sessions maps each shop to a callable returning a new ShopSession, by default the real websites, but a
+    # session pointed at locally saved stand-in pages can be passed instead
+    # cache_max_ages optionally caps, per shop, how many seconds old a cached product page can be and still be used
+
+    def __init__(self, policies=None, sessions=None, sink=None, default_policy=None, cache_max_ages=None):
+        self.policies = policies or {}
+        self.cache_max_ages = cache_max_ages or {}
+        self.sessions = sessions or SHOP_SESSIONS
+        self.sink = sink or PriceUpdateSink()
+        self.default_policy = default_policy or ShopPolicy()
+
+    def run(self, ingredients_by_shop):
+        # This function scrapes {shop: [ingredients]} and returns a {shop: throughput report} dict
+
+        runs = []
+        for shop, ingredients in ingredients_by_shop.items():
+            if shop not in self.sessions:
+                logging.error(f"Scheduler: no scraper for {shop}, skipped {len(ingredients)} ingredients")
+                continue
+            if ingredients:
+                policy = self.policies.get(shop, self.default_policy)
+                runs.append(ShopRun(shop, ingredients, policy, self.sessions[shop]))
+
+        threads = []
+        with self.sink:
+            for run in runs:
+                run.started = time.monotonic()
+                run.workers_left = min(run.policy.workers, run.total)
+                for _ in range(run.workers_left):
+                    thread = threading.Thread(target=self._work, args=(run,), daemon=True)
+                    thread.start()
+                    threads.append(thread)
+            for thread in threads:
+                thread.join()
+
+        reports = {run.shop: run.report() for run in runs}
+        for shop, report in reports.items():
+            print(f"{shop}: {report['updated']}/{report['ingredients']} updated, {report['failed']} failed, "
+                  f"{report['retries']} retries, {report['per_minute']} per minute")
+        return reports
+
+    def _work(self, run):
+        # one worker: keeps a session open and scrapes ingredients until the shop's queue is empty
+        session = None
+        try:
+            while True:
+                try:
+                    ingredient = run.queue.get_nowait()
+                except queue.Empty:
+                    break
+                session = self._scrape_with_retries(run, session, ingredient)
+        finally:
+            if session is not None:
+                session.close()
+            with run.lock:
+                run.workers_left -= 1
+                if run.workers_left == 0:
+                    run.finished = time.monotonic()
+
+    def _scrape_with_retries(self, run, session, ingredient):
+        policy = run.policy
+        label = getattr(run.session_factory, 'label', None) or run.shop
+
+        for attempt in range(policy.retries + 1):
+            if attempt:
+                with run.lock:
+                    run.retried += 1
+                time.sleep(policy.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+            try:
+                if session is None:
+                    session = run.session_factory()
+                    session.open()
+                run.rate_limiter.wait()
+                with run.concurrency:
+                    record = session.scrape(ingredient, self.cache_max_ages.get(run.shop))
+                self.sink.push(record)
+                with run.lock:
+                    run.updated += 1
+                return session
+
+            except (ValueError, NoSuchElementException) as error:
+                # the page was read but the product wasn't there or its values didn't make sense, scraping it again
+                # won't change that
+                last_error = error
+                break
+            except Exception as error:
+                last_error = error
+                if session is not None:
+                    try:
+                        session.close()
+                    except Exception:
+                        pass
+                    session = None
+
+        log_scrape_error(label, ingredient, last_error)
+        with run.lock:
+            run.failed += 1
+        return session
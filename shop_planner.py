@@ -0,0 +1,212 @@
+import logging
+import os
+import numpy as np
+import pandas as pd
+from cached_file import CachedFile
+from pack_optimiser import pack_row
+from units import unit_registry
+
+
+SHOP_PRICES_PATH = os.environ.get('EVENT_CALCULATOR_SHOP_PRICES', 'shop_prices.csv')
+
+# what a trip to each shop costs on top of the shopping (time, travel, delivery charge), anything not listed uses
+# DEFAULT_VISIT_COST
+SHOP_VISIT_COSTS = {}
+DEFAULT_VISIT_COST = 5.0
+
+# up to this many candidate shops every combination of them is tried, beyond it a local search is used
+EXHAUSTIVE_SHOPS = 8
+
+
+class ShopPlanner(CachedFile):
+    # This class decides which shop to buy each ingredient at, once the same ingredient can be bought at more than one
+    # The price list gives every ingredient one shop; shop_prices.csv (same columns as the price list) adds what the
+    # other shops charge for it:
+    #
+    #     ingredient,price,unit,shop,last_update
+    #     tahini,8.2,kg,waitrose,03/01
+    #
+    # and ingredients with SKUs (see pack_optimiser.py) can be bought as packs at any shop that has them. The plan is
+    # the cheapest total of the shopping plus the visit cost of every shop on it, so buying one item somewhere else
+    # has to save more than the trip costs. Without shop_prices.csv every ingredient stays at its price list shop
+
+    missing_ok = True
+
+    def __init__(self, path=SHOP_PRICES_PATH, visit_costs=None, default_visit_cost=DEFAULT_VISIT_COST):
+        super().__init__(path)
+        self.visit_costs = dict(SHOP_VISIT_COSTS, **(visit_costs or {}))
+        self.default_visit_cost = default_visit_cost
+        self._table = None
+
+    def refresh(self):
+        # This function reloads the file if it has changed since it was last read, and returns the table
+        super().refresh()
+        return self._table
+
+    def _load(self, stamp):
+        columns = ['ingredient', 'price', 'unit', 'shop']
+        self._table = pd.read_csv(self.path).reindex(columns=columns) if stamp is not None \
+            else pd.DataFrame(columns=columns)
+
+    @property
+    def table(self):
+        return self.refresh()
+
+    def __bool__(self):
+        return len(self.table) > 0
+
+    def visit_cost(self, shop):
+        return self.visit_costs.get(shop, self.default_visit_cost)
+
+    def plan(self, shopping_list, raw_quantities, rounded_quantities, unit_prices, skus=None, pack_sizes=None):
+        # This function takes a grouped shopping list as finish_shopping_list has laid it out (quantity and price at
+        # its price list shop) and returns where to buy every row: a table of quantity, price, shop and packs
+        # (None for anything bought by unit price), indexed by position like optimise_packs
+        # pack_sizes is the price list's pack_size of each row, passed on to the SKU catalog
+        shops, costs, choices = self.offers(shopping_list, raw_quantities, rounded_quantities, skus, pack_sizes)
+        return self.choose(shopping_list['shop'], shops, costs, choices)
+
+    def candidate_shops(self, ingredients, list_shops, skus=None):
+        # This function returns every shop a plan for these ingredients can use, sorted
+        offers = self.table[self.table['ingredient'].isin(ingredients)]
+        return sorted(set(list_shops) | set(offers['shop']) | (set(skus.table['shop']) if skus else set()))
+
+    def offers(self, shopping_list, raw_quantities, rounded_quantities, skus=None, pack_sizes=None, shops=None):
+        # This function prices every row of the shopping list at every shop, returning the shops, an ingredients x
+        # shops array of costs (inf where a shop doesn't sell it) and each row's {shop column: (quantity, price, shop,
+        # packs)} for the shops that do (shops being the columns to use, every shop the rows can use by default)
+
+        ingredients = shopping_list['ingredient'].to_numpy(dtype=object)
+        pack_sizes = [None] * len(ingredients) if pack_sizes is None else pack_sizes
+        units = shopping_list['unit'].to_numpy(dtype=object)
+        list_shops = shopping_list['shop'].to_numpy(dtype=object)
+        quantities = shopping_list['quantity'].to_numpy(dtype=object)
+        prices = shopping_list['price'].to_numpy(dtype=float)
+        offers = self.table[self.table['ingredient'].isin(ingredients)]
+
+        shops = self.candidate_shops(ingredients, list_shops, skus) if shops is None else shops
+        shop_index = {shop: j for j, shop in enumerate(shops)}
+        costs = np.full((len(ingredients), len(shops)), np.inf)
+        choices = [{} for _ in ingredients]
+
+        for i, ingredient in enumerate(ingredients):
+            # the price list's shop at its unit price is always there to fall back on, the packs compete with it
+            j = shop_index[list_shops[i]]
+            costs[i, j] = prices[i]
+            choices[i][j] = (quantities[i], prices[i], list_shops[i], None)
+            for shop in (skus.shops(ingredient) if skus else []):
+                try:
+                    solution = skus.cheapest(ingredient, raw_quantities[i], units[i], shop, pack_sizes[i])
+                except ValueError:
+                    continue    ## this shop doesn't have enough packs on its own, or they can't be converted
+                j = shop_index[shop]
+                row = pack_row(solution, units[i])
+                if row[1] <= costs[i, j]:
+                    costs[i, j] = row[1]
+                    choices[i][j] = row
+
+        # the other shops' prices, converted to the price list's unit and charged on the same rounded quantity
+        rows = pd.Index(ingredients).get_indexer(offers['ingredient'])
+        for i, price, unit, shop in zip(rows, offers['price'], offers['unit'], offers['shop']):
+            try:
+                factor = 1.0 if pd.isna(unit) else unit_registry.factor(units[i], unit, pack_sizes[i])
+            except ValueError as error:
+                logging.warning(f"{ingredients[i]} at {shop}: {error}, offer skipped")
+                continue
+            cost = round(rounded_quantities[i] * price * factor, 2)
+            j = shop_index[shop]
+            if cost < costs[i, j]:
+                costs[i, j] = cost
+                choices[i][j] = (quantities[i], cost, shop, None)
+        return shops, costs, choices
+
+    def choose(self, list_shops, shops, costs, choices):
+        # This function picks the shops to visit for offers() and returns the plan laid out like plan()
+        shop_index = {shop: j for j, shop in enumerate(shops)}
+        visit_costs = np.array([self.visit_cost(shop) for shop in shops], dtype=float)
+        preferred = np.array([shop_index[shop] for shop in list_shops], dtype=np.int64)
+        assignment = choose_shops(costs, visit_costs, preferred)
+
+        chosen = [choices[i][j] for i, j in enumerate(assignment)]
+        columns = ['quantity', 'price', 'shop', 'packs']
+        return pd.DataFrame({column: pd.Series(values, dtype=object) for column, values in zip(columns, zip(*chosen))}
+                            if chosen else None, columns=columns)
+
+
+def choose_shops(costs, visit_costs, preferred=None):
+    # This function picks the shops to visit and returns which one each ingredient is bought at (a column of costs)
+    # costs is ingredients x shops (inf where a shop doesn't sell it), and the plan minimises the summed costs plus
+    # the visit cost of each shop used. This is the uncapacitated facility location problem: with few shops every
+    # combination is tried, otherwise a local search finds a good one
+    # preferred (each ingredient's price list shop) wins any tie, so a plan with nothing to gain changes nothing
+
+    costs = np.asarray(costs, dtype=float)
+    visit_costs = np.asarray(visit_costs, dtype=float)
+    if costs.shape[0] == 0:
+        return np.zeros(0, dtype=np.int64)
+    if not np.isfinite(costs.min(axis=1)).all():
+        raise ValueError("an ingredient can't be bought at any shop")
+
+    if costs.shape[1] <= EXHAUSTIVE_SHOPS:
+        shops_open = _best_combination(costs, visit_costs)
+    else:
+        shops_open = _local_search(costs, visit_costs)
+
+    open_costs = np.where(shops_open, costs, np.inf)
+    assignment = np.argmin(open_costs, axis=1)
+    if preferred is not None:
+        rows = np.arange(len(costs))
+        at_preferred = open_costs[rows, preferred]
+        assignment = np.where(at_preferred == open_costs[rows, assignment], preferred, assignment)
+    return assignment
+
+
+def _plan_cost(costs, visit_costs, shops_open):
+    if not shops_open.any():
+        return np.inf
+    return costs[:, shops_open].min(axis=1).sum() + visit_costs[shops_open].sum()
+
+
+def _best_combination(costs, visit_costs):
+    # every non-empty set of shops, each built from a smaller one by adding its lowest shop, so the per-ingredient
+    # cheapest price of a set is one np.minimum away from one already worked out
+    shop_count = costs.shape[1]
+    cheapest = np.empty((2 ** shop_count, len(costs)))
+    visits = np.zeros(2 ** shop_count)
+    cheapest[0] = np.inf
+    for combination in range(1, 2 ** shop_count):
+        lowest = combination & -combination
+        shop = lowest.bit_length() - 1
+        cheapest[combination] = np.minimum(cheapest[combination ^ lowest], costs[:, shop])
+        visits[combination] = visits[combination ^ lowest] + visit_costs[shop]
+
+    best = int(np.argmin(cheapest.sum(axis=1) + visits))
+    return (best >> np.arange(shop_count)) & 1 == 1
+
+
+def _local_search(costs, visit_costs):
+    # start from every shop something is cheapest at (the plan if visits were free), then keep making the best
+    # move - open a shop, close one, or swap one for another - until no move lowers the cost
+    shop_count = costs.shape[1]
+    shops_open = np.zeros(shop_count, dtype=bool)
+    shops_open[np.argmin(costs, axis=1)] = True
+    current = _plan_cost(costs, visit_costs, shops_open)
+
+    while True:
+        moves = [[shop] for shop in range(shop_count)]
+        moves += [[closing, opening] for closing in np.flatnonzero(shops_open)
+                  for opening in np.flatnonzero(~shops_open)]
+        best_move, best_cost = None, current
+        for move in moves:
+            candidate = shops_open.copy()
+            candidate[move] = ~candidate[move]
+            cost = _plan_cost(costs, visit_costs, candidate)
+            if cost < best_cost - 1e-9:
+                best_move, best_cost = candidate, cost
+        if best_move is None:
+            return shops_open
+        shops_open, current = best_move, best_cost
+
+
+# shared planner used by format_shopping_list
+shop_planner = ShopPlanner()
@@ -0,0 +1,465 @@
+import argparse
+import csv
+import io
+import json
+import os
+import re
+import sqlite3
+import numpy as np
+import pandas as pd
+from file_lock import atomic_write, file_lock
+
+
+# Storage backends for the price list and the recipes
+#
+# The default backend is the existing price_list.csv and recipes.json files. For big catalogs there is also a SQLite
+# backend, which keeps both in one indexed database file so file_manager's single-ingredient lookups and updates are
+# O(log n) instead of re-parsing text (the PriceCatalog still reads the whole table into memory, once per change of
+# the file, and quotes from there, as it does with the csv file). Both backends expose the same methods, and the SQLite one can import from and export
+# to the csv/json formats. Set EVENT_CALCULATOR_DB=<file>.sqlite to use it, e.g.
+#
+#     python storage.py import catalog.sqlite     ## load price_list.csv and recipes.json into the database
+#     python storage.py export catalog.sqlite     ## write them back out
+
+
+DATABASE_EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+PRICE_LIST_PATH = os.environ.get('EVENT_CALCULATOR_DB', 'price_list.csv')
+RECIPES_PATH = os.environ.get('EVENT_CALCULATOR_DB', 'recipes.json')
+
+# the price list's column names that can go into SQL, anything else is refused rather than escaped
+COLUMN_NAME = re.compile(r'[A-Za-z_][A-Za-z0-9_]*\Z')
+
+
+def is_database(path):
+    return path.endswith(DATABASE_EXTENSIONS)
+
+
+def quote_column(column):
+    # This function returns a column name quoted as an SQL identifier, raising ValueError if it isn't a plain name
+    if not isinstance(column, str) or COLUMN_NAME.match(column) is None:
+        raise ValueError(f"{column!r} is not a valid price list column name")
+    return f'"{column}"'
+
+
+def line_starts(data):
+    # This function returns the byte offset of the start of every line of a file's contents
+    newlines = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == ord('\n'))
+    return np.concatenate([[0], newlines + 1])
+
+
+def read_price_table(path):
+    # This function reads the whole price list from either backend, indexed by ingredient
+    if is_database(path):
+        return SqliteStore(path).price_table()
+    return pd.read_csv(path, index_col='ingredient')
+
+
+def read_recipes(path):
+    # This function reads every recipe from either backend, as the same nested dict recipes.json holds
+    if is_database(path):
+        return SqliteStore(path).read_recipes()
+    with open(path, "r") as json_file:
+        return json.load(json_file)
+
+
+class CsvPriceStore:
+    # price_list.csv backend, reads go through the in-memory PriceCatalog and writes are locked and atomic
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.path = catalog.path
+
+    def __contains__(self, ingredient):
+        return ingredient in self.catalog
+
+    def price_table(self):
+        return self.catalog.table
+
+    def get(self, ingredient, column):
+        return self.catalog.get(ingredient, column)
+
+    def get_ingredient(self, ingredient):
+        # This function returns every column of an ingredient as a Series, raising KeyError if it doesn't exist
+        return self.catalog.table.loc[ingredient]
+
+    def update_ingredients(self, updates):
+        # This function writes a batch of changes, {ingredient: {column: value}}, back to the csv file
+        # The whole batch is one read-modify-write, done under the cross-process file lock and written atomically,
+        # so concurrent scrapers can't lose each other's updates
+
+        with file_lock(self.path):
+            df = pd.read_csv(self.path, index_col='ingredient')
+            for ingredient, fields in updates.items():
+                for column, value in fields.items():
+                    df.at[ingredient, column] = value
+            with atomic_write(self.path) as csv_file:
+                df.to_csv(csv_file)
+
+    def add_ingredient(self, ingredient, **fields):
+        # This function inserts a new ingredient row at its alphabetical place
+        # The file is kept sorted, so the place is a binary search of the catalog's (sorted) index, and the row is
+        # either appended to the file or spliced in ahead of the row it goes before: one write, and nothing parsed
+        # or re-sorted. A file that isn't sorted (e.g. edited by hand) is sorted once instead, with the row added
+
+        with file_lock(self.path):
+            table = self.catalog.table
+            index = table.index
+            if not index.is_monotonic_increasing:
+                self._add_and_sort(ingredient, fields)
+                return
+            position = index.searchsorted(ingredient, side='right')     ## after any equal rows, like a stable sort
+
+            with open(self.path, 'rb') as csv_file:
+                header = csv_file.readline()
+                line_end = '\r\n' if header.endswith(b'\r\n') else '\n'
+                row = io.StringIO()
+                csv.writer(row, lineterminator=line_end).writerow(
+                    [ingredient] + [fields.get(column, '') for column in table.columns])
+                row = row.getvalue().encode('utf-8')
+
+                if position == len(index):
+                    csv_file.seek(0, os.SEEK_END)
+                    if csv_file.tell() > len(header):
+                        csv_file.seek(-1, os.SEEK_END)
+                        if csv_file.read(1) != b'\n':
+                            row = line_end.encode() + row
+                    with open(self.path, 'ab') as append_file:
+                        append_file.write(row)
+                        append_file.flush()
+                        os.fsync(append_file.fileno())
+                    self.catalog.record_insert(position, ingredient, fields)
+                    return
+
+                csv_file.seek(0)
+                data = csv_file.read()
+
+            # one line per row after the header, or the file holds something the catalog skipped (blank lines, a
+            # quoted newline), and the row's byte offset can't be trusted
+            starts = line_starts(data)
+            line_count = len(starts) - (1 if starts[-1] == len(data) else 0)
+            if line_count != len(index) + 1:
+                self._add_and_sort(ingredient, fields)
+                return
+            offset = starts[position + 1]
+            with atomic_write(self.path, 'wb') as csv_file:
+                csv_file.write(data[:offset] + row + data[offset:])
+            self.catalog.record_insert(position, ingredient, fields)
+
+    def _add_and_sort(self, ingredient, fields):
+        # the row is added and the whole file sorted, in one write (the file lock is already held)
+        df = pd.read_csv(self.path)
+        row_df = pd.DataFrame([{'ingredient': ingredient, **fields}], columns=df.columns)
+        df = pd.concat([df, row_df], ignore_index=True).sort_values('ingredient', kind='stable')
+        with atomic_write(self.path) as csv_file:
+            df.to_csv(csv_file, index=False)
+
+    def alphabetize(self):
+        # This function sorts the csv file into alphabetical order
+
+        with file_lock(self.path):
+            with open(self.path, "r") as csv_file:
+                csv_reader = csv.DictReader(csv_file)
+                sorted_price_list = sorted(csv_reader, key=lambda x: x['ingredient'])
+
+            with atomic_write(self.path) as csv_file:
+                fieldnames = sorted_price_list[0].keys()
+                csv_writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
+                csv_writer.writeheader()
+                csv_writer.writerows(sorted_price_list)
+
+
+class JsonRecipeStore:
+    # recipes.json backend, reads go through the in-memory RecipeRepository
+
+    def __init__(self, repository):
+        self.repository = repository
+        self.path = repository.path
+
+    def read_recipes(self):
+        return self.repository.recipes
+
+    def write_recipes(self, recipes):
+        # This function replaces the whole recipes file
+        with file_lock(self.path):
+            with atomic_write(self.path) as json_file:
+                json.dump(recipes, json_file, indent=4)
+        self.repository.invalidate()
+
+    def add_recipe(self, recipe_name, recipe):
+        # This function inserts a new recipe at its alphabetical place
+        # Like the price list, the place is a binary search of the (sorted) recipe names, and the recipe's json is
+        # spliced into the file's text ahead of the recipe it goes before, giving exactly the file a full sorted dump
+        # would, without re-serialising every other recipe. Anything else (an unsorted file, a recipe being
+        # replaced, a file not in our indent=4 layout) is written in full, sorted, in one write
+
+        with file_lock(self.path):
+            names = self.repository.recipe_index
+            with open(self.path, 'rb') as json_file:
+                data = json_file.read()
+            starts = self._recipe_starts(data)
+            if recipe_name in names or not names.is_monotonic_increasing or starts is None \
+                    or len(starts) != len(names) or len(names) == 0:
+                recipes = dict(self.repository.recipes)    ## copy, so the shared cache isn't modified before the write
+                recipes[recipe_name] = recipe
+                with atomic_write(self.path) as json_file:
+                    json.dump({name: recipes[name] for name in sorted(recipes)}, json_file, indent=4)
+                self.repository.invalidate()
+            else:
+                entry = json.dumps({recipe_name: recipe}, indent=4)[2:-2].encode('utf-8')   ## without the { }
+                position = names.searchsorted(recipe_name)
+                if position < len(names):
+                    offset = starts[position]
+                    data = data[:offset] + entry + b',\n' + data[offset:]
+                else:
+                    offset = data.rstrip().rindex(b'\n}')
+                    data = data[:offset] + b',\n' + entry + data[offset:]
+                with atomic_write(self.path, 'wb') as json_file:
+                    json_file.write(data)
+                self.repository.record_insert(position, recipe_name, recipe)
+
+    @staticmethod
+    def _recipe_starts(data):
+        # byte offsets of the lines holding a recipe's name, i.e. indented exactly one level in json.dump(indent=4)
+        if not data.startswith(b'{\n'):
+            return None
+        starts = line_starts(data)
+        starts = starts[starts + 5 <= len(data)]
+        text = np.frombuffer(data, dtype=np.uint8)
+        at_top_level = np.all([text[starts + i] == byte for i, byte in enumerate(b'    "')], axis=0)
+        return starts[at_top_level]
+
+    def alphabetize(self):
+        recipes = self.repository.recipes
+        self.write_recipes({recipe: recipes[recipe] for recipe in sorted(recipes)})
+
+    def merge_recipes(self, new_recipes):
+        # This function adds (or replaces) many recipes in one sorted write
+        # The file is re-read under the lock, so recipes added by someone else in the meantime aren't lost
+        with file_lock(self.path):
+            with open(self.path, "r") as json_file:
+                recipes = json.load(json_file)
+            recipes.update(new_recipes)
+            with atomic_write(self.path) as json_file:
+                json.dump({recipe: recipes[recipe] for recipe in sorted(recipes)}, json_file, indent=4)
+        self.repository.invalidate()
+
+
+class SqliteStore:
+    # SQLite backend holding both the price list and the recipes, every single-ingredient lookup is an indexed
+    # (B-tree) query; price_table() reads the whole table, for the PriceCatalog
+    # SQLite does its own cross-process locking, so each write is simply one transaction
+
+    PRICE_COLUMNS = ['ingredient', 'price', 'unit', 'shop', 'last_update']
+
+    def __init__(self, path):
+        self.path = path
+        with self.connect() as connection:
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS ingredients (
+                    ingredient TEXT PRIMARY KEY, price REAL, unit TEXT, shop TEXT, last_update TEXT);
+                CREATE INDEX IF NOT EXISTS ingredients_by_shop ON ingredients (shop);
+                CREATE TABLE IF NOT EXISTS recipes (recipe TEXT PRIMARY KEY, portions TEXT);
+                CREATE TABLE IF NOT EXISTS recipe_ingredients (
+                    recipe TEXT, position INTEGER, ingredient TEXT, quantity,
+                    PRIMARY KEY (recipe, position));
+                CREATE INDEX IF NOT EXISTS recipe_ingredients_by_ingredient ON recipe_ingredients (ingredient);
+            """)
+
+    def connect(self):
+        # 'with connection' commits (or rolls back) the transaction, the connection is closed by the caller
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _columns(self, connection):
+        return [row[1] for row in connection.execute("PRAGMA table_info(ingredients)")]
+
+    def _add_missing_columns(self, connection, columns):
+        # the csv file can grow extra columns, so they are added to the table the first time they are written
+        existing = self._columns(connection)
+        for column in columns:
+            if column not in existing:
+                connection.execute(f"ALTER TABLE ingredients ADD COLUMN {quote_column(column)}")
+
+        # PRICE LIST
+
+    def __contains__(self, ingredient):
+        connection = self.connect()
+        try:
+            row = connection.execute("SELECT 1 FROM ingredients WHERE ingredient = ?", (ingredient,)).fetchone()
+        finally:
+            connection.close()
+        return row is not None
+
+    def price_table(self):
+        connection = self.connect()
+        try:
+            return pd.read_sql("SELECT * FROM ingredients ORDER BY ingredient", connection, index_col='ingredient')
+        finally:
+            connection.close()
+
+    def get_ingredient(self, ingredient):
+        # This function returns every column of an ingredient as a Series, raising KeyError if it doesn't exist
+        connection = self.connect()
+        try:
+            cursor = connection.execute("SELECT * FROM ingredients WHERE ingredient = ?", (ingredient,))
+            row = cursor.fetchone()
+            columns = [description[0] for description in cursor.description]
+        finally:
+            connection.close()
+        if row is None:
+            raise KeyError(ingredient)
+        return pd.Series(row[1:], index=columns[1:], name=ingredient)
+
+    def get(self, ingredient, column):
+        return self.get_ingredient(ingredient)[column]
+
+    def update_ingredients(self, updates):
+        # This function writes a batch of changes, {ingredient: {column: value}}, in a single transaction
+        # Ingredients that don't exist yet are inserted, like assigning a new row in the csv backend
+
+        connection = self.connect()
+        try:
+            with connection:
+                self._add_missing_columns(connection, {column for fields in updates.values() for column in fields})
+                for ingredient, fields in updates.items():
+                    if not fields:
+                        continue
+                    assignments = ", ".join(f"{quote_column(column)} = ?" for column in fields)
+                    cursor = connection.execute(f"UPDATE ingredients SET {assignments} WHERE ingredient = ?",
+                                                (*fields.values(), ingredient))
+                    if cursor.rowcount == 0:
+                        self._insert(connection, ingredient, fields)
+        finally:
+            connection.close()
+
+    def _insert(self, connection, ingredient, fields):
+        columns = ", ".join(quote_column(column) for column in ['ingredient', *fields])
+        placeholders = ", ".join("?" for _ in range(len(fields) + 1))
+        connection.execute(f"INSERT INTO ingredients ({columns}) VALUES ({placeholders})", (ingredient, *fields.values()))
+
+    def add_ingredient(self, ingredient, **fields):
+        connection = self.connect()
+        try:
+            with connection:
+                self._add_missing_columns(connection, fields)
+                self._insert(connection, ingredient, fields)
+        finally:
+            connection.close()
+
+    def alphabetize(self):
+        # rows are always read back in ingredient order, so there is nothing to sort
+        pass
+
+    def import_price_list(self, csv_path='price_list.csv'):
+        # This function replaces the database's price list with the contents of a price_list csv file
+
+        df = pd.read_csv(csv_path)
+        df = df.astype(object).where(df.notna(), None)      ## NaN -> NULL
+        connection = self.connect()
+        try:
+            with connection:
+                self._add_missing_columns(connection, df.columns)
+                connection.execute("DELETE FROM ingredients")
+                columns = ", ".join(quote_column(column) for column in df.columns)
+                placeholders = ", ".join("?" for _ in df.columns)
+                connection.executemany(f"INSERT INTO ingredients ({columns}) VALUES ({placeholders})",
+                                       df.itertuples(index=False, name=None))
+        finally:
+            connection.close()
+
+    def export_price_list(self, csv_path='price_list.csv'):
+        # This function writes the database's price list out in the price_list csv format
+        with file_lock(csv_path):
+            with atomic_write(csv_path) as csv_file:
+                self.price_table().to_csv(csv_file)
+
+        # RECIPES
+
+    def read_recipes(self):
+        connection = self.connect()
+        try:
+            recipes = {recipe: {'ingredients': {}, 'portions': json.loads(portions)}
+                       for recipe, portions in connection.execute("SELECT recipe, portions FROM recipes ORDER BY recipe")}
+            rows = connection.execute(
+                "SELECT recipe, ingredient, quantity FROM recipe_ingredients ORDER BY recipe, position")
+            for recipe, ingredient, quantity in rows:
+                recipes[recipe]['ingredients'][ingredient] = quantity
+        finally:
+            connection.close()
+        return recipes
+
+    def _insert_recipe(self, connection, recipe_name, recipe):
+        connection.execute("INSERT OR REPLACE INTO recipes VALUES (?, ?)", (recipe_name, json.dumps(recipe['portions'])))
+        connection.execute("DELETE FROM recipe_ingredients WHERE recipe = ?", (recipe_name,))
+        connection.executemany("INSERT INTO recipe_ingredients VALUES (?, ?, ?, ?)",
+                               [(recipe_name, position, ingredient, quantity)
+                                for position, (ingredient, quantity) in enumerate(recipe['ingredients'].items())])
+
+    def add_recipe(self, recipe_name, recipe):
+        connection = self.connect()
+        try:
+            with connection:
+                self._insert_recipe(connection, recipe_name, recipe)
+        finally:
+            connection.close()
+
+    def merge_recipes(self, new_recipes):
+        # This function adds (or replaces) many recipes in a single transaction
+        connection = self.connect()
+        try:
+            with connection:
+                for recipe_name, recipe in new_recipes.items():
+                    self._insert_recipe(connection, recipe_name, recipe)
+        finally:
+            connection.close()
+
+    def write_recipes(self, recipes):
+        # This function replaces every recipe in the database
+        connection = self.connect()
+        try:
+            with connection:
+                connection.execute("DELETE FROM recipes")
+                connection.execute("DELETE FROM recipe_ingredients")
+                for recipe_name, recipe in recipes.items():
+                    self._insert_recipe(connection, recipe_name, recipe)
+        finally:
+            connection.close()
+
+    def import_recipes(self, json_path='recipes.json'):
+        with open(json_path, "r") as json_file:
+            self.write_recipes(json.load(json_file))
+
+    def export_recipes(self, json_path='recipes.json'):
+        with file_lock(json_path):
+            with atomic_write(json_path) as json_file:
+                json.dump(self.read_recipes(), json_file, indent=4)
+
+
+def open_price_store(catalog):
+    # This function returns the price list backend for a PriceCatalog's path
+    if is_database(catalog.path):
+        return SqliteStore(catalog.path)
+    return CsvPriceStore(catalog)
+
+
+def open_recipe_store(repository):
+    # This function returns the recipes backend for a RecipeRepository's path
+    if is_database(repository.path):
+        return SqliteStore(repository.path)
+    return JsonRecipeStore(repository)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Move the price list and recipes in and out of a SQLite database")
+    parser.add_argument('action', choices=['import', 'export'])
+    parser.add_argument('database', help="SQLite database file, e.g. catalog.sqlite")
+    parser.add_argument('--price-list', default='price_list.csv')
+    parser.add_argument('--recipes', default='recipes.json')
+    args = parser.parse_args()
+
+    store = SqliteStore(args.database)
+    if args.action == 'import':
+        store.import_price_list(args.price_list)
+        store.import_recipes(args.recipes)
+    else:
+        store.export_price_list(args.price_list)
+        store.export_recipes(args.recipes)
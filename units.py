@@ -0,0 +1,127 @@
+import re
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from price_normaliser import PACK_SIZE
+
+
+# The units recipe quantities and prices can be in, and how to convert between them
+#
+# A recipe quantity is normally a bare number, in whatever unit the price list has for that ingredient, but it can
+# also say its own unit ("250 g", "2 pack"), which is then converted to the price list's unit when the shopping list
+# is built, so a scraper switching an ingredient from pack to kg no longer silently changes what the recipe means
+# Weights and volumes convert freely; counted units (whole, pack, can, ...) only convert to a weight or volume through
+# the ingredient's pack_size in the price list (e.g. "400g" for a can of chickpeas)
+
+
+# unit: (what it measures, how many of that measure's base unit (kg or l) one of it is)
+UNITS = {
+    'kg': ('mass', 1.0),
+    'g': ('mass', 0.001),
+    'l': ('volume', 1.0),
+    'ml': ('volume', 0.001),
+    'cl': ('volume', 0.01),
+}
+
+# other spellings found in recipes and on shop websites
+UNIT_ALIASES = {
+    'kgs': 'kg', 'kilo': 'kg', 'kilos': 'kg', 'gr': 'g', 'gram': 'g', 'grams': 'g',
+    'ltr': 'l', 'litre': 'l', 'litres': 'l', 'liter': 'l', 'liters': 'l',
+    'packs': 'pack', 'cans': 'can', 'jars': 'jar', 'tubes': 'tube', 'bulbs': 'bulb', 'bunches': 'bunch',
+}
+
+QUANTITY = re.compile(r'^\s*(?P<amount>\d+(?:\.\d+)?|\.\d+)\s*(?P<unit>[a-zA-Z ]+?)?\s*$')
+
+
+def canonical_unit(unit):
+    unit = unit.strip().lower()
+    return UNIT_ALIASES.get(unit, unit)
+
+
+def parse_quantity(value):
+    # This function splits a recipe quantity into (amount, unit), unit being None for a bare number
+    if isinstance(value, str):
+        match = QUANTITY.match(value)
+        if match is None:
+            raise ValueError(f"can't read the quantity {value!r}")
+        unit = match.group('unit')
+        return float(match.group('amount')), canonical_unit(unit) if unit else None
+    return float(value), None
+
+
+def parse_pack_size(text):
+    # This function reads a pack size like '400g' or '1.5 l' into (measure, amount of the measure's base unit)
+    match = PACK_SIZE.search(str(text))
+    if match is None:
+        raise ValueError(f"can't read the pack size {text!r}")
+    measure, size = UNITS[canonical_unit(match.group('unit'))]
+    return measure, float(match.group('amount')) * size
+
+
+class UnitRegistry:
+    # This class answers "how many <to_unit> is one <from_unit>" for the units above and any counted unit
+    # Factors are worked out once per (from_unit, to_unit, pack_size) and cached, and factors() does a whole column
+    # of conversions, looking each distinct combination up once
+
+    def __init__(self, units=UNITS):
+        self.units = units
+
+    def measure(self, unit):
+        # weights and volumes have their measure, a counted unit is its own measure
+        return self.units[unit][0] if unit in self.units else unit
+
+    @lru_cache(maxsize=None)
+    def factor(self, from_unit, to_unit, pack_size=None):
+        # This function returns the number to multiply a from_unit quantity by to get it in to_unit
+        # raising ValueError if the two can't be converted (pack_size being the price list's pack_size text)
+
+        from_unit, to_unit = canonical_unit(from_unit), canonical_unit(to_unit)
+        if from_unit == to_unit:
+            return 1.0
+        from_measure, to_measure = self.measure(from_unit), self.measure(to_unit)
+        if from_measure == to_measure and from_unit in self.units:
+            return self.units[from_unit][1] / self.units[to_unit][1]
+
+        # a counted unit and a weight/volume, converted through the size of one pack
+        if pack_size is not None:
+            pack_measure, pack_amount = parse_pack_size(pack_size)
+            if from_unit not in self.units and to_measure == pack_measure:
+                return pack_amount / self.units[to_unit][1]
+            if to_unit not in self.units and from_measure == pack_measure:
+                return self.units[from_unit][1] / pack_amount
+
+        raise ValueError(f"can't convert {from_unit} to {to_unit}"
+                         + ("" if pack_size is not None else ", the price list needs a pack_size for it"))
+
+    def factors(self, from_units, to_units, pack_sizes=None, ingredients=None):
+        # This function returns factor() for whole columns at once, as a float array
+        # A missing from_unit (a bare recipe quantity) means the quantity is already in to_unit, so its factor is 1
+
+        from_units = pd.Series(from_units, dtype=object).to_numpy()
+        to_units = pd.Series(to_units, dtype=object).to_numpy()
+        pack_sizes = (pd.Series(pack_sizes, dtype=object).to_numpy() if pack_sizes is not None
+                      else np.full(len(from_units), None, dtype=object))
+
+        factors = np.ones(len(from_units))
+        given = pd.notna(from_units)
+        if not given.any():
+            return factors
+
+        rows = np.flatnonzero(given)
+        pack_sizes = np.where(pd.isna(pack_sizes), None, pack_sizes)
+        combinations = {}
+        for row in rows:
+            combination = (from_units[row], to_units[row], pack_sizes[row])
+            if combination not in combinations:
+                try:
+                    combinations[combination] = self.factor(*combination)
+                except ValueError as error:
+                    if ingredients is None:
+                        raise
+                    raise ValueError(f"{np.asarray(ingredients, dtype=object)[row]}: {error}") from None
+            factors[row] = combinations[combination]
+        return factors
+
+
+# shared registry used when building shopping lists
+unit_registry = UnitRegistry()
@@ -3,317 +3,559 @@ from bs4 import BeautifulSoup
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import NoSuchElementException, TimeoutException, ElementNotInteractableException
-from pydantic import BaseModel, field_validator, ValidationError
-
-from file_manager import modify_price, modify_unit, reset_last_update
-import multiprocessing
-import multiprocessing.synchronize
-from datetime import datetime, date
-import re
+from urllib.parse import urljoin
+from urllib3.exceptions import HTTPError
+
+from event_calculator import load_events
+from fetchers import FetchError, HttpFetcher
+from file_manager import update_ingredients
+from page_cache import page_cache
+from price_catalog import price_catalog
+from price_normaliser import normalise_product_name, normalise_unit_price, parse_price
+from price_schema import Ingredient
+from refresh_planner import RefreshPlanner, ingredient_ages
+import argparse
+import atexit
+import threading
+import time
+from datetime import datetime
 import logging
 
 
-csv_lock = multiprocessing.Lock()
 
+class PriceUpdateSink:
+    # This class collects scraped Ingredient records and writes them to the csv file in batches
+    # Records are validated as they are pushed, and the pending batch is written (one locked, atomic write) once it
+    # holds batch_size ingredients or flush_interval seconds have passed, and again when the sink is closed
+    # Used as a context manager, so a scraper's final batch is flushed even if it stops early
+    # The batch is taken off pending under a short lock and written outside it, so scrapers keep pushing while it is
+    # written; writes are made one at a time, in the order their batches were taken
+
+    def __init__(self, batch_size=50, flush_interval=30):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending = {}
+        self.writes = 0
+        self.updated = 0
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._at_exit = False
+        self._register()
+
+    def _register(self):
+        # flush at exit as a last resort, in case the sink is used without 'with' (or pushed to after it is closed)
+        if not self._at_exit:
+            atexit.register(self.flush)
+            self._at_exit = True
+
+    def __enter__(self):
+        self._register()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        # This function writes anything pending, and drops the exit hook
+        self.flush()
+        if self._at_exit:
+            atexit.unregister(self.flush)
+            self._at_exit = False
+
+    def push(self, record):
+        # This function queues one scraped ingredient, record can be an Ingredient or a dict of its fields
+        # Invalid records raise a ValueError (pydantic's ValidationError) and are not queued
+
+        if not isinstance(record, Ingredient):
+            record = Ingredient(**record)
+
+        with self._lock:
+            self._register()
+            self.pending[record.name] = {
+                'unit': record.unit,
+                'price': record.price,
+                'last_update': record.last_update.strftime("%d/%m"),
+            }
+            due = (len(self.pending) >= self.batch_size
+                   or time.monotonic() - self._last_flush >= self.flush_interval)
+        if due:
+            self.flush()
+
+    def flush(self):
+        # This function writes everything pending in a single update of the csv file
+
+        with self._write_lock:
+            with self._lock:
+                batch, self.pending = self.pending, {}
+                self._last_flush = time.monotonic()
+            if not batch:
+                return
+            update_ingredients(batch)
+            self.writes += 1
+            self.updated += len(batch)
+
+
+class ShopSession:
+    # One browser window on a shop's website, opened once and reused for every ingredient it is asked to scrape
+    # Subclasses set the shop's name and url, and implement fetch_product_page(ingredient), which returns the html of
+    # the ingredient's product page, and parse_page(soup, ingredient), which reads the (price, unit) off it
+    # Keeping the two apart lets product pages be cached (see page_cache.py) and the parsers re-run over the cache
+    # The url can be overridden, e.g. to point a session at locally saved stand-in pages
+
+    shop = None     ## the shop's name in the price list
+    label = None    ## how the shop is named in the error logs
+    url = None
+
+    def __init__(self, url=None, timeout=10, cache=page_cache):
+        self.url = url or self.url
+        self.timeout = timeout
+        self.cache = cache
+        self.driver = None
+        self.wait = None
+
+    def open(self):
+        self.driver = webdriver.Chrome()    ## headless mode not working
+        self.driver.get(self.url)
+        self.wait = WebDriverWait(self.driver, self.timeout)
+
+    def close(self):
+        if self.driver is not None:
+            self.driver.quit()
+            self.driver = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def scrape(self, ingredient, max_age=None):
+        # This function returns the ingredient's current price as a validated Ingredient
+        # a product page cached within the cache's ttl (and within max_age seconds, if given, so a forced refresh
+        # can pass 0) is parsed again instead of fetching it from the shop, and dated by when it was fetched
+
+        page = None
+        if self.cache is not None:
+            page = self.cache.get_page(self.shop, ingredient, self.cache.ttl if max_age is None
+                                       else min(max_age, self.cache.ttl))
+        if page is None:
+            html, when = self.fetch_product_page(ingredient), None
+            if self.cache is not None:
+                self.cache.put(self.shop, ingredient, html, self.page_url())
+        else:
+            html, fetched_at = page
+            when = datetime.fromtimestamp(fetched_at).date()
+        price, unit = self.parse_page(BeautifulSoup(html, "html.parser"), ingredient)
+        return self.record(ingredient, price, unit, when)
+
+    def fetch_product_page(self, ingredient):
+        raise NotImplementedError
+
+    @staticmethod
+    def parse_page(soup, ingredient):
+        raise NotImplementedError
+
+    def page_url(self):
+        return self.driver.current_url if self.driver is not None else None
+
+    def find_product_link(self, ingredient):
+        # navigate to the correct webpage for the ingredient
+        return self.wait.until(
+            EC.presence_of_element_located((By.XPATH, f"//a[contains(text(), '{ingredient.title()}')]"))
+        )
+
+    def record(self, ingredient, price, unit, when=None):
+        # validate the scraped values with the pydantic model, dated when the page was fetched (today by default)
+        return Ingredient(name=ingredient, price=round(float(price), 2), unit=unit, shop=self.shop,
+                          last_update=when or datetime.now().date())
+
+
+class AldiSession(ShopSession):
+    shop = "aldi"
+    label = "Aldi"
+    url = "https://www.aldi.co.uk/"
+
+    def open(self):
+        super().open()      ## this page doesnt work in headless mode
+        self.searched = False
+
+    def fetch_product_page(self, ingredient):
+        # This function searches for the ingredient on the Aldi webpage and returns its product page
+
+        driver, wait = self.driver, self.wait
+        if not self.searched:
+            # if the T&C popup appears click accept
+            accept = wait.until(
+                EC.presence_of_element_located((By.ID, "onetrust-accept-btn-handler"))
+            )
+            accept.click()
+
+            # Adjust the search-bar toggle to look for groceries
+            wait.until(EC.invisibility_of_element_located((By.ID, 'onetrust-group-container')))
+            search_toggle = wait.until(
+                EC.element_to_be_clickable((By.CLASS_NAME, 'dropdown-search'))
+                                       )
+            search_toggle.click()
+            groceries = driver.find_element(By.ID, "groceries")
+            groceries.click()
+
+            # search for the specified ingredient in the search bar
+            search_bar = driver.find_element(By.ID, "typeahead")
+            search_bar.send_keys(ingredient)
+            search_bar.send_keys(Keys.ENTER)
+
+            # Switch to the newly opened tab (assuming it's the last one in the list)
+            all_handles = driver.window_handles
+            new_tab_handle = all_handles[-1]
+            driver.switch_to.window(new_tab_handle)
+            self.searched = True
 
-# Pydantic model to check if ingredients data is correct
-class Ingredient(BaseModel):
-    name: str
-    price: float
-    unit: str
-    shop: str
-    last_update: date
+        else:
+            search_bar = driver.find_element(By.ID, "search-input")
+            search_bar.send_keys(ingredient)
+            search_bar.send_keys(Keys.ENTER)
 
+        self.find_product_link(ingredient).click()
 
-    @field_validator('price')
-    def validate_price(cls, price):
-        if price <= 0:
-            raise ValueError("Price must be positive")
-        else:
-            price = round(price, 2)
-            return price
+        # wait for the price per unit to show
+        wait.until(EC.visibility_of_element_located(
+            (By.XPATH, "//small[@property='price' and @data-qa='product-price']//span"))
+                   )
+        return driver.page_source
 
-    @field_validator('last_update')
-    def validate_last_update(cls, value):
-        # Check if the date is in 'dd/mm' format
+    @staticmethod
+    def parse_page(soup, ingredient):
+        # This function reads the price and unit off an Aldi product page
+
+        # locate the price per unit
+        element = soup.select_one("small[property='price'][data-qa='product-price'] span")
+        if element is None:
+            raise ValueError(f"no price found for {ingredient}, check aldi webpage.")
+        unit_price = element.get_text().strip()
+
+        # aldi gives the price per kg, per 100g, per 100ml or each
         try:
-            date_str = value.strftime('%d/%m')
-            return value
+            return normalise_unit_price(unit_price)
         except ValueError:
-            raise ValueError(f"Invalid 'last_update' format: {date_str}. Use 'dd/mm'.")
+            raise ValueError(f"{ingredient} has unaccounted for unit, check aldi webpage.")
 
 
-def update_aldi_price(*ingredients):
-    # This function searches for the ingredient on the Aldi webpage and returns its current price
+def parse_yasar_halim_product(soup, ingredient):
+    # This function reads the price and unit off a Yasar Halim product page, however the page was fetched
 
-    with webdriver.Chrome() as driver:## this page doesnt work in headless mode
-        url = "https://www.aldi.co.uk/"
-        driver.get(url)
-        wait = WebDriverWait(driver, 10)
+    # scrape the price of ingredient from its webpage
+    price_cell = soup.find(class_="product-price")
+    name = soup.find(class_="product-name")
+    if price_cell is None or name is None:
+        raise ValueError(f"no price or name found for {ingredient}, check yasar halim webpage")
+    price = parse_price(price_cell.get_text())
 
-        for index, ingredient in enumerate(ingredients):
-            try:
-                if index == 0:
-                    # if the T&C popup appears click accept
-                    accept = wait.until(
-                        EC.presence_of_element_located((By.ID, "onetrust-accept-btn-handler"))
-                    )
-                    accept.click()
-
-                    # Adjust the search-bar toggle to look for groceries
-                    wait.until(EC.invisibility_of_element_located((By.ID, 'onetrust-group-container')))
-                    search_toggle = wait.until(
-                        EC.element_to_be_clickable((By.CLASS_NAME, 'dropdown-search'))
-                                               )
-                    search_toggle.click()
-                    groceries = driver.find_element(By.ID, "groceries")
-                    groceries.click()
-
-                    # search for the specified ingredient in the search bar
-                    search_bar = driver.find_element(By.ID, "typeahead")
-                    search_bar.send_keys(ingredient)
-                    search_bar.send_keys(Keys.ENTER)
-
-                    # Switch to the newly opened tab (assuming it's the last one in the list)
-                    all_handles = driver.window_handles
-                    new_tab_handle = all_handles[-1]
-                    driver.switch_to.window(new_tab_handle)
-
-                elif index >= 1:
-                    search_bar = driver.find_element(By.ID, "search-input")
-                    search_bar.send_keys(ingredient)
-                    search_bar.send_keys(Keys.ENTER)
-
-                # navigate to the correct webpage for the ingredient
-                ingredient_page_link = wait.until(
-                    EC.presence_of_element_located((By.XPATH, f"//a[contains(text(), '{ingredient.title()}')]"))
-                )
-                ingredient_page_link.click()
-
-                # locate the price per unit
-                element = wait.until(EC.visibility_of_element_located(
-                    (By.XPATH, "//small[@property='price' and @data-qa='product-price']//span"))
-                                     )
-                unit_price = element.text
-
-                # scrape the correct price and unit
-                if "each" in unit_price:
-                    price, unit = unit_price.split(" ")[0], "whole"
-                    price = price.replace("£", "")
-
-                elif "per kg" in unit_price:
-                    price, unit = unit_price.split(" per ")
-                    price = price.replace("£", "")
-
-                elif "ml" in unit_price:
-                    price = unit_price.split(" per ")[0].replace("£", "")
-                    price = float(price) * 10   ## as aldi gives price per 100ml
-                    unit = "l"
-
-                elif "g" in unit_price:
-                    price = unit_price.split(" per ")[0].replace("£", "")
-                    price = float(price) * 10   ## as aldi gives price per 100g
-                    unit = "kg"
-                else:
-                    print(f"{ingredient} has unaccounted for unit, check aldi webpage.")
-
-                price = round(float(price), 2)
-
-                # validate the ingredient with pydantic validator
-                ingredient = Ingredient(name=ingredient, price=price, unit=unit)
-
-                # write the unit and price back to csv and reset the 'last update' column to today
-                with csv_lock:
-                    modify_unit(ingredient, unit)
-                    modify_price(ingredient, price)
-                    reset_last_update(ingredient)
-                    print(f"{ingredient} updated!")
-
-            except NoSuchElementException:
-                logging.error(f"Aldi: {ingredient} not found on webpage")
-            except TimeoutException:
-                logging.error(f"Aldi: timed out for {ingredient}")
-            except ElementNotInteractableException:
-                logging.error(f'Aldi: {ingredient} was not interactable')
-            except ValueError as e:
-                logging.error(f'Aldi: check value for {ingredient}; {e}')
-
-
-def update_yasar_halim_price(*ingredients):
-    # This function searches for the ingredient on the Yasir Halim webpage and returns its current price
-
-    with webdriver.Chrome() as driver:    ## headless mode not working
-        url = "https://www.yasarhalim.com/"
-        driver.get(url)
-        wait = WebDriverWait(driver, 10)
+    # the unit comes from the product's name, e.g. 'Each', 'Bunch' or its pack size
+    price, unit = normalise_product_name(name.get_text().strip(), price, "yasar halim")
+    if unit == "unknown":
+        raise ValueError(f"{ingredient} has unaccounted for unit, check yasar halim webpage")
+    return price, unit
 
-        for ingredient in ingredients:
-            try:
-                # search for the ingredient on yasir halim search bar
-                search_bar = wait.until(
-                    EC.presence_of_element_located((By.ID, "small-searchterms"))
-                                        )
-                search_bar.send_keys(ingredient)
-                search_bar.send_keys(Keys.ENTER)
-
-                # locate the html script for the ingredient's webpage
-                ingredient_page_link = wait.until(
-                    EC.presence_of_element_located((By.XPATH, f"//a[contains(text(), '{ingredient.title()}')]"))
-                )
-                ingredient_page_link.click()
-                html_content = driver.page_source
-
-                # scrape the price of ingredient from its webpage
-                soup = BeautifulSoup(html_content, "html.parser")
-                price_cell = soup.find(class_="product-price")
-                price = float(price_cell.get_text().strip().replace("£", ""))
-
-                # scrape the correct unit from webpage
-                name = soup.find(class_="product-name")
-                name = name.text
-
-                # modify the price and unit depending on the unit
-                if "Each" in name:
-                    unit = "whole"
-                elif "Single" in name:
-                    unit = "single"
-                elif "Bunch" in name:
-                    unit = "bunch"
-                elif "Pack" in name:
-                    unit = "pack"
-                elif "G" in name or "Gr" in name:
-                    unit_in_g = re.search(r'\w* (\d{1,3}) ?[Gr]{1,2}', name).groups(1)
-                    weight = float(unit_in_g[0])
-                    if weight >= 100:
-                        price = price * 1000 / weight
-                        unit = "kg"
-                    else:
-                        unit = "pack"
-                elif "Kg" in name:
-                    unit_in_kg = re.search(r'\w* (\d{1-2}) ?Kg', name)
-                    weight = int(unit_in_kg.groups(1))
-                    price = price / weight
-                    unit = "kg"
-                else:
-                    print(f"{ingredient} unit unaccounted for, check website")
-                    unit = "unknown"
-
-                price = round(price, 2)
-
-                # write the unit and price back to csv and reset the 'last update' column to today
-                with csv_lock:
-                    modify_unit(ingredient, unit)
-                    modify_price(ingredient, price)
-                    reset_last_update(ingredient)
-                    print(f"{ingredient} updated!")
-
-            # if any exceptions crop up, print which ingredients could not be updated and why
-            except NoSuchElementException:
-                logging.error(f"Yasar Halim: {ingredient} not found on webpage")
-            except TimeoutException:
-                logging.error(f"Yasar Halim: timed out for {ingredient}")
-            except ElementNotInteractableException:
-                logging.error(f'Yasar Halim: {ingredient} was not interactable')
-            except ValueError as e:
-                logging.error(f'Yasar Halim: check value for {ingredient}; {e}')
-
-
-def update_waitrose_price(*ingredients):
-    with webdriver.Chrome() as driver:    ## headless mode not working
-        url = "https://www.waitrose.com/"
-        driver.get(url)
-        wait = WebDriverWait(driver, 10)
 
+class YasarHalimSession(ShopSession):
+    shop = "yasar halim"
+    label = "Yasar Halim"
+    url = "https://www.yasarhalim.com/"
+
+    def fetch_product_page(self, ingredient):
+        # This function searches for the ingredient on the Yasir Halim webpage and returns its product page
+
+        # search for the ingredient on yasir halim search bar
+        search_bar = self.wait.until(
+            EC.presence_of_element_located((By.ID, "small-searchterms"))
+                                )
+        search_bar.send_keys(ingredient)
+        search_bar.send_keys(Keys.ENTER)
+
+        # locate the html script for the ingredient's webpage
+        self.find_product_link(ingredient).click()
+        return self.driver.page_source
+
+    parse_page = staticmethod(parse_yasar_halim_product)
+
+
+class WaitroseSession(ShopSession):
+    shop = "waitrose"
+    label = "Waitrose"
+    url = "https://www.waitrose.com/"
+
+    def open(self):
+        super().open()
+        self.accepted_cookies = False
+
+    def fetch_product_page(self, ingredient):
+        # This function searches for the ingredient on the Waitrose webpage and returns its product page
+        # NOTE: the product page selectors still need checking against the live site, so the session isn't in
+        # SHOP_SESSIONS yet
+
+        wait = self.wait
+        if not self.accepted_cookies:
+            # if the T&C popup appears click accept
+            accept = wait.until(
+                EC.presence_of_element_located((By.XPATH, '//span[text()="Allow all"]'))
+            )
+            accept.click()
+            self.accepted_cookies = True
+
+        # search for the ingredient in the searchbar
+        search_bar = wait.until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, 'input[placeholder="Search groceries..."]'))
+        )
+        search_bar.send_keys(ingredient)
+        search_bar.send_keys(Keys.ENTER)
+
+        self.find_product_link(ingredient).click()
+        wait.until(EC.presence_of_element_located((By.ID, "productName")))
+        return self.driver.page_source
+
+    @staticmethod
+    def parse_page(soup, ingredient):
+        # This function reads the price and unit off a Waitrose product page
+
+        name = soup.find(id="productName")
+        name = name.get_text().strip() if name is not None else ""
+
+        # the price is published as itemprop="price" metadata on the product page
+        price_cell = soup.find(attrs={"itemprop": "price"})
+        if price_cell is None:
+            raise ValueError(f"no price found for {ingredient} ({name}), check waitrose webpage")
+        price = parse_price(price_cell.get("content") or price_cell.get_text())
+        return normalise_product_name(name, price, "waitrose")
+
+
+class NeedsBrowser(Exception):
+    # the fetched html isn't the rendered page (e.g. it is built with javascript, or a bot check was served instead)
+    pass
+
+
+class PageSession(ShopSession):
+    # A shop session that fetches the shop's html with a fetcher instead of clicking through it in a browser
+    # By default an HttpFetcher, reusing pooled connections, which is enough for shops that render their pages on the
+    # server; subclasses implement fetch_page(ingredient), raising NeedsBrowser if a page turns out to need
+    # javascript, in which case that ingredient's page is fetched by the shop's browser session (fallback) instead
+
+    fallback = None     ## the ShopSession class used when the plain html isn't enough
+
+    def __init__(self, url=None, timeout=10, cache=page_cache, fetcher=None):
+        super().__init__(url, timeout, cache)
+        self.fetcher = fetcher or HttpFetcher(timeout)
+        self.browser = None
+        self._page_url = None
+
+    def open(self):
+        self.fetcher.open()
+
+    def close(self):
+        self.fetcher.close()
+        if self.browser is not None:
+            self.browser.close()
+            self.browser = None
+
+    def fetch(self, path, **params):
+        # This function returns the html of a page on the shop's website (path can be relative to its url)
+        self._page_url = urljoin(self.url, path)
+        return self.fetcher.get(self._page_url, params or None)
+
+    def page_url(self):
+        return self._page_url
+
+    def fetch_product_page(self, ingredient):
+        try:
+            return self.fetch_page(ingredient)
+        except NeedsBrowser:
+            if self.fallback is None:
+                raise
+            if self.browser is None:
+                self.browser = self.fallback(self.url, self.timeout, cache=None)
+                self.browser.open()
+            html = self.browser.fetch_product_page(ingredient)
+            self._page_url = self.browser.page_url()
+            return html
+
+    def fetch_page(self, ingredient):
+        raise NotImplementedError
+
+
+class YasarHalimPageSession(PageSession):
+    shop = "yasar halim"
+    label = "Yasar Halim"
+    url = "https://www.yasarhalim.com/"
+    fallback = YasarHalimSession
+
+    def fetch_page(self, ingredient):
+        # This function searches for the ingredient on the Yasar Halim website over http and returns its product page
+
+        # the search bar submits to /search?q=..., so the results page can be asked for directly
+        # (so far only checked against the stand-in server in benchmarks.py; if the live site answers differently the
+        # page fails the checks below and the browser session takes over)
+        results = BeautifulSoup(self.fetch("search", q=ingredient), "html.parser")
+        if results.find(id="small-searchterms") is None:
+            raise NeedsBrowser(f"search page for {ingredient} was not served as html")
+
+        # follow the link to the ingredient's own page
+        link = next((a for a in results.find_all("a", href=True) if ingredient.title() in a.get_text()), None)
+        if link is None:
+            raise NoSuchElementException(f"no link to {ingredient} in the search results")
+        html = self.fetch(link["href"])
+        if 'product-price' not in html:
+            raise NeedsBrowser(f"product page for {ingredient} has no price in its html")
+        return html
+
+    parse_page = staticmethod(parse_yasar_halim_product)
+
+
+def log_scrape_error(label, ingredient, error):
+    # This function logs why an ingredient could not be updated, in the same words for every shop
+    if isinstance(error, NoSuchElementException):
+        logging.error(f"{label}: {ingredient} not found on webpage")
+    elif isinstance(error, TimeoutException):
+        logging.error(f"{label}: timed out for {ingredient}")
+    elif isinstance(error, ElementNotInteractableException):
+        logging.error(f'{label}: {ingredient} was not interactable')
+    elif isinstance(error, ValueError):
+        logging.error(f'{label}: check value for {ingredient}; {error}')
+    else:
+        logging.error(f'{label}: failed for {ingredient}; {error!r}')
+
+
+def update_shop_prices(session, ingredients, sink=None):
+    # This function scrapes every ingredient, one after the other, in a single browser session
+
+    sink = sink or PriceUpdateSink()
+    with sink, session:
         for ingredient in ingredients:
             try:
-                # if the T&C popup appears click accept
-                accept = wait.until(
-                    EC.presence_of_element_located((By.XPATH, '//span[text()="Allow all"]'))
-                )
-                accept.click()
-                print("1")
-                # search for the ingredient in the searchbar
-                wait.until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, 'input.input___XVnxR[placeholder="Search groceries..."]'))
-                )
-                search_bar = driver.find_element((By.CSS_SELECTOR, 'input.input___XVnxR[placeholder="Search groceries...]'))
-                search_bar.send_keys(ingredient)
-                search_bar.send_keys(Keys.ENTER)
-                print("2")
-                # navigate to the correct ingredient webpage
-                ingredient_page_link = wait.until(
-                    EC.presence_of_element_located((By.LINK_TEXT, f"//a[contains(text(), '{ingredient.title()}')]"))
-                )
-                ingredient_page_link.click()
-
-                name = wait.until(
-                    EC.presence_of_element_located((By.ID, "productName"))
-                                  )
-                print(name.text)
-
-
-            except:
-                ...
-
-
-def update_all_prices():
-    # This function updates all prices and units in the CSV file
-    df = pd.read_csv("price_list.csv")
-    aldi_ingredients = []
-    yasar_halim_ingredients = []
-    today_date = datetime.now().date().strftime("%d/%m")
-
-    # iterate through the csv and if an ingredient has not been updated today, divide ingredients by their shop
-    for index, row in df.iterrows():
-        ingredient = row['ingredient']
-
-        if row['shop'] == "aldi" and not row['last_update'] == today_date:
-            aldi_ingredients.append(ingredient)
-        elif row['shop'] == "yasar halim":
-            yasar_halim_ingredients.append(ingredient)
-        else:
-            continue
+                # validate the ingredient and queue it to be written back to the csv with today's date
+                sink.push(session.scrape(ingredient))
+                print(f"{ingredient} updated!")
 
-    # run separate threads for each web browser
-    aldi_thread = multiprocessing.Process(target=update_aldi_price, args=(*aldi_ingredients,))
-    yasar_halim_thread = multiprocessing.Process(target=update_yasar_halim_price, args=(*yasar_halim_ingredients,))
+            # if any exceptions crop up, log which ingredients could not be updated and why
+            except (NoSuchElementException, TimeoutException, ElementNotInteractableException, ValueError,
+                    NeedsBrowser, FetchError, HTTPError) as error:
+                log_scrape_error(session.label, ingredient, error)
 
-    aldi_thread.start()
-    yasar_halim_thread.start()
 
-    aldi_thread.join()
-    yasar_halim_thread.join()
+def update_aldi_price(*ingredients, sink=None):
+    # This function searches for the ingredients on the Aldi webpage and updates their current price
+    update_shop_prices(AldiSession(), ingredients, sink)
 
 
-def validate_csv_database():
-    df = pd.read_csv("price_list.csv")
-    for index, row in df.iterrows():
-        name = row['ingredient']
-        price = row['price']
-        unit = row['unit']
-        shop = row['shop']
-        last_update = row['last_update']
+def update_yasar_halim_price(*ingredients, sink=None):
+    # This function searches for the ingredients on the Yasir Halim webpage and updates their current price
+    update_shop_prices(YasarHalimPageSession(), ingredients, sink)
 
-        try:
-            Ingredient(name=name, price=price, unit=unit, shop=shop, last_update=last_update)
-            print("All values are valid!")
-        except ValueError:
-            logging.error(f'Validation Error: "{name}" not valid, check CSV file')
 
+def update_waitrose_price(*ingredients, sink=None):
+    # This function searches for the ingredients on the Waitrose webpage and updates their current price
+    update_shop_prices(WaitroseSession(), ingredients, sink)
 
-if __name__ == '__main__':
-    df = pd.read_csv("price_list.csv")
-    aldi_ingredients = []
-    today_date = datetime.now().date().strftime("%d/%m")
 
-    for index, row in df.iterrows():
-        ingredient = row['ingredient']
+# the session used for each shop we can scrape, plain http where the shop's pages allow it, a browser otherwise
+# Waitrose is left off until WaitroseSession's selectors have been checked against real product pages, its prices can
+# still be updated by hand with update_waitrose_price
+SHOP_SESSIONS = {
+    "aldi": AldiSession,
+    "yasar halim": YasarHalimPageSession,
+}
+
+
+def update_all_prices(policies=None, events=None, max_age_days=None):
+    # This function updates the prices and units in the CSV file that are out of date
+    # policies is an optional {shop: ShopPolicy} dict setting each shop's browser pool size and rate limit,
+    # events (see event_calculator.load_events) are upcoming events whose ingredients are refreshed first,
+    # and max_age_days overrides how many days each shop's prices are trusted for, see refresh_planner.py
+    from scraper_scheduler import ScrapeScheduler     ## imported here as the scheduler builds on this module
+
+    # only ingredients past their shop's max age are scraped, each once
+    planner = RefreshPlanner(max_age_days)
+    ingredients_by_shop = planner.plan(events, shops=SHOP_SESSIONS)
+    if not ingredients_by_shop:
+        print("All prices are up to date!")
+        return {}
+
+    # a cached page older than its shop's max age would only give a stale price again, so it is fetched afresh
+    # (with --max-age 0 every page is)
+    cache_max_ages = {shop: planner.max_age_days.get(shop, planner.default_max_age_days) * 24 * 60 * 60
+                      for shop in ingredients_by_shop}
+
+    # every shop is scraped at the same time, each by its own pool of sessions
+    return ScrapeScheduler(policies, cache_max_ages=cache_max_ages).run(ingredients_by_shop)
 
-        if row['shop'] == "aldi" and not row['last_update'] == today_date:
-            aldi_ingredients.append(ingredient)
-        for ingredient in aldi_ingredients:
-            update_aldi_price(ingredient)
\ No newline at end of file
+
+def replay_cached_pages(shops=None, apply=False, cache=page_cache, sink=None):
+    # This function re-runs the current parsers over every cached product page, with no browser or network
+    # It returns a table of what each page parses to now (error is set where the parser fails), so a parser fix can
+    # be checked against the whole catalog; with apply=True the results are also written to the price list, except
+    # where the price list already holds a newer price than the cached page
+
+    rows = []
+    for entry in cache.entries(shops):
+        session_class = SHOP_SESSIONS.get(entry['shop'])
+        html = cache.read(entry) if session_class is not None else None
+        if html is None:
+            continue
+        row = {'ingredient': entry['ingredient'], 'shop': entry['shop'], 'price': None, 'unit': None,
+               'fetched': datetime.fromtimestamp(entry['fetched_at']).date(), 'error': None}
+        try:
+            price, unit = session_class.parse_page(BeautifulSoup(html, "html.parser"), entry['ingredient'])
+            record = session_class(cache=None).record(entry['ingredient'], price, unit, when=row['fetched'])
+            row['price'], row['unit'] = record.price, record.unit
+        except Exception as error:
+            row['error'] = f"{type(error).__name__}: {error}"
+        rows.append(row)
+
+    results = pd.DataFrame(rows, columns=['ingredient', 'shop', 'price', 'unit', 'fetched', 'error'])
+    if apply:
+        current = price_catalog.table['last_update']
+        parsed = results[results['error'].isna() & results['ingredient'].isin(current.index)]
+        page_ages = ingredient_ages([fetched.strftime("%d/%m") for fetched in parsed['fetched']])
+        list_ages = ingredient_ages(current.reindex(parsed['ingredient']).to_numpy())
+        sink = sink or PriceUpdateSink()
+        with sink:
+            for row in parsed[page_ages <= list_ages].itertuples():
+                sink.push(Ingredient(name=row.ingredient, price=row.price, unit=row.unit, shop=row.shop,
+                                     last_update=row.fetched))
+    return results
+
+
+def validate_csv_database(catalog=price_catalog):
+    # This function checks every row of the price list against its schema (see price_schema.py) at once, logs each
+    # bad row and returns the report
+    report = catalog.validation
+    for row in report.errors.itertuples(index=False):
+        logging.error(f'Validation Error: "{row.ingredient}" {row.column} {row.value!r} {row.problem}, check CSV file')
+    print(report.summary())
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Scrape the shops for any out of date prices")
+    parser.add_argument('--events', help="events file (see event_calculator.py), whose ingredients are updated first")
+    parser.add_argument('--max-age', type=int,
+                        help="re-scrape every shop's prices older than this many days (0 re-scrapes them all)")
+    parser.add_argument('--replay', action='store_true', help="re-run the parsers over the cached product pages instead")
+    parser.add_argument('--apply', action='store_true', help="with --replay, write the re-parsed prices to the price list")
+    parser.add_argument('--validate', action='store_true', help="only check every row of the price list")
+    args = parser.parse_args()
+
+    if args.validate:
+        validate_csv_database()
+    elif args.replay:
+        results = replay_cached_pages(apply=args.apply)
+        failed = results[results['error'].notna()]
+        print(results.to_string(index=False))
+        print(f"{len(results) - len(failed)}/{len(results)} cached pages parsed")
+    else:
+        events = load_events(args.events) if args.events else None
+        max_age_days = dict.fromkeys(SHOP_SESSIONS, args.max_age) if args.max_age is not None else None
+        update_all_prices(events=events, max_age_days=max_age_days)